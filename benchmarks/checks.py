@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - check benchmark, measuring TcpCheck, SslCheck and HttpCheck against local servers.
+
+For every check type the same number of connections is made once by chksrv and once
+by a baseline of raw blocking sockets, run by a thread pool, both with the same concurrency. Reported
+are the throughput, the CPU time per check and the memory allocated per in-flight
+check, along with the overhead of chksrv over the baseline.
+
+Usage:
+    checks.py [options] [CHECK]...
+
+Options:
+    -h --help             Show this screen.
+    -n --count N          Number of checks per measurement [default: 500].
+    -c --concurrency N    Maximum of concurrently running checks [default: 32].
+    --repeat N            Number of measurements, of which the median is reported [default: 3].
+    --delay MS            Delay of the HTTP responses in milliseconds [default: 0].
+    --body-size BYTES     Size of the HTTP response bodies [default: 1024].
+    --json FILE           Stores the report as JSON.
+    --compare FILE        Compares the results with a previous JSON report.
+    --tolerance PCT       Maximum regression of throughput and CPU time per check in percent [default: 10].
+
+CHECK is one of tcp, ssl or http, all are run by default.
+"""
+
+import typing
+
+import os
+import sys
+import ssl
+import json
+import socket
+import time
+import asyncio
+import logging
+import platform
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from docopt import docopt
+
+from servers import HOST, Servers, generate_ca
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chksrv.runner import Runner  # noqa: E402
+from chksrv import checks  # noqa: E402
+
+
+CHECKS = ('tcp', 'ssl', 'http')
+
+# the loopback servers only listen on IPv4, so no IPv6 attempt is made first
+OPTIONS = {'ipv6': False, 'timeout': 10}
+
+# delay of the HTTP responses while measuring the memory, so all checks are in flight at once
+MEMORY_DELAY_MS = 200
+
+
+def build_check(kind: str, ports: typing.Dict[str, int], ca: str, query: str = '') -> checks.BaseCheck:
+    if kind == 'tcp':
+        return checks.TcpCheck(HOST, ports['tcp'], options=OPTIONS)
+    elif kind == 'ssl':
+        return checks.SslCheck(HOST, ports['ssl'], options={**OPTIONS, 'ssl.ca': ca, 'ssl.verify_mode': 'CERT_REQUIRED'})
+    else:
+        return checks.HttpCheck(f"http://{HOST}:{ports['http']}/{query}", options=OPTIONS)
+
+
+async def run_check(kind: str, ports: typing.Dict[str, int], ca: str, query: str = '') -> bool:
+    runner = Runner(build_check(kind, ports, ca, query), [], {})
+    await runner.run_async()
+    return runner.success is True
+
+
+def baseline_round_trip(kind: str, ports: typing.Dict[str, int], context: ssl.SSLContext, query: str = '') -> bool:
+    """The same exchange as the check, using a raw blocking socket."""
+
+    with socket.create_connection((HOST, ports[kind]), timeout=OPTIONS['timeout']) as sock:
+        if kind == 'ssl':
+            # the handshake is done by wrap_socket()
+            with context.wrap_socket(sock, server_hostname=HOST):
+                return True
+
+        if kind == 'http':
+            sock.sendall(f"GET /{query} HTTP/1.1\r\nHost: {HOST}:{ports['http']}\r\nConnection: close\r\n\r\n".encode('ascii'))
+            with sock.makefile('rb') as fh:
+                status = fh.readline()
+                length = 0
+                while True:
+                    line = fh.readline()
+                    if line in (b'\r\n', b''):
+                        break
+                    name, _, value = line.partition(b':')
+                    if name.strip().lower() == b'content-length':
+                        length = int(value)
+                if len(fh.read(length)) < length:
+                    return False
+            return status.split()[1] == b'200'
+
+        return True
+
+
+async def run_baseline(kind: str, ports: typing.Dict[str, int], context: ssl.SSLContext, executor: ThreadPoolExecutor,
+                       query: str = '') -> bool:
+    return await asyncio.get_running_loop().run_in_executor(executor, baseline_round_trip, kind, ports, context, query)
+
+
+async def measure(factory: typing.Callable[[], typing.Awaitable[bool]], count: int, concurrency: int) -> typing.Dict[str, float]:
+    """Runs `count` coroutines of `factory`, at most `concurrency` at the same time."""
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one():
+        async with semaphore:
+            try:
+                return await factory()
+            except (OSError, ssl.SSLError, asyncio.IncompleteReadError):
+                return False
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    results = await asyncio.gather(*(run_one() for _ in range(count)))
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    return {
+        'throughput': count / wall,
+        'cpu_per_check': cpu / count,
+        'failures': results.count(False),
+    }
+
+
+async def measure_memory(factory: typing.Callable[[], typing.Awaitable[bool]], concurrency: int) -> float:
+    """Returns the peak of memory allocated while `concurrency` coroutines of `factory` run at once, per coroutine."""
+
+    # a first round fills the caches, which would otherwise be accounted to the first checks
+    await asyncio.gather(*(factory() for _ in range(concurrency)))
+
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        await asyncio.gather(*(factory() for _ in range(concurrency)))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return (peak - base) / concurrency
+
+
+def median_of(measurements: typing.List[typing.Dict[str, float]]) -> typing.Dict[str, float]:
+    return {key: statistics.median(m[key] for m in measurements) for key in measurements[0]}
+
+
+async def benchmark(kind: str, ports: typing.Dict[str, int], ca: str, count: int, concurrency: int,
+                    repeat: int) -> typing.Dict[str, typing.Any]:
+    context = ssl.create_default_context(cafile=ca)
+    context.check_hostname = False
+    memory_query = f'?delay={MEMORY_DELAY_MS}' if kind == 'http' else ''
+
+    # one thread per concurrently running baseline exchange
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    factories = {
+        'chksrv': lambda query='': run_check(kind, ports, ca, query),
+        'baseline': lambda query='': run_baseline(kind, ports, context, executor, query),
+    }
+
+    try:
+        # the runs of chksrv and the baseline alternate, so drifts of the machine affect both
+        result = {name: [] for name in factories}
+        for _ in range(repeat):
+            for name, factory in factories.items():
+                result[name].append(await measure(factory, count, concurrency))
+
+        for name, factory in factories.items():
+            result[name] = median_of(result[name])
+            result[name]['memory_per_check'] = await measure_memory(lambda: factory(memory_query), concurrency)
+    finally:
+        executor.shutdown()
+
+    result['overhead'] = {
+        'cpu_per_check': result['chksrv']['cpu_per_check'] - result['baseline']['cpu_per_check'],
+        'memory_per_check': result['chksrv']['memory_per_check'] - result['baseline']['memory_per_check'],
+    }
+    return result
+
+
+def get_environment() -> typing.Dict[str, typing.Any]:
+    from chksrv.cli import get_version
+
+    try:
+        commit = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        'version': get_version(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'openssl': ssl.OPENSSL_VERSION,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def compare(report: typing.Dict[str, typing.Any], previous: typing.Dict[str, typing.Any], tolerance: float) -> bool:
+    """Prints the changes against a previous report, returns False if a regression exceeds the tolerance."""
+
+    success = True
+    print(f"compared with {previous['environment'].get('commit') or previous['environment'].get('version')}:")
+    if previous.get('config') != report['config']:
+        print(f"  warning: the reports were measured with different settings {previous.get('config')}")
+    for kind, result in report['results'].items():
+        if kind not in previous['results']:
+            continue
+
+        old = previous['results'][kind]['chksrv']
+        new = result['chksrv']
+        throughput = new['throughput'] / old['throughput'] - 1
+        cpu = new['cpu_per_check'] / old['cpu_per_check'] - 1
+        memory = new['memory_per_check'] - old['memory_per_check']
+        regression = throughput < -tolerance or cpu > tolerance
+        success = success and not regression
+        print(f"  {kind:5} throughput {throughput:+7.1%}  cpu/check {cpu:+7.1%}  memory/check {memory / 1024:+8.1f} KiB"
+              f"{'  REGRESSION' if regression else ''}")
+
+    return success
+
+
+def run(args: typing.Dict[str, typing.Any]) -> int:
+    kinds = args['CHECK'] or list(CHECKS)
+    unknown = set(kinds) - set(CHECKS)
+    if unknown:
+        print(f"Unknown check type {', '.join(sorted(unknown))}, possible values: {', '.join(CHECKS)}", file=sys.stderr)
+        return 2
+
+    count = int(args['--count'])
+    concurrency = int(args['--concurrency'])
+    repeat = max(1, int(args['--repeat']))
+    delay = float(args['--delay']) / 1000
+    body_size = int(args['--body-size'])
+
+    # errors of single checks are counted as failures, not logged
+    logging.basicConfig(level=logging.CRITICAL)
+
+    report = {
+        'environment': get_environment(),
+        'config': {'count': count, 'concurrency': concurrency, 'repeat': repeat, 'delay': delay, 'body_size': body_size},
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix='chksrv-bench-') as directory:
+        tls = generate_ca(directory) if 'ssl' in kinds else None
+        with Servers(tls, delay=delay, body_size=body_size) as servers:
+            for kind in kinds:
+                result = asyncio.run(benchmark(kind, servers.ports, tls and tls['ca'], count, concurrency, repeat))
+                report['results'][kind] = result
+
+                print(f"{kind}:")
+                for name in ('chksrv', 'baseline'):
+                    r = result[name]
+                    print(f"  {name:9} {r['throughput']:9.1f} checks/s  {r['cpu_per_check'] * 1e6:8.1f} µs cpu/check  "
+                          f"{r['memory_per_check'] / 1024:8.1f} KiB/check  {r['failures']:.0f} failures")
+                print(f"  overhead  {result['overhead']['cpu_per_check'] * 1e6:8.1f} µs cpu/check  "
+                      f"{result['overhead']['memory_per_check'] / 1024:8.1f} KiB/check")
+
+    if args['--json']:
+        with open(args['--json'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+
+    if args['--compare']:
+        with open(args['--compare'], 'r') as fh:
+            previous = json.load(fh)
+        if not compare(report, previous, float(args['--tolerance']) / 100):
+            print("FAILED: performance regressed beyond the tolerance")
+            return 1
+
+    failures = sum(result[name]['failures'] for result in report['results'].values() for name in ('chksrv', 'baseline'))
+    if failures:
+        print(f"FAILED: {failures:.0f} checks failed")
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run(docopt(__doc__)))
@@ -0,0 +1,196 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - local stand-in servers for the benchmarks.
+
+The servers run in a separate process on the loopback interface, so their CPU time
+is not accounted to the benchmarked checks:
+
+- a TCP listener closing every connection once the client closed it
+- a TLS server with a certificate of a self-signed CA generated by the openssl CLI
+- an HTTP/1.1 server with keep-alive, whose responses are delayed by the query
+  parameter `delay` (milliseconds) and have a body of `size` bytes
+"""
+
+import typing
+
+import os
+import ssl
+import asyncio
+import subprocess
+import multiprocessing
+from urllib.parse import urlsplit, parse_qs
+
+
+HOST = '127.0.0.1'
+
+
+def generate_ca(directory: str) -> typing.Dict[str, str]:
+    """Generates a CA and a server certificate for localhost and 127.0.0.1 in `directory`.
+
+    Returns the paths of the CA certificate, the server certificate and its key.
+    """
+
+    paths = {name: os.path.join(directory, name) for name in ('ca.pem', 'ca.key', 'server.pem', 'server.key', 'server.csr', 'server.ext')}
+    with open(paths['server.ext'], 'w') as fh:
+        fh.write(
+            "subjectAltName = DNS:localhost, IP:127.0.0.1\n"
+            "basicConstraints = CA:FALSE\n"
+            "keyUsage = digitalSignature, keyEncipherment\n"
+            "extendedKeyUsage = serverAuth\n"
+        )
+
+    key_args = ['-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:prime256v1', '-nodes']
+    commands = (
+        ['openssl', 'req', '-x509', *key_args, '-keyout', paths['ca.key'], '-out', paths['ca.pem'], '-days', '1',
+         '-subj', '/CN=chksrv benchmark CA',
+         '-addext', 'basicConstraints=critical,CA:TRUE', '-addext', 'keyUsage=critical,keyCertSign,cRLSign'],
+        ['openssl', 'req', *key_args, '-keyout', paths['server.key'], '-out', paths['server.csr'], '-subj', '/CN=localhost'],
+        ['openssl', 'x509', '-req', '-in', paths['server.csr'], '-CA', paths['ca.pem'], '-CAkey', paths['ca.key'],
+         '-CAcreateserial', '-out', paths['server.pem'], '-days', '1', '-extfile', paths['server.ext']],
+    )
+    for command in commands:
+        try:
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            raise RuntimeError("The TLS benchmark requires the openssl command line tool") from None
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"openssl failed: {e.stderr.decode(errors='replace').strip()}") from None
+
+    return {'ca': paths['ca.pem'], 'cert': paths['server.pem'], 'key': paths['server.key']}
+
+
+async def _drain_and_close(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while await reader.read(65536):
+            pass
+    except (OSError, ssl.SSLError):
+        pass
+    finally:
+        writer.close()
+
+
+class HttpHandler(object):
+    """Answers every request with a delayed response of the requested body size."""
+
+    def __init__(self, delay: float = 0, body_size: int = 1024):
+        self.delay = delay
+        self.body_size = body_size
+
+    async def __call__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                method, target, version = line.decode('latin-1').split(' ', 2)
+                keep_alive = version.strip() == 'HTTP/1.1'
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    name, value = name.strip().lower(), value.strip().lower()
+                    if name == 'connection':
+                        keep_alive = value == 'keep-alive' or (keep_alive and value != 'close')
+                    elif name == 'content-length':
+                        length = int(value)
+                if length:
+                    await reader.readexactly(length)
+
+                query = parse_qs(urlsplit(target).query)
+                delay = float(query.get('delay', [self.delay * 1000])[0]) / 1000
+                size = int(query.get('size', [self.body_size])[0])
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                writer.write((
+                    f"HTTP/1.1 200 OK\r\n"
+                    f"Content-Type: application/octet-stream\r\n"
+                    f"Content-Length: {size}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                ).encode('ascii'))
+                if method.upper() != 'HEAD':
+                    writer.write(b'x' * size)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _serve(conn, tls: typing.Optional[typing.Dict[str, str]], delay: float, body_size: int):
+    servers = [
+        await asyncio.start_server(_drain_and_close, HOST, 0, backlog=4096),
+        await asyncio.start_server(HttpHandler(delay, body_size), HOST, 0, backlog=4096),
+    ]
+    if tls:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(tls['cert'], tls['key'])
+        servers.append(await asyncio.start_server(_drain_and_close, HOST, 0, ssl=context, backlog=4096))
+
+    ports = [server.sockets[0].getsockname()[1] for server in servers]
+    conn.send(dict(zip(('tcp', 'http', 'ssl'), ports)))
+
+    # runs until the parent closes its end of the pipe
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, conn.recv_bytes)
+
+
+def _run(conn, tls, delay, body_size):
+    try:
+        asyncio.run(_serve(conn, tls, delay, body_size))
+    except EOFError:
+        pass
+
+
+class Servers(object):
+    """Runs the stand-in servers in a child process, as context manager.
+
+    `ports` maps tcp, ssl and http to the port of the respective server.
+    """
+
+    def __init__(self, tls: typing.Optional[typing.Dict[str, str]] = None, delay: float = 0, body_size: int = 1024):
+        self.tls = tls
+        self.delay = delay
+        self.body_size = body_size
+        self.ports = {}
+        self._conn = None
+        self._process = None
+
+    def __enter__(self) -> 'Servers':
+        self._conn, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_run, args=(child, self.tls, self.delay, self.body_size), daemon=True)
+        self._process.start()
+        child.close()
+
+        if not self._conn.poll(30):
+            self.__exit__(None, None, None)
+            raise RuntimeError("The benchmark servers did not start")
+        self.ports = self._conn.recv()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._conn.close()
+        self._process.join(5)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - start up benchmark, measuring the import time of a one-shot check.
+
+Runs `chksrv tcp` against a local listening socket with `python -X importtime`
+and fails if the median import time exceeds the budget.
+
+Usage:
+    startup.py [options]
+
+Options:
+    -h --help           Show this screen.
+    -n --runs N         Number of runs [default: 20].
+    --budget MS         Maximum median import time in milliseconds [default: 80].
+    --top N             Number of the slowest imports to report [default: 10].
+    --json FILE         Stores the report as JSON.
+"""
+
+import typing
+
+import os
+import sys
+import json
+import time
+import socket
+import statistics
+import subprocess
+
+from docopt import docopt
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(output: str) -> typing.List[typing.Tuple[str, int, int, int]]:
+    """Returns (module, nesting level, self µs, cumulative µs) of every `-X importtime` line."""
+
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        level = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        imports.append((name.strip(), level, int(self_us), int(cumulative_us)))
+
+    return imports
+
+
+def run_once(port: int) -> typing.Dict[str, typing.Any]:
+    cmd = [sys.executable, '-X', 'importtime', '-m', 'chksrv', 'tcp', '-q', '-r', '0', '127.0.0.1', str(port)]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT, os.environ.get('PYTHONPATH')))))
+
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    wall = time.perf_counter() - start
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"chksrv tcp failed with exit code {proc.returncode}")
+
+    imports = parse_importtime(proc.stderr)
+    return {
+        'wall': wall,
+        'import': sum(cumulative for _, level, _, cumulative in imports if level == 0) / 1e6,
+        'imports': imports,
+    }
+
+
+def run(args: typing.Dict[str, typing.Any]) -> int:
+    runs = int(args['--runs'])
+    budget = float(args['--budget']) / 1000
+    top = int(args['--top'])
+
+    # the check only needs the connection to be accepted by the kernel
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1024)
+
+    try:
+        results = [run_once(server.getsockname()[1]) for _ in range(runs)]
+    finally:
+        server.close()
+
+    import_times = [result['import'] for result in results]
+    median = statistics.median(import_times)
+    typical = min(results, key=lambda result: abs(result['import'] - median))
+
+    report = {
+        'runs': runs,
+        'budget': budget,
+        'import.median': median,
+        'import.min': min(import_times),
+        'import.max': max(import_times),
+        'wall.median': statistics.median(result['wall'] for result in results),
+        'modules': len(typical['imports']),
+        'slowest': [
+            {'module': name, 'self': self_us / 1e6, 'cumulative': cumulative_us / 1e6}
+            for name, _, self_us, cumulative_us in sorted(typical['imports'], key=lambda i: i[2], reverse=True)[:top]
+        ],
+        'success': median <= budget,
+    }
+
+    print(f"import time:  median {median * 1000:.1f} ms, min {report['import.min'] * 1000:.1f} ms, "
+          f"max {report['import.max'] * 1000:.1f} ms ({report['modules']} modules)")
+    print(f"wall time:    median {report['wall.median'] * 1000:.1f} ms")
+    print(f"budget:       {budget * 1000:.1f} ms")
+    print("slowest imports (self time):")
+    for entry in report['slowest']:
+        print(f"  {entry['self'] * 1000:7.2f} ms  {entry['cumulative'] * 1000:7.2f} ms  {entry['module']}")
+
+    if args['--json']:
+        with open(args['--json'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+
+    if not report['success']:
+        print(f"FAILED: median import time exceeds the budget by {(median - budget) * 1000:.1f} ms")
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run(docopt(__doc__)))
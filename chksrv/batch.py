@@ -0,0 +1,74 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - batch runner executing many checks concurrently.
+"""
+
+import typing
+import logging
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from chksrv.runner import Runner
+from chksrv import exceptions
+
+
+class BatchRunner(object):
+
+    log = logging.getLogger('BATCH')
+
+    def __init__(self, runners: typing.List[typing.Tuple[str, Runner]], concurrency: int = 32):
+        self.runners = runners
+        self.concurrency = max(1, int(concurrency))
+        self.success = False
+
+    def run(self, callback: typing.Callable[[str, Runner], None] = None):
+        """Runs all checks, with at most `concurrency` checks in flight at the same time.
+
+        `callback(name, runner)` is called from the calling thread as soon as a check completed.
+        """
+        return asyncio.run(self.run_async(callback))
+
+    async def run_async(self, callback: typing.Callable[[str, Runner], None] = None):
+        """Runs all checks on the running event loop. See run()."""
+
+        self.log.info(f"Run {len(self.runners)} checks with concurrency {self.concurrency}")
+
+        # checks without a native asyncio implementation are run in the default executor
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=min(self.concurrency, len(self.runners)) or 1))
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [self._run_one(semaphore, name, runner) for name, runner in self.runners]
+        for future in asyncio.as_completed(tasks):
+            name, runner = await future
+            if callback:
+                callback(name, runner)
+
+        self.success = all(runner.success is True for _, runner in self.runners)
+        self.log.info(f"Batch {'succeeded' if self.success else 'failed'}")
+        return self.success
+
+    async def _run_one(self, semaphore: asyncio.Semaphore, name: str, runner: Runner):
+        async with semaphore:
+            try:
+                await runner.run_async()
+            except (Exception, exceptions.ChksrvBaseException):
+                runner.success = False
+                self.log.exception(f"Error while running check {name}")
+
+        return name, runner
@@ -17,11 +17,47 @@
 chksrv - check-service a tool to probe and check the health of services.
 
 Package of available chekcs
+
+The check modules are imported on first use of their check classes, so a check
+does not pay for importing the libraries of all others (e.g. ssl, http.client).
 """
 
+import importlib
+
+from .base import BaseCheck, CheckHook, start_timer, stop_timer
+
+
+# check type -> (module, check class)
+REGISTRY = {
+    'tcp': ('.ip', 'TcpCheck'),
+    'udp': ('.ip', 'UdpCheck'),
+    'ping': ('.ip', 'IcmpPingCheck'),
+    'ssl': ('.ssl', 'SslCheck'),
+    'http': ('.http', 'HttpCheck'),
+    'dns': ('.dns', 'DnsCheck'),
+}
+_MODULES = {class_name: module for module, class_name in REGISTRY.values()}
+
+__all__ = ['BaseCheck', 'CheckHook', 'start_timer', 'stop_timer', 'get_check_class'] + sorted(_MODULES)
+
+
+def get_check_class(chk_type: str) -> type:
+    """Returns the check class of a check type, importing its module."""
+    try:
+        _, class_name = REGISTRY[chk_type]
+    except KeyError:
+        raise ValueError(f"Unknown check type {chk_type}") from None
+    return __getattr__(class_name)
+
+
+def __getattr__(name: str):
+    if name not in _MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    cls = getattr(importlib.import_module(_MODULES[name], __name__), name)
+    globals()[name] = cls
+    return cls
+
 
-from .base import BaseCheck, start_timer, stop_timer
-from .ip import TcpCheck, IcmpPingCheck
-from .dns import DnsCheck
-from .ssl import SslCheck
-from .http import HttpCheck
+def __dir__():
+    return __all__
@@ -20,18 +20,45 @@ chksrv - Base Check Module.
 import typing
 import logging
 
+import contextlib
+import errno
 import time
 
 from chksrv.config import OptionDict
+from chksrv.results import LazyResults
+
+
+PHASES = ('resolve', 'connect', 'tls', 'request_sent', 'first_byte', 'headers', 'body_done')
 
 
 def start_timer():
-    return time.perf_counter(), time.process_time()
+    return time.perf_counter_ns(), time.process_time_ns()
 
 
 def stop_timer(time_perf, time_proc):
-    end_perf, end_proc = time.perf_counter(), time.process_time()
-    return end_perf - time_perf, end_proc - time_proc
+    # the integer nanosecond clocks do not lose precision on hosts with a long uptime
+    end_perf, end_proc = time.perf_counter_ns(), time.process_time_ns()
+    return (end_perf - time_perf) / 1e9, (end_proc - time_proc) / 1e9
+
+
+class CheckHook(object):
+    """Receives the events of all running checks, see BaseCheck.add_hook().
+
+    Timestamps are perf_counter_ns() values. The hooks are called from the thread running
+    the check, which is a thread of the executor for checks without asyncio implementation.
+    """
+
+    def phase_start(self, check: 'BaseCheck', phase: str, start: int):
+        """A phase started, only called for phases enclosed by BaseCheck.phase()."""
+
+    def phase_end(self, check: 'BaseCheck', phase: str, start: int, end: int):
+        """A phase ended, called for every phase recorded by the check."""
+
+    def attempt(self, check: 'BaseCheck', attempt: int, start: int, end: int, success: bool):
+        """An attempt of the runner to run the check ended, counting from 0."""
+
+    def error(self, check: 'BaseCheck', error: typing.Union[BaseException, str], timestamp: int):
+        """The check encountered an error."""
 
 
 class BaseCheck(object):
@@ -39,11 +66,105 @@ class BaseCheck(object):
 
     log = logging.getLogger('BASE')
     default_options = {}
+    hooks = ()  # CheckHook instances receiving the events of all checks
+
+    @staticmethod
+    def add_hook(hook: CheckHook):
+        # the hooks are replaced as a whole, so running checks iterate over a consistent tuple
+        BaseCheck.hooks = BaseCheck.hooks + (hook,)
+
+    @staticmethod
+    def remove_hook(hook: CheckHook):
+        BaseCheck.hooks = tuple(h for h in BaseCheck.hooks if h is not hook)
 
     def __init__(self, options: typing.Dict[str, typing.Any] = {}):
         self.options = OptionDict(defaults=self.default_options)
         self.options.update(options)
-        self.results = {}  # dict containing all observations from the check
+        self.results = LazyResults()  # dict containing all observations from the check
+        self.wanted_keys = None  # result keys needed by the runner, None if all are needed
+        self.timing_origin = None  # perf_counter_ns() of the check start, phase offsets are relative to it
+        self.deadline = None  # time.monotonic() by which the check has to be finished, set by the runner
+        self.parent = None  # check running this check as part of it, e.g. HttpCheck for its connection
+
+    def reset(self):
+        """Discards the results of a previous run, so the check can be run again."""
+        self.results = LazyResults()
+        self.timing_origin = None
+
+    def wants(self, key: str) -> bool:
+        """Returns whether the result `key`, or any key below it, is needed.
+
+        Checks skip work during the run, which only serves results nobody wants.
+        """
+        if self.wanted_keys is None:
+            return True
+
+        return any(wanted == key or wanted.startswith(key + '.') or key.startswith(wanted + '.') for wanted in self.wanted_keys)
+
+    def get_timeout(self) -> typing.Optional[float]:
+        """Returns the timeout for the next blocking operation.
+
+        This is the `timeout` option, capped by the time left until the deadline.
+        Raises TimeoutError if the deadline already passed.
+        """
+        try:
+            timeout = float(self.options['timeout'])
+        except KeyError:
+            timeout = None
+
+        if self.deadline is None:
+            return timeout
+
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(errno.ETIMEDOUT, "Deadline of the check exceeded")
+
+        return min(timeout, remaining) if timeout is not None else remaining
+
+    def get_timing_origin(self) -> int:
+        if self.timing_origin is None:
+            self.timing_origin = time.perf_counter_ns()
+        return self.timing_origin
+
+    def record_phase(self, phase: str, start: int, end: typing.Optional[int] = None):
+        """Records a phase between two perf_counter_ns() values.
+
+        Stores the duration as `timing.<phase>.ns` and the start of the phase relative
+        to the check start as `timing.<phase>.offset.ns`. If a phase happens more than
+        once, e.g. when connecting is retried, the durations are summed up.
+        """
+        end = end if end is not None else time.perf_counter_ns()
+        origin = self.get_timing_origin()
+
+        self.results[f'timing.{phase}.ns'] = self.results.get(f'timing.{phase}.ns', 0) + end - start
+        self.results.setdefault(f'timing.{phase}.offset.ns', start - origin)
+
+        if self.hooks:
+            self.emit('phase_end', phase, start, end)
+
+    @contextlib.contextmanager
+    def phase(self, phase: str):
+        """Context manager recording the enclosed block as phase, even if it fails."""
+        self.get_timing_origin()
+        start = time.perf_counter_ns()
+        if self.hooks:
+            self.emit('phase_start', phase, start)
+        try:
+            yield
+        finally:
+            self.record_phase(phase, start)
+
+    def emit(self, event: str, *args):
+        """Calls the method `event` of all hooks.
+
+        Callers check `self.hooks` first, so events cost nothing while no hook is registered.
+        """
+        for hook in self.hooks:
+            getattr(hook, event)(self, *args)
+
+    def trace_error(self, error: typing.Union[BaseException, str]):
+        if self.hooks:
+            self.emit('error', error, time.perf_counter_ns())
 
     def run(self):
         """Runs the check, gather information and terminates the connection.
@@ -59,3 +180,23 @@ class BaseCheck(object):
     def close_connection(self, connection):
         """Closes a connection made by this check class."""
         raise NotImplementedError()
+
+    async def run_async(self):
+        """Asynchronous counterpart of run().
+
+        Checks without a native asyncio implementation run the blocking
+        check in the default executor of the running event loop.
+        """
+        # asyncio is imported lazily, it is a large part of the start up time of a single check
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.run)
+
+    async def get_connection_async(self):
+        """Asynchronous counterpart of get_connection()."""
+        raise NotImplementedError()
+
+    async def close_connection_async(self, connection):
+        """Asynchronous counterpart of close_connection()."""
+        raise NotImplementedError()
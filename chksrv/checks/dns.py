@@ -19,9 +19,406 @@ chksrv - DNS Check Module.
 
 
 import typing
+import logging
 
-from . import BaseCheck
+import time
+import random
+import socket
+import struct
 
+from .base import BaseCheck, start_timer, stop_timer
 
-class DnsCheck(BaseCheck):
+
+RECORD_TYPES = {
+    'A': 1,
+    'NS': 2,
+    'CNAME': 5,
+    'SOA': 6,
+    'PTR': 12,
+    'MX': 15,
+    'TXT': 16,
+    'AAAA': 28,
+    'SRV': 33,
+    'OPT': 41,
+    'CAA': 257,
+    'ANY': 255,
+}
+RECORD_NAMES = {value: key for key, value in RECORD_TYPES.items()}
+
+RCODE_NAMES = {
+    0: 'NOERROR',
+    1: 'FORMERR',
+    2: 'SERVFAIL',
+    3: 'NXDOMAIN',
+    4: 'NOTIMP',
+    5: 'REFUSED',
+    6: 'YXDOMAIN',
+    7: 'YXRRSET',
+    8: 'NXRRSET',
+    9: 'NOTAUTH',
+    10: 'NOTZONE',
+}
+
+CLASS_IN = 1
+FLAG_QR = 0x8000
+FLAG_AA = 0x0400
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+
+HEADER = struct.Struct('!HHHHHH')
+
+
+class DnsFormatError(ValueError):
     pass
+
+
+def get_system_nameserver(path: str = '/etc/resolv.conf') -> str:
+    """Returns the first nameserver configured in resolv.conf or localhost."""
+
+    try:
+        with open(path, 'r') as fh:
+            for line in fh:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == 'nameserver':
+                    return fields[1]
+    except OSError:
+        pass
+
+    return '127.0.0.1'
+
+
+def encode_name(name: str) -> bytes:
+    name = name.rstrip('.')
+    if not name:
+        return b'\x00'
+
+    labels = name.encode('idna').split(b'.')
+    if any(not label or len(label) > 63 for label in labels):
+        raise ValueError(f"Invalid domain name: {name}")
+
+    return b''.join(bytes((len(label),)) + label for label in labels) + b'\x00'
+
+
+def encode_query(query_id: int, name: str, qtype: int, recursion_desired: bool = True, edns_payload: int = 0) -> bytes:
+    flags = FLAG_RD if recursion_desired else 0
+    message = HEADER.pack(query_id, flags, 1, 0, 0, 1 if edns_payload else 0)
+    message += encode_name(name) + struct.pack('!HH', qtype, CLASS_IN)
+
+    if edns_payload:
+        # OPT pseudo record announcing the UDP payload size we are able to receive
+        message += b'\x00' + struct.pack('!HHIH', RECORD_TYPES['OPT'], edns_payload, 0, 0)
+
+    return message
+
+
+def decode_name(message: bytes, offset: int) -> typing.Tuple[str, int]:
+    """Decodes a (possibly compressed) domain name, returns the name and the offset after it."""
+
+    labels = []
+    end = None
+    jumps = 0
+
+    while True:
+        if offset >= len(message):
+            raise DnsFormatError("Name exceeds message")
+
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            if offset + 1 >= len(message):
+                raise DnsFormatError("Truncated compression pointer")
+            if end is None:
+                end = offset + 2
+            jumps += 1
+            if jumps > 127:
+                raise DnsFormatError("Compression pointer loop")
+            offset = ((length & 0x3F) << 8) | message[offset + 1]
+        elif length == 0:
+            offset += 1
+            break
+        else:
+            labels.append(message[offset + 1:offset + 1 + length].decode('ascii', errors='backslashreplace'))
+            offset += 1 + length
+
+    return '.'.join(labels) + '.', end if end is not None else offset
+
+
+def decode_rdata(message: bytes, rtype: int, offset: int, length: int) -> str:
+    rdata = message[offset:offset + length]
+
+    if rtype == RECORD_TYPES['A'] and length == 4:
+        return socket.inet_ntop(socket.AF_INET, rdata)
+    elif rtype == RECORD_TYPES['AAAA'] and length == 16:
+        return socket.inet_ntop(socket.AF_INET6, rdata)
+    elif rtype in (RECORD_TYPES['NS'], RECORD_TYPES['CNAME'], RECORD_TYPES['PTR']):
+        return decode_name(message, offset)[0]
+    elif rtype == RECORD_TYPES['MX']:
+        preference, = struct.unpack_from('!H', message, offset)
+        return f"{preference} {decode_name(message, offset + 2)[0]}"
+    elif rtype == RECORD_TYPES['SRV']:
+        priority, weight, port = struct.unpack_from('!HHH', message, offset)
+        return f"{priority} {weight} {port} {decode_name(message, offset + 6)[0]}"
+    elif rtype == RECORD_TYPES['SOA']:
+        mname, pos = decode_name(message, offset)
+        rname, pos = decode_name(message, pos)
+        serial, refresh, retry, expire, minimum = struct.unpack_from('!IIIII', message, pos)
+        return f"{mname} {rname} {serial} {refresh} {retry} {expire} {minimum}"
+    elif rtype == RECORD_TYPES['TXT']:
+        strings, pos = [], 0
+        while pos < length:
+            strings.append(rdata[pos + 1:pos + 1 + rdata[pos]].decode('utf-8', errors='backslashreplace'))
+            pos += 1 + rdata[pos]
+        return ''.join(strings)
+    else:
+        return rdata.hex()
+
+
+def decode_response(message: bytes) -> typing.Dict[str, typing.Any]:
+    if len(message) < HEADER.size:
+        raise DnsFormatError("Message shorter than DNS header")
+
+    query_id, flags, qdcount, ancount, nscount, arcount = HEADER.unpack_from(message)
+    offset = HEADER.size
+
+    questions = []
+    for _ in range(qdcount):
+        name, offset = decode_name(message, offset)
+        qtype, qclass = struct.unpack_from('!HH', message, offset)
+        offset += 4
+        questions.append((name, qtype))
+
+    answers = []
+    try:
+        for _ in range(ancount):
+            name, offset = decode_name(message, offset)
+            rtype, rclass, ttl, length = struct.unpack_from('!HHIH', message, offset)
+            offset += 10
+            if offset + length > len(message):
+                raise DnsFormatError("Record exceeds message")
+            answers.append({
+                'name': name,
+                'type': RECORD_NAMES.get(rtype, str(rtype)),
+                'ttl': ttl,
+                'data': decode_rdata(message, rtype, offset, length),
+            })
+            offset += length
+
+    except (DnsFormatError, struct.error):
+        # truncated responses may end within a record
+        if not flags & FLAG_TC:
+            raise
+
+    return {
+        'id': query_id,
+        'response': bool(flags & FLAG_QR),
+        'authoritative': bool(flags & FLAG_AA),
+        'truncated': bool(flags & FLAG_TC),
+        'rcode': RCODE_NAMES.get(flags & 0x000F, str(flags & 0x000F)),
+        'questions': questions,
+        'answers': answers,
+    }
+
+
+class DnsCheck(BaseCheck):
+
+    log = logging.getLogger('DNS')
+    default_options = {
+        'timeout': 10,
+        'dns.server': None,
+        'dns.port': 53,
+        'dns.type': 'A',
+        'dns.tcp': False,
+        'dns.recursion_desired': True,
+        'dns.edns.payload': 1232,
+    }
+
+    def __init__(self, domain: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.domain = domain
+
+    def run(self):
+        con = self.get_connection()
+        self.close_connection(con)
+
+        self.results['success'] = self.results['dns.success'] is True
+
+    def get_connection(self):
+        server = self.options['dns.server'] or get_system_nameserver()
+        port = int(self.options['dns.port'])
+        try:
+            qtypes = self._get_query_types()
+            encode_name(self.domain)
+        except ValueError as e:
+            self.log.error(f"Invalid DNS query: {e}", exc_info=False)
+            self.results['dns.success'] = False
+            return None
+
+        try:
+            family, _, _, _, address = socket.getaddrinfo(server, port, type=socket.SOCK_DGRAM)[0]
+        except OSError as e:
+            self.log.error(f"Cannot resolve DNS server {server}: {e.strerror}", exc_info=False)
+            self.results['dns.success'] = False
+            return None
+
+        self.results['dns.server'] = f"{address[0]}:{address[1]}"
+        queries = {}
+        for qtype in qtypes:
+            query_id = random.getrandbits(16)
+            while query_id in queries:
+                query_id = random.getrandbits(16)
+            queries[query_id] = qtype
+
+        timer = start_timer()
+
+        responses = {}
+        if not self.options['dns.tcp']:
+            responses = self._query_udp(family, address, queries)
+
+        for query_id, qtype in queries.items():
+            response = responses.get(query_id)
+            if response is not None and response['truncated']:
+                self.log.info(f"Response for {qtype} truncated, retry using TCP")
+                responses[query_id] = self._query_tcp(family, address, query_id, qtype)
+            elif self.options['dns.tcp']:
+                responses[query_id] = self._query_tcp(family, address, query_id, qtype)
+
+        self.results['dns.query.time.perf'], self.results['dns.query.time.process'] = stop_timer(*timer)
+
+        for query_id, qtype in queries.items():
+            self._update_results(qtype, responses.get(query_id))
+
+        first = qtypes[0].lower()
+        self.results['dns.rcode'] = self.results[f'dns.{first}.rcode']
+        self.results['dns.answers'] = self.results[f'dns.{first}.answers']
+        self.results['dns.ttls'] = self.results[f'dns.{first}.ttls']
+        self.results['dns.success'] = all(responses.get(query_id) is not None for query_id in queries)
+
+        return None
+
+    def close_connection(self, con):
+        # the sockets are closed after every query
+        pass
+
+    def _get_query_types(self) -> typing.List[str]:
+        qtypes = []
+        for qtype in str(self.options['dns.type']).upper().split(','):
+            qtype = qtype.strip()
+            if qtype not in RECORD_TYPES:
+                raise ValueError(f"Unknown DNS record type: {qtype}")
+            if qtype not in qtypes:
+                qtypes.append(qtype)
+
+        return qtypes
+
+    def _encode_query(self, query_id: int, qtype: str, edns: bool = True) -> bytes:
+        return encode_query(
+            query_id,
+            self.domain,
+            RECORD_TYPES[qtype],
+            recursion_desired=bool(self.options['dns.recursion_desired']),
+            edns_payload=int(self.options['dns.edns.payload'] or 0) if edns else 0,
+        )
+
+    def _query_udp(self, family, address, queries: typing.Dict[int, str]) -> typing.Dict[int, typing.Dict[str, typing.Any]]:
+        """Sends all queries on one UDP socket and collects the responses by query id."""
+
+        responses = {}
+        start_times = {}
+
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            try:
+                deadline = time.perf_counter() + self.get_timeout()
+                sock.connect(address)
+                for query_id, qtype in queries.items():
+                    self.log.info(f"Send {qtype} query for {self.domain} to {address[0]} using UDP")
+                    sock.send(self._encode_query(query_id, qtype))
+                    start_times[query_id] = time.perf_counter()
+
+                while len(responses) < len(queries):
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        raise socket.timeout()
+                    sock.settimeout(remaining)
+
+                    message = sock.recv(65535)
+                    try:
+                        response = decode_response(message)
+                    except (DnsFormatError, struct.error, IndexError):
+                        self.log.warning("Ignore malformed DNS response")
+                        continue
+
+                    query_id = response['id']
+                    if query_id not in queries or query_id in responses or not response['response']:
+                        self.log.warning(f"Ignore unexpected DNS response {query_id}")
+                        continue
+
+                    response['time'] = time.perf_counter() - start_times[query_id]
+                    response['tcp'] = False
+                    responses[query_id] = response
+
+            except socket.timeout:
+                self.log.error(f"Timeout while waiting for {len(queries) - len(responses)} UDP responses")
+            except OSError as e:
+                self.log.error(f"Error while querying {address[0]} using UDP: {e.strerror}", exc_info=False)
+
+        return responses
+
+    def _query_tcp(self, family, address, query_id: int, qtype: str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        query = self._encode_query(query_id, qtype, edns=False)
+
+        try:
+            with socket.socket(family, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.get_timeout())
+                self.log.info(f"Send {qtype} query for {self.domain} to {address[0]} using TCP")
+
+                start = time.perf_counter()
+                sock.connect(address)
+                sock.sendall(struct.pack('!H', len(query)) + query)
+
+                length, = struct.unpack('!H', self._recv_exactly(sock, 2))
+                response = decode_response(self._recv_exactly(sock, length))
+                response['time'] = time.perf_counter() - start
+                response['tcp'] = True
+
+            if response['id'] != query_id:
+                self.log.error(f"Received response {response['id']} for query {query_id}")
+                return None
+
+            return response
+
+        except (OSError, DnsFormatError, struct.error, IndexError) as e:
+            self.log.error(f"Error while querying {address[0]} using TCP: {e!r}", exc_info=False)
+            return None
+
+    def _recv_exactly(self, sock: socket.socket, length: int) -> bytes:
+        data = b''
+        while len(data) < length:
+            chunk = sock.recv(length - len(data))
+            if not chunk:
+                raise ConnectionError("Connection closed by DNS server")
+            data += chunk
+
+        return data
+
+    def _update_results(self, qtype: str, response: typing.Optional[typing.Dict[str, typing.Any]]):
+        prefix = f'dns.{qtype.lower()}'
+
+        if response is None:
+            for key in ('rcode', 'authoritative', 'truncated', 'tcp', 'time.perf'):
+                self.results[f'{prefix}.{key}'] = None
+            self.results[f'{prefix}.answers'] = []
+            self.results[f'{prefix}.ttls'] = []
+            self.results[f'{prefix}.records'] = []
+            return
+
+        matching = [record for record in response['answers'] if record['type'] == qtype or qtype == 'ANY']
+
+        self.results[f'{prefix}.rcode'] = response['rcode']
+        self.results[f'{prefix}.authoritative'] = response['authoritative']
+        self.results[f'{prefix}.truncated'] = response['truncated']
+        self.results[f'{prefix}.tcp'] = response['tcp']
+        self.results[f'{prefix}.time.perf'] = response['time']
+        self.results[f'{prefix}.answers'] = [record['data'] for record in matching]
+        self.results[f'{prefix}.ttls'] = [record['ttl'] for record in matching]
+        self.results[f'{prefix}.records'] = response['answers']
+
+        self.log.debug(f"{qtype} response {response['rcode']}: {self.results[f'{prefix}.answers']}")
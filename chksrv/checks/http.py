@@ -20,21 +20,48 @@ chksrv - HTTP/HTTPS Check Module.
 import typing
 import logging
 
-import socket
+import io
+import re
+import time
+import hashlib
+import asyncio
+import select
+import threading
+from collections import deque
 from urllib.parse import urlparse
-from http.client import HTTPConnection, HTTPResponse, HTTPException
+from http.client import HTTPConnection, HTTPResponse, HTTPException, BadStatusLine, RemoteDisconnected, parse_headers
 
-from . import BaseCheck, TcpCheck, SslCheck, start_timer, stop_timer
+from chksrv.results import LazyResults
+from .base import BaseCheck, start_timer, stop_timer
+from .ip import TcpCheck
+from .ssl import SslCheck, CONTEXT_OPTIONS
 
 
 DEFAULT_PORT_HTTP = 80
 DEFAULT_PORT_HTTPS = 443
 
 
+class TimedHTTPResponse(HTTPResponse):
+    """HTTPResponse remembering when the status line was received."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.first_byte_ns = None
+
+    def _read_status(self):
+        status = super()._read_status()
+        if self.first_byte_ns is None:
+            self.first_byte_ns = time.perf_counter_ns()
+        return status
+
+
 class HttpSocketConnection(HTTPConnection):
 
+    response_class = TimedHTTPResponse
+
     def __init__(self, sock, blocksize=8192):
-        super().__init__(None, blocksize=blocksize)
+        # newer Python versions validate the host, even though it is not used
+        super().__init__('', blocksize=blocksize)
 
         self.sock = sock
 
@@ -49,6 +76,254 @@ class HttpSocketConnection(HTTPConnection):
         pass
 
 
+class ConnectionPool(object):
+    """Idle keep-alive connections, pooled per origin.
+
+    Connections are handed out newest first, together with the results stored along
+    with them. Connections idle for longer than the idle timeout, or for which
+    `is_stale(con)` is true, are discarded on the way.
+    """
+
+    def __init__(self):
+        self._idle = {}  # origin -> deque of (time returned, connection, results)
+        self._lock = threading.Lock()
+
+    def get(self, key, idle_timeout: float, is_stale: typing.Callable, discard: typing.Callable) -> typing.Optional[tuple]:
+        """Returns an idle connection and its results as tuple, None if there is none."""
+
+        now = time.monotonic()
+
+        while True:
+            with self._lock:
+                connections = self._idle.get(key)
+                if not connections:
+                    return None
+                returned, con, results = connections.pop()
+
+            if now - returned > idle_timeout or is_stale(con):
+                discard(con)
+                continue
+
+            return con, results
+
+    def put(self, key, con, max_size: int, discard: typing.Callable, results: typing.Optional[LazyResults] = None):
+        with self._lock:
+            connections = self._idle.setdefault(key, deque())
+            connections.append((time.monotonic(), con, results))
+            overflow = [connections.popleft()[1] for _ in range(len(connections) - max(0, max_size))]
+
+        for con in overflow:
+            discard(con)
+
+
+http_pool = ConnectionPool()
+
+
+class BodyProcessor(object):
+    """Consumes a response body chunk by chunk with bounded memory.
+
+    At most `max_bytes` are read (and stored if `store` is set). The body is hashed, if
+    `digest` is set, and matched against the optional `contains` string and `regex` while it is streamed.
+    Once all patterns matched, no further data is requested.
+    """
+
+    def __init__(self, max_bytes: typing.Optional[int] = None, store: bool = True, digest: bool = True,
+                 contains: typing.Optional[str] = None, regex: typing.Optional[str] = None, window: int = 65536):
+        self.max_bytes = max_bytes
+        self.store = store
+        self.digest = hashlib.sha256() if digest else None
+        self.length = 0
+        self.body = bytearray()
+        self.complete = False  # the whole body was read
+        self.exceeded = False  # the body is larger than max_bytes
+
+        self._contains = contains.encode('utf-8') if contains is not None else None
+        self._regex = re.compile(regex.encode('utf-8')) if regex is not None else None
+        self._contains_found = self._contains is None
+        self._regex_found = self._regex is None
+        self._window = max(int(window), len(self._contains or b''))
+        self._tail = b''
+
+    @property
+    def matches(self) -> typing.Optional[bool]:
+        if self._contains is None and self._regex is None:
+            return None
+        return self._contains_found and self._regex_found
+
+    def get_read_size(self, blocksize: int) -> int:
+        """Returns how many bytes to read next, 0 if no more data is wanted."""
+
+        if self.complete or self.exceeded or self.matches:
+            return 0
+        if self.max_bytes is None:
+            return blocksize
+
+        # request one byte beyond the limit to tell an exceeding body from one of exactly max_bytes
+        return max(0, min(blocksize, self.max_bytes + 1 - self.length))
+
+    def feed(self, chunk: bytes):
+        """Processes the next chunk, an empty chunk marks the end of the body."""
+
+        if not chunk:
+            self.complete = True
+            return
+
+        if self.max_bytes is not None and self.length + len(chunk) > self.max_bytes:
+            chunk = chunk[:self.max_bytes - self.length]
+            self.exceeded = True
+
+        self.length += len(chunk)
+        if self.digest is not None:
+            self.digest.update(chunk)
+        if self.store:
+            self.body += chunk
+
+        self._match(chunk)
+
+    def _match(self, chunk: bytes):
+        if self.matches is not False:
+            return
+
+        # keep the end of the previous chunk, so matches spanning chunk boundaries are found
+        data = self._tail + chunk
+        if not self._contains_found and self._contains in data:
+            self._contains_found = True
+        if not self._regex_found and self._regex.search(data):
+            self._regex_found = True
+
+        self._tail = data[-self._window:]
+
+
+class AsyncHttpResponse(object):
+    """HTTP/1.x response read from an asyncio stream.
+
+    Provides the subset of the HTTPResponse interface used by HttpCheck. Only the status
+    line and the headers are read up front, the body is streamed through read().
+    """
+
+    MAX_HEADERS = 100
+
+    def __init__(self, reader: asyncio.StreamReader, method: str, version: int, status: int, reason: str, headers):
+        self.version = version
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+
+        self._reader = reader
+        self._chunked = False
+        self._chunk_left = 0
+        self._remaining = None  # None reads until EOF
+        self._closed = False
+        self.first_byte_ns = None
+
+        connection = headers.get('connection', '').lower()
+        self.will_close = 'close' in connection or (version == 10 and 'keep-alive' not in connection)
+
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            self._closed = True
+        elif 'chunked' in headers.get('transfer-encoding', '').lower():
+            self._chunked = True
+        elif headers.get('content-length'):
+            self._remaining = int(headers['content-length'])
+        else:
+            self.will_close = True
+
+    def getheaders(self):
+        return list(self.headers.items())
+
+    def isclosed(self) -> bool:
+        """True once the whole body was read."""
+        return self._closed
+
+    async def read(self, amt: int) -> bytes:
+        """Reads up to `amt` bytes of the body, returns an empty bytes object at its end."""
+
+        if self._closed:
+            return b''
+
+        if self._chunked:
+            if self._chunk_left == 0:
+                self._chunk_left = int((await self._reader.readline()).split(b';', 1)[0], 16)
+                if self._chunk_left == 0:
+                    # skip trailers
+                    while (await self._reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    self._closed = True
+                    return b''
+
+            data = await self._read_some(min(amt, self._chunk_left))
+            self._chunk_left -= len(data)
+            if self._chunk_left == 0:
+                await self._reader.readline()
+            return data
+
+        elif self._remaining is not None:
+            if self._remaining == 0:
+                self._closed = True
+                return b''
+
+            data = await self._read_some(min(amt, self._remaining))
+            self._remaining -= len(data)
+            return data
+
+        data = await self._reader.read(amt)
+        if not data:
+            self._closed = True
+        return data
+
+    async def _read_some(self, amt: int) -> bytes:
+        data = await self._reader.read(amt)
+        if not data:
+            raise asyncio.IncompleteReadError(b'', amt)
+        return data
+
+    @classmethod
+    async def read_from(cls, reader: asyncio.StreamReader, method: str) -> 'AsyncHttpResponse':
+        first_byte_ns = None
+        while True:
+            version, status, reason = await cls._read_status(reader)
+            first_byte_ns = first_byte_ns or time.perf_counter_ns()
+            headers = await cls._read_headers(reader)
+            if status != 100:
+                break
+
+        resp = cls(reader, method, version, status, reason, headers)
+        resp.first_byte_ns = first_byte_ns
+        return resp
+
+    @staticmethod
+    async def _read_status(reader: asyncio.StreamReader):
+        line = (await reader.readline()).decode('iso-8859-1')
+        if not line:
+            raise RemoteDisconnected("Remote end closed connection without response")
+
+        try:
+            version, status, reason = (line.strip().split(None, 2) + [''])[:3]
+            status = int(status)
+        except ValueError:
+            raise BadStatusLine(line)
+
+        if version == 'HTTP/1.0':
+            return 10, status, reason
+        elif version.startswith('HTTP/1.'):
+            return 11, status, reason
+        else:
+            raise BadStatusLine(line)
+
+    @classmethod
+    async def _read_headers(cls, reader: asyncio.StreamReader):
+        lines = []
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            lines.append(line)
+            if len(lines) > cls.MAX_HEADERS:
+                raise HTTPException(f"got more than {cls.MAX_HEADERS} headers")
+
+        return parse_headers(io.BytesIO(b''.join(lines) + b'\r\n'))
+
+
 class HttpCheck(BaseCheck):
 
     log = logging.getLogger('HTTP')
@@ -56,8 +331,18 @@ class HttpCheck(BaseCheck):
         **SslCheck.default_options,
         'http.method': 'GET',
         'http.body': None,
+        'http.keep_alive': False,
+        'http.pool.max_size': 4,
+        'http.pool.idle_timeout': 30,
+        'http.body.max_bytes': 1048576,
+        'http.body.store': True,
+        'http.body.contains': None,
+        'http.body.regex': None,
+        'http.body.regex_window': 65536,
     }
 
+    BLOCKSIZE = 65536
+
     def __init__(self, url: str, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -67,6 +352,15 @@ class HttpCheck(BaseCheck):
             self.subtask = SslCheck(self.host, self.port, options=self.options)
         else:
             self.subtask = TcpCheck(self.host, self.port, options=self.options)
+        self.subtask.parent = self
+
+        self._response = None
+        self._con_results = None  # results of the subtask which established the connection
+
+    def reset(self):
+        super().reset()
+        self.subtask.reset()
+        self._response = None
 
     def run(self):
         con = self.get_connection()
@@ -77,10 +371,28 @@ class HttpCheck(BaseCheck):
                                     self.results.get('http.success', False) is True
 
     def get_connection(self):
+        # phases of the sub-check are relative to the start of this check
+        self.subtask.timing_origin = self.get_timing_origin()
+        self.subtask.wanted_keys = self.wanted_keys
+        self.subtask.deadline = self.deadline
+
+        if not self._check_body_options():
+            return None
+
+        con = self._get_pooled_connection()
+        if con is not None:
+            if self._send_request(con):
+                return con
+
+            self.log.info("Pooled HTTP connection failed, establish a new one")
+            con.close()
+
         self.log.info("Get connection using sub-check task")
+        self.results['http.con.reused'] = False
 
         sock = self.subtask.get_connection()
         self.results.update(self.subtask.results)
+        self._con_results = self._get_connection_results()
 
         if sock:
             self.log.info("Initiate HTTP connection using socket")
@@ -95,7 +407,132 @@ class HttpCheck(BaseCheck):
            return None
 
     def close_connection(self, con: HttpSocketConnection):
+        if con and self._is_reusable():
+            self.log.info("Return HTTP connection to the pool")
+            http_pool.put(self._get_pool_key(), con, int(self.options['http.pool.max_size']), self._discard_connection,
+                          self._con_results)
+        elif con:
+            con.close()
+
+    async def run_async(self):
+        con = await self.get_connection_async()
+        await self.close_connection_async(con)
+
+        self.results['success'] = self.results.get('tcp.success', False) is True and \
+                                    (self.results.get('ssl.success') is True or not self.use_ssl) and \
+                                    self.results.get('http.success', False) is True
+
+    async def get_connection_async(self):
+        self.subtask.timing_origin = self.get_timing_origin()
+        self.subtask.wanted_keys = self.wanted_keys
+        self.subtask.deadline = self.deadline
+
+        if not self._check_body_options():
+            return None
+
+        con = self._get_pooled_connection(asyncio.get_running_loop())
+        if con is not None:
+            if await self._send_request_async(con):
+                return con
+
+            self.log.info("Pooled HTTP connection failed, establish a new one")
+            self._discard_connection(con)
+
+        self.log.info("Get connection using sub-check task")
+        self.results['http.con.reused'] = False
+
+        con = await self.subtask.get_connection_async()
+        self.results.update(self.subtask.results)
+        self._con_results = self._get_connection_results()
+
         if con:
+            await self._send_request_async(con)
+            return con
+        else:
+            self.results['http.success'] = False
+            self.log.error("Failed to establish socket")
+            return None
+
+    async def close_connection_async(self, con: typing.Tuple[asyncio.StreamReader, asyncio.StreamWriter]):
+        if con and self._is_reusable():
+            self.log.info("Return HTTP connection to the pool")
+            http_pool.put(self._get_pool_key(asyncio.get_running_loop()), con, int(self.options['http.pool.max_size']),
+                          self._discard_connection, self._con_results)
+        elif con:
+            reader, writer = con
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    def _get_pool_key(self, loop: asyncio.AbstractEventLoop = None) -> tuple:
+        # asyncio streams are bound to their event loop
+        ssl_options = tuple(str(self.options[name]) for name in CONTEXT_OPTIONS) if self.use_ssl else ()
+        return (loop, self.use_ssl, self.host, self.port) + ssl_options
+
+    def _get_pooled_connection(self, loop: asyncio.AbstractEventLoop = None):
+        if not self.options['http.keep_alive']:
+            return None
+
+        pooled = http_pool.get(self._get_pool_key(loop), float(self.options['http.pool.idle_timeout']),
+                               self._is_stale, self._discard_connection)
+        if pooled is None:
+            return None
+
+        con, self._con_results = pooled
+        self.log.info("Reuse pooled HTTP connection")
+        # the TCP and SSL results are the ones of the check which established the connection
+        if self._con_results is not None:
+            self.results.update(self._con_results)
+        self.results['http.con.reused'] = True
+        self.results['tcp.success'] = True
+        if self.use_ssl:
+            self.results['ssl.success'] = True
+
+        return con
+
+    def _get_connection_results(self) -> LazyResults:
+        """Returns the results of the subtask describing the connection, stored with it in the pool."""
+
+        results = LazyResults()
+        results.update(self.subtask.results)
+        # the phases are recorded relative to the start of the check which established the connection
+        for key in [key for key in dict.keys(results) if key.startswith('timing.')]:
+            del results[key]
+        return results
+
+    def _is_reusable(self) -> bool:
+        return bool(self.options['http.keep_alive']) and self.results.get('http.success') is True and \
+            self._response is not None and not self._response.will_close and self._response.isclosed()
+
+    @staticmethod
+    def _is_stale(con) -> bool:
+        """Idle connections must neither have pending data nor be closed by the server."""
+
+        if isinstance(con, tuple):
+            reader, writer = con
+            return reader.at_eof() or writer.is_closing()
+
+        sock = con.sock
+        if sock is None:
+            return True
+        if hasattr(sock, 'pending') and sock.pending():
+            return True
+
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+
+        return bool(readable)
+
+    @staticmethod
+    def _discard_connection(con):
+        if isinstance(con, tuple):
+            reader, writer = con
+            writer.close()
+        else:
             con.close()
 
     def _parse_url(self, url):
@@ -112,61 +549,213 @@ class HttpCheck(BaseCheck):
 
         return use_ssl, host, port, path
 
-    def _send_request(self, con: HttpSocketConnection):
-
-        self.log.info("Prepare HTTP request")
-
+    def _get_additional_headers(self) -> typing.Dict[str, typing.Any]:
         # iterate over options beginning with http.header.
         additional_headers = {}
         for key, value in filter(lambda item: item[0].startswith('http.header.'), self.options.items()):
-            header_name = key[len('http.header.')]
+            header_name = key[len('http.header.'):]
             additional_headers[header_name] = value
             self.log.debug(f"Found additional header: {header_name}: {value}")
 
+        if self.options['http.keep_alive'] and not any(name.lower() == 'connection' for name in additional_headers):
+            additional_headers['Connection'] = 'keep-alive'
+
+        return additional_headers
+
+    def _build_request(self) -> bytes:
+        """Serializes the request the same way HTTPConnection.request() does."""
+
+        method = self.options['http.method']
+        body = self.options['http.body'] or None
+        if body is not None and not isinstance(body, bytes):
+            body = str(body).encode('iso-8859-1')
+
+        host = f'[{self.host}]' if ':' in self.host else self.host
+        default_port = DEFAULT_PORT_HTTPS if self.use_ssl else DEFAULT_PORT_HTTP
+        headers = {
+            'Host': host if self.port == default_port else f'{host}:{self.port}',
+            'Accept-Encoding': 'identity',
+        }
+        if body is not None or method.upper() in ('POST', 'PUT', 'PATCH'):
+            headers['Content-Length'] = str(len(body or b''))
+        headers.update(self._get_additional_headers())
+
+        head = f"{method} {self.url} HTTP/1.1\r\n" + ''.join(f"{key}: {value}\r\n" for key, value in headers.items())
+        return (head + '\r\n').encode('iso-8859-1') + (body or b'')
+
+    async def _send_request_async(self, con: typing.Tuple[asyncio.StreamReader, asyncio.StreamWriter]):
+        reader, writer = con
+
+        self.log.info("Prepare HTTP request")
+        request = self._build_request()
+
         try:
             self.log.info("Send HTTP request")
 
             timer = start_timer()
 
-            con.request(
-                self.options['http.method'],
-                self.url,
-                body=self.options['http.body'] or None,
-                headers=additional_headers,
-            )
+            with self.phase('request_sent'):
+                writer.write(request)
+                await asyncio.wait_for(writer.drain(), self.get_timeout())
+            sent = time.perf_counter_ns()
 
             self.results['http.con.time.perf'], self.results['http.con.time.process'] = stop_timer(*timer)
+            resp = await asyncio.wait_for(AsyncHttpResponse.read_from(reader, self.options['http.method'].upper()), self.get_timeout())
+            self.results['http.resp.time.perf'], self.results['http.resp.time.process'] = stop_timer(*timer)
+            self._record_response_phases(sent, resp)
+
+            self._response = resp
+            self._update_results(resp, True)
+
+            processor = self._create_body_processor()
+            with self.phase('body_done'):
+                while True:
+                    size = processor.get_read_size(self.BLOCKSIZE)
+                    if not size:
+                        break
+                    chunk = await asyncio.wait_for(resp.read(size), self.get_timeout())
+                    processor.feed(chunk)
+            self._update_body_results(processor)
+
+            self.log.info("HTTP request finished. Status %s %s", resp.status, resp.reason)
+
+            return con
+
+        except (HTTPException, ValueError, OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            self.results['http.success'] = False
+            self.log.error("HTTP request failed: %r", e, exc_info=False)
+            self.trace_error(e)
+            return None
+
+    def _send_request(self, con: HttpSocketConnection):
+
+        self.log.info("Prepare HTTP request")
+        additional_headers = self._get_additional_headers()
+        resp = None
+
+        try:
+            self.log.info("Send HTTP request")
+
+            timer = start_timer()
+
+            con.sock.settimeout(self.get_timeout())
+            with self.phase('request_sent'):
+                con.request(
+                    self.options['http.method'],
+                    self.url,
+                    body=self.options['http.body'] or None,
+                    headers=additional_headers,
+                )
+            sent = time.perf_counter_ns()
+
+            self.results['http.con.time.perf'], self.results['http.con.time.process'] = stop_timer(*timer)
+            sock = con.sock
+            sock.settimeout(self.get_timeout())
             resp = con.getresponse()
             self.results['http.resp.time.perf'], self.results['http.resp.time.process'] = stop_timer(*timer)
+            self._record_response_phases(sent, resp)
+
+            if self.use_ssl and self.results.get('http.con.reused') is False:
+                # TLS 1.3 session tickets are received ahead of the response
+                self.subtask.store_session(sock)
 
+            self._response = resp
             self._update_results(resp, True)
-            self.log.info(f"HTTP request finished. Status {resp.status} {resp.reason}")
+
+            processor = self._create_body_processor()
+            with self.phase('body_done'):
+                while True:
+                    size = processor.get_read_size(self.BLOCKSIZE)
+                    if not size:
+                        break
+                    if not resp.isclosed():
+                        # the socket is closed along with a response of a non keep-alive connection
+                        sock.settimeout(self.get_timeout())
+                    processor.feed(resp.read(size))
+            self._update_body_results(processor)
+
+            self.log.info("HTTP request finished. Status %s %s", resp.status, resp.reason)
 
             return con
 
-        except HTTPException as e:
-            self._update_results(resp, False)
-            self.log.error(f"HTTP request failed: {', '.join(e.args)}", exc_info=False)
+        except (HTTPException, OSError) as e:
+            if resp is not None:
+                self._update_results(resp, False)
+            else:
+                self.results['http.success'] = False
+            self.log.error("HTTP request failed: %r", e, exc_info=False)
+            self.trace_error(e)
             return None
 
+    def _record_response_phases(self, sent: int, resp: typing.Union[TimedHTTPResponse, AsyncHttpResponse]):
+        """Splits the wait for the response at its first byte into time-to-first-byte and header parsing."""
+        first_byte = resp.first_byte_ns or sent
+        self.record_phase('first_byte', sent, first_byte)
+        self.record_phase('headers', first_byte)
+
     def _update_results(self, resp: HTTPResponse, success: bool):
         self.results['http.success'] = success
         self.results['http.resp.status'] = resp.status
         self.results['http.resp.reason'] = resp.reason
         self.results['http.resp.version'] = resp.version
 
-        body = resp.read()
-        self.results['http.resp.body'] = body
-        self.results['http.resp.body_length'] = len(body)
+        headers = resp.getheaders()
+        self.results.defer_prefix('http.resp.header.', lambda: self._normalize_headers(headers))
 
-        for key, value in resp.getheaders():
+    @classmethod
+    def _normalize_headers(cls, headers: typing.List[typing.Tuple[str, str]]) -> typing.Dict[str, typing.Any]:
+        results = {}
+        for key, value in headers:
             key = 'http.resp.header.' + key.replace(' ', '_').replace('-', '_').lower()
-            if key in self.results:
+            if key in results:
                 # make it a list
-                if isinstance(self.results[key], list):
-                    self.results[key].append(value)
+                if isinstance(results[key], list):
+                    results[key].append(value)
                 else:
-                    self.results[key] = [self.results[key], value]
+                    results[key] = [results[key], value]
             else:
-                self.results[key] = value
-            self.log.debug(f"Found response header: {key}: {value}")
+                results[key] = value
+            cls.log.debug(f"Found response header: {key}: {value}")
+
+        return results
+
+    def _check_body_options(self) -> bool:
+        """Reports an invalid body pattern before anything is sent, returns False in this case."""
+
+        regex = self.options['http.body.regex']
+        try:
+            if regex is not None:
+                re.compile(str(regex).encode('utf-8'))
+        except re.error as e:
+            self.log.error(f"Invalid HTTP check parameter: http.body.regex is no valid regular expression: {e}",
+                           exc_info=False)
+            self.results['http.success'] = False
+            return False
+
+        return True
+
+    def _create_body_processor(self) -> BodyProcessor:
+        max_bytes = self.options['http.body.max_bytes']
+        contains = self.options['http.body.contains']
+        regex = self.options['http.body.regex']
+
+        return BodyProcessor(
+            # 0 disables the limit
+            max_bytes=int(max_bytes) or None if max_bytes is not None else None,
+            store=bool(self.options['http.body.store']) and self.wants('http.resp.body'),
+            digest=self.wants('http.resp.body_sha256'),
+            contains=str(contains) if contains is not None else None,
+            regex=str(regex) if regex is not None else None,
+            window=int(self.options['http.body.regex_window']),
+        )
+
+    def _update_body_results(self, processor: BodyProcessor):
+        self.results['http.resp.body'] = bytes(processor.body) if processor.store else None
+        self.results['http.resp.body_length'] = processor.length
+        self.results['http.resp.body_sha256'] = processor.digest.hexdigest() if processor.digest is not None else None
+        self.results['http.resp.body_complete'] = processor.complete
+        self.results['http.resp.body_exceeded'] = processor.exceeded
+        self.results['http.resp.body_matches'] = processor.matches
+
+        if processor.exceeded:
+            self.log.warning(f"Response body exceeds {processor.max_bytes} bytes, stopped reading")
@@ -20,9 +20,59 @@ chksrv - Internet Protocol Check Module - includes TCP, UDP, ICMP-Ping.
 import typing
 import logging
 
+import os
+import re
+import time
+import errno
+import random
+import struct
 import socket
+import selectors
 
-from . import BaseCheck, start_timer, stop_timer
+from chksrv.resolver import default_resolver
+from .base import BaseCheck, start_timer, stop_timer
+
+if typing.TYPE_CHECKING:
+    # asyncio is imported lazily by the coroutines, it is only used in annotations here
+    import asyncio
+
+
+ICMP_ECHO_REQUEST = {socket.AF_INET: 8, socket.AF_INET6: 128}
+ICMP_ECHO_REPLY = {socket.AF_INET: 0, socket.AF_INET6: 129}
+ICMP_PROTOCOL = {socket.AF_INET: socket.IPPROTO_ICMP, socket.AF_INET6: socket.IPPROTO_ICMPV6}
+ICMP_HEADER = struct.Struct('!BBHHH')  # type, code, checksum, identifier, sequence
+
+
+def icmp_checksum(data: bytes) -> int:
+    """Internet checksum (RFC 1071) of an ICMP message."""
+
+    if len(data) % 2:
+        data += b'\0'
+
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def get_ipv6_mode(options) -> typing.Union[bool, str]:
+    return options['ipv6'].lower() if isinstance(options['ipv6'], str) else options['ipv6']
+
+
+def select_address(infos: typing.List[tuple], ipv6: typing.Union[bool, str]) -> tuple:
+    """Picks the getaddrinfo() result to use for the connectionless checks.
+
+    IPv6 is preferred, unless the IPv6 mode is 'fallback'.
+    """
+    infos = [info for info in infos if info[0] in (socket.AF_INET, socket.AF_INET6)]
+    if not infos:
+        raise OSError(errno.EADDRNOTAVAIL, "No IPv4 or IPv6 address")
+
+    return sorted(infos, key=lambda info: (info[0] == socket.AF_INET6) == (ipv6 == 'fallback'))[0]
+
+
+def get_family(ipv6: typing.Union[bool, str]) -> int:
+    return {True: socket.AF_INET6, False: socket.AF_INET}.get(ipv6, socket.AF_UNSPEC)
 
 
 class TcpCheck(BaseCheck):
@@ -31,6 +81,9 @@ class TcpCheck(BaseCheck):
     default_options = {
         'ipv6': 'prefer',
         'timeout': 10,
+        'happy_eyeballs.delay': 0.25,
+        'resolve.cache': True,
+        'resolve.ttl': 60,
     }
 
     def __init__(self, host, port, *args, **kwargs):
@@ -55,25 +108,305 @@ class TcpCheck(BaseCheck):
 
             sock.close()
 
-    def _connect_socket(self, retry=False):
-        ipv6 = self.options['ipv6'].lower() if isinstance(self.options['ipv6'], str) else self.options['ipv6']
-        do_retry = True if ipv6 in ('prefer', 'fallback') else False
+    async def run_async(self):
+        con = await self.get_connection_async()
+        await self.close_connection_async(con)
+
+        self.results['success'] = self.results['tcp.success'] is True
+
+    async def get_connection_async(self):
+        import asyncio
+
+        sock = await self._connect_socket_async(retry=False)
+        if sock:
+            return await asyncio.open_connection(sock=sock)
+        else:
+            return None
+
+    async def close_connection_async(self, con: typing.Tuple['asyncio.StreamReader', 'asyncio.StreamWriter']):
+        if con:
+            reader, writer = con
+            timer = start_timer()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+            self.results['tcp.shutdown.time.perf'], self.results['tcp.shutdown.time.process'] = stop_timer(*timer)
+
+    def _get_ipv6_mode(self):
+        return get_ipv6_mode(self.options)
+
+    def _create_socket(self, retry: bool) -> socket.socket:
+        """Builds the TCP socket for one connection attempt. Raises OSError if this fails."""
+        ipv6 = self._get_ipv6_mode()
+
+        if ipv6 is True or (ipv6 == 'prefer' and retry is False) or (ipv6 == 'fallback' and retry is True):
+            self.log.info("Build IPv6 TCP socket")
+            sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+            self.results['tcp.ipv6'] = True
+        else:
+            self.log.info("Build IPv4 TCP socket")
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.results['tcp.ipv6'] = False
+
+        return sock
+
+    def _get_addresses(self, infos: typing.List[tuple]) -> typing.List[tuple]:
+        """Sorts getaddrinfo() results as described by RFC 8305, alternating between IPv6 and IPv4."""
+
+        ipv6 = [info for info in infos if info[0] == socket.AF_INET6]
+        ipv4 = [info for info in infos if info[0] != socket.AF_INET6]
+
+        addresses = []
+        for index in range(max(len(ipv6), len(ipv4))):
+            addresses.extend(family[index] for family in (ipv6, ipv4) if index < len(family))
+
+        return addresses
+
+    def _resolve(self, family: int = socket.AF_UNSPEC) -> typing.List[tuple]:
+        self.log.info(f"Resolve {self.host}")
+        timer = start_timer()
+
+        with self.phase('resolve'):
+            infos, cached = default_resolver.resolve(
+                self.host, self.port, family, socket.SOCK_STREAM,
+                ttl=float(self.options['resolve.ttl']),
+                use_cache=bool(self.options['resolve.cache']),
+                timeout=self.get_timeout(),
+            )
+
+        self.results['tcp.resolve.time.perf'], self.results['tcp.resolve.time.process'] = stop_timer(*timer)
+        self.results['tcp.resolve.cached'] = cached
+        return infos
+
+    async def _resolve_async(self, family: int = socket.AF_UNSPEC) -> typing.List[tuple]:
+        import asyncio
+
+        self.log.info(f"Resolve {self.host}")
+        timer = start_timer()
+
+        with self.phase('resolve'):
+            try:
+                infos, cached = await asyncio.wait_for(default_resolver.resolve_async(
+                    self.host, self.port, family, socket.SOCK_STREAM,
+                    ttl=float(self.options['resolve.ttl']),
+                    use_cache=bool(self.options['resolve.cache']),
+                ), self.get_timeout())
+            except asyncio.TimeoutError:
+                raise TimeoutError(errno.ETIMEDOUT, f"Timeout while resolving {self.host}")
+
+        self.results['tcp.resolve.time.perf'], self.results['tcp.resolve.time.process'] = stop_timer(*timer)
+        self.results['tcp.resolve.cached'] = cached
+        return infos
+
+    def _resolve_addresses(self) -> typing.List[tuple]:
+        return self._get_addresses(self._resolve())
+
+    async def _resolve_addresses_async(self) -> typing.List[tuple]:
+        return self._get_addresses(await self._resolve_async())
+
+    def _finish_attempt(self, attempt: typing.Dict[str, typing.Any], error: typing.Optional[str]):
+        attempt['time'] = time.perf_counter() - attempt['time']
+        attempt['success'] = error is None
+        attempt['error'] = error
+
+    def _finish_happy_eyeballs(self, attempts, winner, timer) -> typing.Optional[socket.socket]:
+        for attempt in attempts:
+            if 'success' not in attempt:
+                self._finish_attempt(attempt, 'cancelled')
+        self.results['tcp.con.attempts'] = attempts
+        self.record_phase('connect', timer[0])
+
+        if winner is None:
+            self.log.error("Error while connecting to %s %s: all %d attempts failed", self.host, self.port, len(attempts))
+            self.trace_error(f"all {len(attempts)} attempts failed")
+            self.results['tcp.success'] = False
+            return None
+
+        sock, attempt = winner
+        self.results['tcp.con.time.perf'], self.results['tcp.con.time.process'] = stop_timer(*timer)
+        self.results['tcp.con.address'] = attempt['address']
+        self.results['tcp.ipv6'] = attempt['ipv6']
+        self.results['tcp.success'] = True
+
+        self.log.info("Connection successfull using %s", attempt['address'])
+        return sock
+
+    def _connect_happy_eyeballs(self) -> typing.Optional[socket.socket]:
+        """Races staggered connection attempts to all addresses of the host (RFC 8305)."""
 
         try:
-            if ipv6 is True or (ipv6 == 'prefer' and retry is False) or (ipv6 == 'fallback' and retry is True):
-                self.log.info("Build IPv6 TCP socket")
-                sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
-                self.results['tcp.ipv6'] = True
-            else:
-                self.log.info("Build IPv4 TCP socket")
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.results['tcp.ipv6'] = False
+            addresses = self._resolve_addresses()
+        except OSError as e:
+            self.log.error("Cannot resolve %s: %s", self.host, e.strerror, exc_info=False)
+            self.trace_error(e)
+            self.results['tcp.success'] = False
+            return None
+
+        try:
+            timeout = self.get_timeout()
+        except TimeoutError as e:
+            self.log.error("Cannot connect to %s %s: %s", self.host, self.port, e.strerror, exc_info=False)
+            self.trace_error(e)
+            self.results['tcp.success'] = False
+            return None
+
+        delay = float(self.options['happy_eyeballs.delay'])
+        attempts = []
+        winner = None
+        selector = selectors.DefaultSelector()
+
+        timer = start_timer()
+        deadline = time.perf_counter() + timeout
+        next_attempt = 0.0
+
+        try:
+            while winner is None:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+
+                if addresses and (now >= next_attempt or not selector.get_map()):
+                    family, type_, proto, _, sockaddr = addresses.pop(0)
+                    attempt = {'address': sockaddr[0], 'ipv6': family == socket.AF_INET6, 'time': now}
+                    attempts.append(attempt)
+                    self.log.info("Try connecting to %s %s", sockaddr[0], self.port)
+
+                    try:
+                        sock = socket.socket(family, type_, proto)
+                        sock.setblocking(False)
+                        error = sock.connect_ex(sockaddr)
+                    except OSError as e:
+                        error = e.errno or errno.EINVAL
+
+                    if error in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                        selector.register(sock, selectors.EVENT_WRITE, attempt)
+                        next_attempt = now + delay
+                    else:
+                        sock.close()
+                        self._finish_attempt(attempt, os.strerror(error))
+                    continue
+
+                if not selector.get_map():
+                    # all attempts failed
+                    break
+
+                timeout = min(deadline, next_attempt) if addresses else deadline
+                for key, _ in selector.select(max(0.0, timeout - now)):
+                    sock, attempt = key.fileobj, key.data
+                    selector.unregister(sock)
+                    error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+
+                    if error == 0 and winner is None:
+                        self._finish_attempt(attempt, None)
+                        winner = sock, attempt
+                    else:
+                        sock.close()
+                        self._finish_attempt(attempt, os.strerror(error) if error else 'cancelled')
+                        # start the next attempt right away
+                        next_attempt = now
 
+        finally:
+            for key in list(selector.get_map().values()):
+                key.fileobj.close()
+            selector.close()
+
+        if winner:
+            winner[0].setblocking(True)
+            winner[0].settimeout(self.options['timeout'])
+
+        return self._finish_happy_eyeballs(attempts, winner, timer)
+
+    async def _connect_happy_eyeballs_async(self) -> typing.Optional[socket.socket]:
+        """Asynchronous counterpart of _connect_happy_eyeballs()."""
+        import asyncio
+
+        try:
+            addresses = await self._resolve_addresses_async()
+        except OSError as e:
+            self.log.error("Cannot resolve %s: %s", self.host, e.strerror, exc_info=False)
+            self.trace_error(e)
+            self.results['tcp.success'] = False
+            return None
+
+        try:
+            timeout = self.get_timeout()
+        except TimeoutError as e:
+            self.log.error("Cannot connect to %s %s: %s", self.host, self.port, e.strerror, exc_info=False)
+            self.trace_error(e)
+            self.results['tcp.success'] = False
+            return None
+
+        loop = asyncio.get_running_loop()
+        delay = float(self.options['happy_eyeballs.delay'])
+        attempts = []
+        pending = {}
+        winner = None
+
+        async def connect(sock, sockaddr):
+            await loop.sock_connect(sock, sockaddr)
+            return sock
+
+        timer = start_timer()
+        deadline = loop.time() + timeout
+
+        try:
+            while winner is None:
+                now = loop.time()
+                if now >= deadline:
+                    break
+
+                if addresses:
+                    family, type_, proto, _, sockaddr = addresses.pop(0)
+                    attempt = {'address': sockaddr[0], 'ipv6': family == socket.AF_INET6, 'time': time.perf_counter()}
+                    attempts.append(attempt)
+                    self.log.info("Try connecting to %s %s", sockaddr[0], self.port)
+
+                    try:
+                        sock = socket.socket(family, type_, proto)
+                        sock.setblocking(False)
+                    except OSError as e:
+                        self._finish_attempt(attempt, e.strerror)
+                        continue
+
+                    pending[loop.create_task(connect(sock, sockaddr))] = (sock, attempt)
+                elif not pending:
+                    # all attempts failed
+                    break
+
+                timeout = min(deadline - now, delay) if addresses else deadline - now
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    sock, attempt = pending.pop(task)
+                    if task.exception() is None and winner is None:
+                        self._finish_attempt(attempt, None)
+                        winner = sock, attempt
+                    else:
+                        sock.close()
+                        error = task.exception()
+                        self._finish_attempt(attempt, getattr(error, 'strerror', None) or 'cancelled')
+
+        finally:
+            for task, (sock, attempt) in pending.items():
+                task.cancel()
+                sock.close()
+
+        return self._finish_happy_eyeballs(attempts, winner, timer)
+
+    def _connect_socket(self, retry=False):
+        if self._get_ipv6_mode() == 'happy':
+            return self._connect_happy_eyeballs()
+
+        do_retry = True if self._get_ipv6_mode() in ('prefer', 'fallback') else False
+
+        try:
+            sock = self._create_socket(retry)
             sock.setblocking(True)
-            sock.settimeout(self.options['timeout'])
 
         except OSError as e:
-            self.log.error(f"Error creating socket: {e.strerror}", exc_info=False)
+            self.log.error("Error creating socket: %s", e.strerror, exc_info=False)
+            self.trace_error(e)
             if not retry and do_retry:
                 self.log.info("Retry socket creation", exc_info=False)
                 return self._connect_socket(retry=True)
@@ -82,11 +415,14 @@ class TcpCheck(BaseCheck):
                 return None
 
         try:
-            self.log.info(f"Try connecting to {self.host} {self.port}")
+            address = self._resolve(sock.family)[0][4]
+            sock.settimeout(self.get_timeout())
+            self.log.info("Try connecting to %s %s", self.host, self.port)
 
             time = start_timer()
 
-            sock.connect((self.host, self.port))
+            with self.phase('connect'):
+                sock.connect(address)
 
             self.results['tcp.con.time.perf'], self.results['tcp.con.time.process'] = stop_timer(*time)
             self.results['tcp.success'] = True
@@ -96,7 +432,9 @@ class TcpCheck(BaseCheck):
             return sock
 
         except OSError as e:
-            self.log.exception(f"Error while connecting to {self.host} {self.port}: {e.strerror}", exc_info=False)
+            sock.close()
+            self.log.error("Error while connecting to %s %s: %s", self.host, self.port, e.strerror, exc_info=False)
+            self.trace_error(e)
             if not retry and do_retry:
                 self.log.info("Retry socket connection", exc_info=False)
                 return self._connect_socket(retry=True)
@@ -104,6 +442,552 @@ class TcpCheck(BaseCheck):
                 self.results['tcp.success'] = False
                 return None
 
+    async def _connect_socket_async(self, retry=False):
+        import asyncio
+
+        if self._get_ipv6_mode() == 'happy':
+            return await self._connect_happy_eyeballs_async()
+
+        do_retry = True if self._get_ipv6_mode() in ('prefer', 'fallback') else False
+
+        try:
+            sock = self._create_socket(retry)
+            sock.setblocking(False)
+
+        except OSError as e:
+            self.log.error("Error creating socket: %s", e.strerror, exc_info=False)
+            self.trace_error(e)
+            if not retry and do_retry:
+                self.log.info("Retry socket creation", exc_info=False)
+                return await self._connect_socket_async(retry=True)
+            else:
+                self.results['tcp.success'] = False
+                return None
+
+        try:
+            address = (await self._resolve_async(sock.family))[0][4]
+            self.log.info("Try connecting to %s %s", self.host, self.port)
+            loop = asyncio.get_running_loop()
+
+            time = start_timer()
+
+            with self.phase('connect'):
+                await asyncio.wait_for(loop.sock_connect(sock, address), self.get_timeout())
+
+            self.results['tcp.con.time.perf'], self.results['tcp.con.time.process'] = stop_timer(*time)
+            self.results['tcp.success'] = True
+
+            self.log.info("Connection successfull")
+
+            return sock
+
+        except (OSError, asyncio.TimeoutError) as e:
+            sock.close()
+            self.log.error("Error while connecting to %s %s: %s", self.host, self.port, getattr(e, 'strerror', None) or 'timeout')
+            self.trace_error(e)
+            if not retry and do_retry:
+                self.log.info("Retry socket connection", exc_info=False)
+                return await self._connect_socket_async(retry=True)
+            else:
+                self.results['tcp.success'] = False
+                return None
+
 
 class IcmpPingCheck(BaseCheck):
-    pass
+    """Pings one or more hosts using ICMP echo requests.
+
+    The probes to all hosts are sent in bursts over one socket per address family,
+    replies are matched by their sequence number. Unprivileged ICMP datagram sockets
+    are used if the system permits them, raw sockets otherwise.
+    """
+
+    log = logging.getLogger('PING')
+    default_options = {
+        'ipv6': 'prefer',
+        'timeout': 10,
+        'ping.count': 3,
+        'ping.interval': 0.2,
+        'ping.timeout': 1,
+        'ping.size': 56,
+        'ping.raw': 'auto',
+        'resolve.cache': True,
+        'resolve.ttl': 60,
+    }
+
+    def __init__(self, hosts: typing.Union[str, typing.List[str]], *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hosts = [host.strip() for host in hosts.split(',') if host.strip()] if isinstance(hosts, str) else list(hosts)
+        if not self.hosts:
+            raise ValueError("The ping check module needs at least one host")
+
+    def run(self):
+        self.get_connection()
+
+        self.results['success'] = self.results['ping.success'] is True
+
+    def get_connection(self):
+        targets = [self._resolve_target(host) for host in self.hosts]
+
+        sockets = {}
+        for family in {target['family'] for target in targets if target['family'] is not None}:
+            try:
+                sockets[family] = self._create_socket(family)
+            except OSError as e:
+                self.log.error(f"Cannot create ICMP socket: {e.strerror}", exc_info=False)
+                for target in targets:
+                    if target['family'] == family:
+                        target['error'] = e.strerror
+
+        try:
+            timer = start_timer()
+            self._ping(sockets, [target for target in targets if target['family'] in sockets])
+            self.results['ping.time.perf'], self.results['ping.time.process'] = stop_timer(*timer)
+        finally:
+            for sock, _ in sockets.values():
+                sock.close()
+
+        self.results['ping.raw'] = any(raw for _, raw in sockets.values()) if sockets else None
+        self._update_results(targets)
+
+        return None
+
+    def close_connection(self, con):
+        # the sockets are closed right after pinging
+        pass
+
+    def _resolve_target(self, host: str) -> typing.Dict[str, typing.Any]:
+        # rtts maps the index of every answered probe to its round trip time
+        target = {'host': host, 'family': None, 'address': None, 'sent': 0, 'rtts': {}, 'error': None}
+
+        ipv6 = get_ipv6_mode(self.options)
+
+        try:
+            with self.phase('resolve'):
+                infos, _ = default_resolver.resolve(
+                    host, 0, get_family(ipv6), socket.SOCK_DGRAM,
+                    ttl=float(self.options['resolve.ttl']),
+                    use_cache=bool(self.options['resolve.cache']),
+                    timeout=self.get_timeout(),
+                )
+            info = select_address(infos, ipv6)
+        except OSError as e:
+            self.log.error(f"Cannot resolve {host}: {e.strerror}", exc_info=False)
+            target['error'] = e.strerror
+            return target
+
+        target['family'], target['address'] = info[0], info[4][0]
+        return target
+
+    def _create_socket(self, family: int) -> typing.Tuple[socket.socket, bool]:
+        """Returns a non-blocking ICMP socket and whether it is a raw socket."""
+
+        mode = self.options['ping.raw']
+        kinds = {True: [socket.SOCK_RAW], False: [socket.SOCK_DGRAM]}.get(mode, [socket.SOCK_DGRAM, socket.SOCK_RAW])
+
+        error = None
+        for kind in kinds:
+            try:
+                sock = socket.socket(family, kind, ICMP_PROTOCOL[family])
+            except OSError as e:
+                self.log.info(f"Cannot create {'raw' if kind == socket.SOCK_RAW else 'datagram'} ICMP socket: {e.strerror}")
+                error = e
+                continue
+
+            sock.setblocking(False)
+            return sock, kind == socket.SOCK_RAW
+
+        raise error
+
+    def _build_probe(self, family: int, ident: int, seq: int) -> bytes:
+        size = int(self.options['ping.size'])
+        payload = (b'chksrv' * (size // 6 + 1))[:size]
+
+        message = ICMP_HEADER.pack(ICMP_ECHO_REQUEST[family], 0, 0, ident, seq) + payload
+        if family == socket.AF_INET:
+            # the kernel computes the checksum of ICMPv6 messages
+            message = message[:2] + struct.pack('!H', icmp_checksum(message)) + message[4:]
+        return message
+
+    def _parse_reply(self, family: int, raw: bool, data: bytes) -> typing.Optional[typing.Tuple[int, int]]:
+        """Returns identifier and sequence number of an echo reply, None for any other message."""
+
+        if family == socket.AF_INET and raw:
+            # raw IPv4 sockets receive the IP header as well
+            data = data[(data[0] & 0x0f) * 4:] if data else data
+
+        if len(data) < ICMP_HEADER.size:
+            return None
+
+        type_, _, _, ident, seq = ICMP_HEADER.unpack_from(data)
+        if type_ != ICMP_ECHO_REPLY[family]:
+            return None
+
+        return ident, seq
+
+    def _ping(self, sockets: typing.Dict[int, typing.Tuple[socket.socket, bool]], targets: typing.List[typing.Dict[str, typing.Any]]):
+        count = int(self.options['ping.count'])
+        interval = float(self.options['ping.interval'])
+        probe_timeout = float(self.options['ping.timeout'])
+
+        # datagram sockets get their identifier assigned by the kernel, which filters the replies
+        ident = random.getrandbits(16)
+        seq = random.getrandbits(16)
+        pending = {}  # (family, sequence) -> (target, probe index, perf_counter_ns() when sent)
+
+        selector = selectors.DefaultSelector()
+        for family, (sock, raw) in sockets.items():
+            selector.register(sock, selectors.EVENT_READ, (family, raw))
+
+        try:
+            deadline = time.perf_counter() + self.get_timeout()
+        except TimeoutError as e:
+            self.log.error(f"Cannot ping: {e.strerror}", exc_info=False)
+            return
+
+        bursts = 0
+        next_burst = time.perf_counter()
+
+        try:
+            while True:
+                now = time.perf_counter()
+                if bursts < count and now >= next_burst and targets:
+                    for target in targets:
+                        sock, _ = sockets[target['family']]
+                        try:
+                            sock.sendto(self._build_probe(target['family'], ident, seq), (target['address'], 0))
+                        except OSError as e:
+                            self.log.warning(f"Cannot send echo request to {target['host']}: {e.strerror}")
+                            target['error'] = e.strerror
+                        else:
+                            pending[(target['family'], seq)] = (target, target['sent'], time.perf_counter_ns())
+                        target['sent'] += 1
+                        seq = (seq + 1) & 0xffff
+
+                    bursts += 1
+                    next_burst = now + interval
+
+                # probes not answered in time are lost
+                expired_ns = time.perf_counter_ns() - int(probe_timeout * 1e9)
+                for key in [key for key, (_, _, sent) in pending.items() if sent < expired_ns]:
+                    del pending[key]
+
+                if (bursts >= count or not targets) and not pending:
+                    break
+                if now >= deadline:
+                    self.log.warning(f"Deadline reached with {len(pending)} echo requests unanswered")
+                    break
+
+                wakeup = deadline
+                if bursts < count:
+                    wakeup = min(wakeup, next_burst)
+                if pending:
+                    wakeup = min(wakeup, min(sent for _, _, sent in pending.values()) / 1e9 + probe_timeout)
+
+                for key, _ in selector.select(max(0.0, wakeup - time.perf_counter())):
+                    self._receive(key.fileobj, *key.data, ident, pending, probe_timeout)
+
+        finally:
+            selector.close()
+
+    def _receive(self, sock: socket.socket, family: int, raw: bool, ident: int, pending: typing.Dict[tuple, tuple], probe_timeout: float):
+        while True:
+            try:
+                data, address = sock.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                self.log.warning(f"Error while receiving echo replies: {e.strerror}")
+                return
+
+            received = time.perf_counter_ns()
+            reply = self._parse_reply(family, raw, data)
+            if reply is None or (raw and reply[0] != ident):
+                continue
+
+            entry = pending.get((family, reply[1]))
+            if entry is None or entry[0]['address'] != address[0]:
+                continue
+
+            target, index, sent = pending.pop((family, reply[1]))
+            rtt = (received - sent) / 1e9
+            if rtt <= probe_timeout:
+                target['rtts'][index] = rtt
+
+    @staticmethod
+    def _get_jitter(rtts: typing.List[float]) -> typing.Optional[float]:
+        """Mean difference between the round trip times of consecutive replies."""
+        if len(rtts) < 2:
+            return None
+        return sum(abs(b - a) for a, b in zip(rtts, rtts[1:])) / (len(rtts) - 1)
+
+    def _update_results(self, targets: typing.List[typing.Dict[str, typing.Any]]):
+        hosts = {}
+        all_rtts = []
+        jitters = []
+
+        for target in targets:
+            # in the order the probes were sent, replies may arrive out of order
+            rtts = [target['rtts'][index] for index in sorted(target['rtts'])]
+            all_rtts.extend(rtts)
+            jitter = self._get_jitter(rtts)
+            if jitter is not None:
+                jitters.append(jitter)
+
+            hosts[target['host']] = {
+                'address': target['address'],
+                'ipv6': target['family'] == socket.AF_INET6 if target['family'] is not None else None,
+                'sent': target['sent'],
+                'received': len(rtts),
+                'loss': 1 - len(rtts) / target['sent'] if target['sent'] else 1.0,
+                'rtt_min': min(rtts) if rtts else None,
+                'rtt_avg': sum(rtts) / len(rtts) if rtts else None,
+                'rtt_max': max(rtts) if rtts else None,
+                'jitter': jitter,
+                'rtts': rtts,
+                'error': target['error'],
+            }
+
+        sent = sum(host['sent'] for host in hosts.values())
+        self.results['ping.hosts'] = hosts
+        self.results['ping.sent'] = sent
+        self.results['ping.received'] = len(all_rtts)
+        self.results['ping.loss'] = 1 - len(all_rtts) / sent if sent else 1.0
+        self.results['ping.rtt.min'] = min(all_rtts) if all_rtts else None
+        self.results['ping.rtt.avg'] = sum(all_rtts) / len(all_rtts) if all_rtts else None
+        self.results['ping.rtt.max'] = max(all_rtts) if all_rtts else None
+        self.results['ping.jitter'] = sum(jitters) / len(jitters) if jitters else None
+        self.results['ping.success'] = all(host['received'] > 0 for host in hosts.values())
+
+
+class UdpCheck(BaseCheck):
+    """Sends datagrams to a UDP service and optionally waits for its responses.
+
+    All probes are sent in one burst over a single connected socket, responses are
+    drained from it until it would block and matched to the oldest unanswered probe.
+    Probes without a response are retransmitted after `udp.timeout` seconds.
+    """
+
+    log = logging.getLogger('UDP')
+    default_options = {
+        'ipv6': 'prefer',
+        'timeout': 10,
+        'udp.payload': '',
+        'udp.payload_hex': None,
+        'udp.count': 1,
+        'udp.timeout': 1,
+        'udp.retransmits': 2,
+        'udp.response': True,
+        'udp.response.regex': None,
+        'udp.loss.max': None,
+        'resolve.cache': True,
+        'resolve.ttl': 60,
+    }
+
+    def __init__(self, host, port, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.host = host
+        self.port = int(port)
+
+    def run(self):
+        sock = self.get_connection()
+        if sock:
+            try:
+                self._exchange(sock)
+            finally:
+                self.close_connection(sock)
+
+        self.results['success'] = self.results['udp.success'] is True
+
+    def get_connection(self) -> typing.Optional[socket.socket]:
+        self.results['udp.success'] = False
+        self.results['udp.error'] = None
+        ipv6 = get_ipv6_mode(self.options)
+
+        try:
+            # invalid parameters are reported before anything is sent
+            self._get_payload()
+            self._get_pattern()
+            self._get_max_loss()
+        except ValueError as e:
+            self.log.error(f"Invalid UDP check parameter: {e}", exc_info=False)
+            self.results['udp.error'] = str(e)
+            return None
+
+        try:
+            with self.phase('resolve'):
+                infos, _ = default_resolver.resolve(
+                    self.host, self.port, get_family(ipv6), socket.SOCK_DGRAM,
+                    ttl=float(self.options['resolve.ttl']),
+                    use_cache=bool(self.options['resolve.cache']),
+                    timeout=self.get_timeout(),
+                )
+            family, _, _, _, sockaddr = select_address(infos, ipv6)
+        except OSError as e:
+            self.log.error(f"Cannot resolve {self.host}: {e.strerror}", exc_info=False)
+            self.results['udp.error'] = e.strerror
+            return None
+
+        self.results['udp.address'] = sockaddr[0]
+        self.results['udp.ipv6'] = family == socket.AF_INET6
+
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        try:
+            # a connected socket only receives datagrams from the service and reports ICMP errors
+            sock.setblocking(False)
+            sock.connect(sockaddr)
+        except OSError as e:
+            self.log.error(f"Cannot connect UDP socket to {sockaddr[0]}: {e.strerror}", exc_info=False)
+            self.results['udp.error'] = e.strerror
+            sock.close()
+            return None
+
+        return sock
+
+    def close_connection(self, sock: socket.socket):
+        if sock:
+            sock.close()
+
+    def _get_payload(self) -> bytes:
+        if self.options['udp.payload_hex'] is not None:
+            try:
+                return bytes.fromhex(str(self.options['udp.payload_hex']))
+            except ValueError as e:
+                raise ValueError(f"udp.payload_hex is no hex string: {e}") from None
+        return str(self.options['udp.payload']).encode('utf-8')
+
+    def _get_pattern(self) -> typing.Optional[typing.Pattern[bytes]]:
+        regex = self.options['udp.response.regex']
+        try:
+            return re.compile(str(regex).encode('utf-8')) if regex is not None else None
+        except re.error as e:
+            raise ValueError(f"udp.response.regex is no valid regular expression: {e}") from None
+
+    def _get_max_loss(self) -> typing.Optional[float]:
+        max_loss = self.options['udp.loss.max']
+        if max_loss is None:
+            return None
+
+        try:
+            max_loss = float(max_loss)
+        except ValueError:
+            raise ValueError(f"udp.loss.max is no number: {max_loss}") from None
+        if not 0 <= max_loss <= 1:
+            raise ValueError(f"udp.loss.max is not between 0 and 1: {max_loss}")
+        return max_loss
+
+    def _send(self, sock: socket.socket, payload: bytes, probes: typing.List[typing.Dict[str, typing.Any]]) -> typing.Optional[OSError]:
+        """Sends the payload once for every probe, returns the error which stopped sending."""
+
+        for probe in probes:
+            try:
+                sock.send(payload)
+            except OSError as e:
+                return e
+            probe['sent'] = time.perf_counter_ns()
+            probe['transmissions'] += 1
+        return None
+
+    def _exchange(self, sock: socket.socket):
+        payload = self._get_payload()
+        pattern = self._get_pattern()
+        wait_response = bool(self.options['udp.response'])
+        count = int(self.options['udp.count'])
+        probe_timeout = float(self.options['udp.timeout'])
+        retransmits = int(self.options['udp.retransmits'])
+
+        probes = [{'sent': None, 'transmissions': 0, 'rtt': None} for _ in range(count)]
+        stats = {'responses': 0, 'unmatched': 0, 'data': None}
+
+        try:
+            deadline = time.perf_counter() + self.get_timeout()
+        except TimeoutError as e:
+            self.log.error(f"Cannot send datagrams: {e.strerror}", exc_info=False)
+            self.results['udp.error'] = e.strerror
+            return
+
+        timer = start_timer()
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+        error = None
+
+        try:
+            with self.phase('request_sent'):
+                error = self._send(sock, payload, probes)
+
+            # oldest first, responses are matched in the order the probes were (re)transmitted
+            pending = [probe for probe in probes if probe['sent'] is not None] if wait_response else []
+            while pending and error is None:
+                now_ns = time.perf_counter_ns()
+                expired = [probe for probe in pending if now_ns - probe['sent'] >= probe_timeout * 1e9]
+                if expired:
+                    retry = [probe for probe in expired if probe['transmissions'] <= retransmits]
+                    pending = [probe for probe in pending if probe not in expired]
+                    error = self._send(sock, payload, retry)
+                    pending.extend(probe for probe in retry if probe['sent'] >= now_ns)
+                    continue
+
+                if time.perf_counter() >= deadline:
+                    self.log.warning(f"Deadline reached with {len(pending)} datagrams unanswered")
+                    break
+
+                wakeup = min(deadline, min(probe['sent'] for probe in pending) / 1e9 + probe_timeout)
+                if selector.select(max(0.0, wakeup - time.perf_counter())):
+                    error = self._receive(sock, pattern, pending, stats)
+        finally:
+            selector.close()
+            self.results['udp.time.perf'], self.results['udp.time.process'] = stop_timer(*timer)
+
+        if error is not None:
+            self.log.error(f"Error exchanging datagrams with {self.host}:{self.port}: {error.strerror}", exc_info=False)
+            self.results['udp.error'] = error.strerror
+
+        self._update_results(probes, stats, wait_response)
+
+    def _receive(self, sock: socket.socket, pattern: typing.Optional[typing.Pattern[bytes]],
+                 pending: typing.List[typing.Dict[str, typing.Any]], stats: typing.Dict[str, typing.Any]) -> typing.Optional[OSError]:
+        """Drains all queued responses, returns the error reported by the socket, e.g. a closed port."""
+
+        while pending:
+            try:
+                data = sock.recv(65535)
+            except (BlockingIOError, InterruptedError):
+                return None
+            except OSError as e:
+                return e
+
+            received = time.perf_counter_ns()
+            stats['responses'] += 1
+            if pattern is not None and not pattern.search(data):
+                stats['unmatched'] += 1
+                continue
+
+            probe = pending.pop(0)
+            probe['rtt'] = (received - probe['sent']) / 1e9
+            if stats['data'] is None:
+                stats['data'] = data
+
+        return None
+
+    def _update_results(self, probes: typing.List[typing.Dict[str, typing.Any]], stats: typing.Dict[str, typing.Any], wait_response: bool):
+        rtts = [probe['rtt'] for probe in probes if probe['rtt'] is not None]
+        sent = sum(probe['transmissions'] for probe in probes)
+
+        self.results['udp.sent'] = sent
+        self.results['udp.retransmits'] = sent - sum(1 for probe in probes if probe['transmissions'])
+        self.results['udp.received'] = stats['responses']
+        self.results['udp.resp.unmatched'] = stats['unmatched']
+        self.results['udp.resp.data'] = stats['data']
+        self.results['udp.rtts'] = rtts
+        self.results['udp.rtt.min'] = min(rtts) if rtts else None
+        self.results['udp.rtt.avg'] = sum(rtts) / len(rtts) if rtts else None
+        self.results['udp.rtt.max'] = max(rtts) if rtts else None
+
+        if wait_response:
+            max_loss = self._get_max_loss()
+            loss = 1 - len(rtts) / len(probes) if probes else 1.0
+            self.results['udp.loss'] = loss
+            self.results['udp.success'] = self.results['udp.error'] is None and bool(rtts) and \
+                (max_loss is None or loss <= max_loss)
+        else:
+            self.results['udp.loss'] = None
+            self.results['udp.success'] = self.results['udp.error'] is None and all(probe['transmissions'] for probe in probes)
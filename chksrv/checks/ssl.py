@@ -21,10 +21,18 @@ import typing
 import logging
 
 import os
+import time
+import asyncio
+import hashlib
+import ipaddress
 import socket
 import ssl
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
 
-from . import TcpCheck, start_timer, stop_timer
+from .base import start_timer, stop_timer
+from .ip import TcpCheck
 
 
 PROTOCOL_MAP = {
@@ -36,6 +44,235 @@ PROTOCOL_MAP = {
     'tlsv1.2': ssl.PROTOCOL_TLSv1_2 if ssl.HAS_TLSv1_2 else ssl.PROTOCOL_TLS,
 }
 
+# options the SSL context is built from, contexts are cached using the tuple of their values
+CONTEXT_OPTIONS = (
+    'ssl.use_default_context',
+    'ssl.protocol',
+    'ssl.ciphers',
+    'ssl.verify_mode',
+    'ssl.verify_flags',
+    'ssl.check_hostname',
+    'ssl.ca',
+)
+
+_context_cache = {}  # option values -> (CA modification times, SSLContext)
+_context_cache_lock = threading.Lock()
+
+# cipher string of the probes of ssl.enumerate, which also have to cover legacy protocols and ciphers
+ENUMERATE_SECLEVEL = ':@SECLEVEL=0'
+
+
+def get_ca_mtimes(ca_path: typing.Optional[str]) -> typing.Tuple[typing.Optional[int], ...]:
+    """Returns the modification times of the CA file or directory, used to invalidate cached contexts."""
+
+    if ca_path in ('__sys__', None):
+        paths = ssl.get_default_verify_paths()
+        candidates = (paths.cafile, paths.capath)
+    else:
+        candidates = (ca_path, )
+
+    mtimes = []
+    for path in candidates:
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns if path else None)
+        except OSError:
+            mtimes.append(None)
+
+    return tuple(mtimes)
+
+
+def clear_context_cache():
+    with _context_cache_lock:
+        _context_cache.clear()
+
+
+def get_tls_version(name: str) -> typing.Optional[ssl.TLSVersion]:
+    """Returns the TLSVersion of a protocol name like TLSv1.2, None if the ssl library does not support it."""
+
+    attr = name.strip().replace('.', '_')
+    if not getattr(ssl, f'HAS_{attr}', False):
+        return None
+    return getattr(ssl.TLSVersion, attr, None)
+
+
+def get_enumeration_context(minimum: ssl.TLSVersion, maximum: ssl.TLSVersion, ciphers: str) -> ssl.SSLContext:
+    """Returns the cached context of an enumeration probe, which does not verify the peer.
+
+    Raises ssl.SSLError if the ssl library supports none of the ciphers.
+    """
+
+    key = ('enumerate', minimum, maximum, ciphers)
+    with _context_cache_lock:
+        _, context = _context_cache.get(key, (None, None))
+    if context is not None:
+        return context
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    context.minimum_version = minimum
+    context.maximum_version = maximum
+    context.set_ciphers(ciphers)
+
+    with _context_cache_lock:
+        _context_cache[key] = ((), context)
+    return context
+
+
+def _dnsname_matches(pattern: str, hostname: str) -> bool:
+    pattern, hostname = pattern.lower().rstrip('.'), hostname.lower().rstrip('.')
+    if pattern == hostname:
+        return True
+
+    # only a wildcard as complete left-most label is accepted, e.g. *.example.com
+    if pattern.startswith('*.') and '*' not in pattern[2:]:
+        label, _, domain = hostname.partition('.')
+        return bool(label) and domain == pattern[2:]
+
+    return False
+
+
+def cert_matches_hostname(cert: typing.Dict[str, typing.Any], hostname: str) -> bool:
+    """Checks if a certificate as returned by getpeercert() is valid for the hostname.
+
+    Replaces ssl.match_hostname(), which is deprecated and raises instead of returning the result.
+    """
+
+    if not cert:
+        return False
+
+    try:
+        address = ipaddress.ip_address(hostname)
+    except ValueError:
+        address = None
+        try:
+            hostname = hostname.encode('idna').decode('ascii')
+        except UnicodeError:
+            pass
+
+    dns_names = []
+    for kind, value in cert.get('subjectAltName', ()):
+        if kind == 'DNS':
+            dns_names.append(value)
+        elif kind == 'IP Address' and address is not None:
+            try:
+                if ipaddress.ip_address(value.strip()) == address:
+                    return True
+            except ValueError:
+                pass
+
+    if address is not None:
+        return False
+
+    if not dns_names:
+        # the commonName is only used if there are no DNS names in the subjectAltName
+        dns_names = [value for rdn in cert.get('subject', ()) for key, value in rdn if key == 'commonName']
+
+    return any(_dnsname_matches(name, hostname) for name in dns_names)
+
+
+class CertificateInfo(object):
+    """A peer certificate, parsed once and shared by all checks seeing the same certificate."""
+
+    __slots__ = ('fingerprint', 'cert', 'not_after', '_hostnames')
+
+    def __init__(self, fingerprint: str, cert: typing.Optional[typing.Dict[str, typing.Any]]):
+        self.fingerprint = fingerprint  # SHA-256 of the DER encoded certificate
+        self.cert = cert  # as returned by getpeercert(), empty if the certificate was not verified
+        not_after = cert.get('notAfter') if cert else None
+        self.not_after = datetime.fromtimestamp(ssl.cert_time_to_seconds(not_after), timezone.utc) if not_after else None
+        self._hostnames = {}  # hostname -> whether the certificate matches it
+
+    def matches_hostname(self, hostname: str) -> bool:
+        matches = self._hostnames.get(hostname)
+        if matches is None:
+            matches = self._hostnames[hostname] = cert_matches_hostname(self.cert, hostname)
+        return matches
+
+    def get_days_left(self) -> typing.Optional[float]:
+        if self.not_after is None:
+            return None
+        return (self.not_after.timestamp() - time.time()) / 86400
+
+
+CERT_CACHE_SIZE = 4096
+
+_cert_cache = OrderedDict()  # fingerprint -> CertificateInfo, least recently used first
+_cert_cache_lock = threading.Lock()
+
+
+def get_certificate_info(ssock: typing.Union[ssl.SSLSocket, ssl.SSLObject]) -> typing.Tuple[typing.Optional[CertificateInfo], bool]:
+    """Returns the info of the peer certificate and whether it was cached.
+
+    The certificate is only parsed if its DER fingerprint is not cached yet.
+    """
+
+    der = ssock.getpeercert(binary_form=True)
+    if not der:
+        return None, False
+
+    fingerprint = hashlib.sha256(der).hexdigest()
+    with _cert_cache_lock:
+        info = _cert_cache.get(fingerprint)
+        if info is not None:
+            _cert_cache.move_to_end(fingerprint)
+            return info, True
+
+    info = CertificateInfo(fingerprint, ssock.getpeercert())
+    if info.cert:
+        # unverified certificates are not parsed by the ssl module, a later verified connection may parse it
+        with _cert_cache_lock:
+            _cert_cache[fingerprint] = info
+            while len(_cert_cache) > CERT_CACHE_SIZE:
+                _cert_cache.popitem(last=False)
+
+    return info, False
+
+
+def clear_certificate_cache():
+    with _cert_cache_lock:
+        _cert_cache.clear()
+
+
+def get_chain_depth(ssock: typing.Union[ssl.SSLSocket, ssl.SSLObject]) -> typing.Optional[int]:
+    """Returns the length of the verified certificate chain, including the peer certificate.
+
+    None if the chain was not verified or cannot be retrieved, which is public API since Python 3.13.
+    """
+
+    get_chain = getattr(ssock, 'get_verified_chain', None) or getattr(getattr(ssock, '_sslobj', None), 'get_verified_chain', None)
+    if get_chain is None:
+        return None
+
+    try:
+        chain = get_chain()
+    except (ssl.SSLError, ValueError):
+        return None
+    return len(chain) if chain else None
+
+
+_session_cache = {}  # (host, port, SSLContext) -> SSLSession
+_session_cache_lock = threading.Lock()
+
+
+class _ResumingContext(object):
+    """Offers a session to resume on the SSL object asyncio creates from the context.
+
+    asyncio has no parameter for the session, but creates its SSL object using wrap_bio(),
+    all other attributes are taken from the wrapped context.
+    """
+
+    def __init__(self, context: ssl.SSLContext, session: ssl.SSLSession):
+        self.context = context
+        self.session = session
+
+    def wrap_bio(self, *args, **kwargs) -> ssl.SSLObject:
+        kwargs.setdefault('session', self.session)
+        return self.context.wrap_bio(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.context, name)
+
 
 class SslCheck(TcpCheck):
 
@@ -49,22 +286,39 @@ class SslCheck(TcpCheck):
         'ssl.verify_mode': 'CERT_OPTIONAL',
         'ssl.verify_flags': 'VERIFY_DEFAULT',
         'ssl.ca': '__sys__',
+        'ssl.resume_session': False,
+        'ssl.enumerate': False,
+        'ssl.enumerate.protocols': 'TLSv1,TLSv1.1,TLSv1.2,TLSv1.3',
+        'ssl.enumerate.ciphers': 'ALL',
+        'ssl.enumerate.concurrency': 8,
     }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self._peer = None  # (family, address) of the last connection, target of the enumeration probes
 
     def run(self):
         sock = self.get_connection()
         self.close_connection(sock)
+        if self._peer:
+            self.enumerate()
 
         self.results['success'] = self.results['tcp.success'] is True and self.results['ssl.success'] is True
 
+    def _store_peer(self, sock: typing.Optional[socket.socket]):
+        self._peer = None
+        if sock and self.options['ssl.enumerate'] is True and self.wants('ssl.enum'):
+            try:
+                self._peer = sock.family, sock.getpeername()
+            except OSError:
+                pass
+
     def get_connection(self):
         self.log.info(f"SSL library: {ssl.OPENSSL_VERSION} ({'.'.join(map(str, ssl.OPENSSL_VERSION_INFO))})")
         context = self._get_context()
 
         sock = self._connect_socket(retry=False)
+        self._store_peer(sock)
         if sock:
             ssock = self._wrap_socket(sock, context)
             return ssock
@@ -75,13 +329,72 @@ class SslCheck(TcpCheck):
 
     def close_connection(self, ssock: ssl.SSLSocket):
         if ssock:
+            self.store_session(ssock, read_pending=True)
+
             timer = start_timer()
             ssock.shutdown(socket.SHUT_RDWR)
             self.results['ssl.shutdown.time.perf'], self.results['ssl.shutdown.time.process'] = stop_timer(*timer)
 
             ssock.close()
 
-    def _get_context(self):
+    async def run_async(self):
+        con = await self.get_connection_async()
+        await self.close_connection_async(con)
+        if self._peer:
+            await self.enumerate_async()
+
+        self.results['success'] = self.results['tcp.success'] is True and self.results['ssl.success'] is True
+
+    async def get_connection_async(self):
+        self.log.info(f"SSL library: {ssl.OPENSSL_VERSION} ({'.'.join(map(str, ssl.OPENSSL_VERSION_INFO))})")
+        context = self._get_context()
+
+        sock = await self._connect_socket_async(retry=False)
+        self._store_peer(sock)
+        if sock:
+            return await self._wrap_socket_async(sock, context)
+        else:
+            self.results['ssl.success'] = False
+            self.log.error("Failed to establish socket")
+            return None
+
+    async def close_connection_async(self, con: typing.Tuple[asyncio.StreamReader, asyncio.StreamWriter]):
+        if con:
+            reader, writer = con
+            # session tickets of TLS 1.3 arrived by now are already processed by the transport
+            self.store_session(writer.get_extra_info('ssl_object'))
+
+            timer = start_timer()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                # peers frequently skip the close_notify alert
+                pass
+            self.results['ssl.shutdown.time.perf'], self.results['ssl.shutdown.time.process'] = stop_timer(*timer)
+
+    def _get_context(self) -> ssl.SSLContext:
+        """Returns the SSL context for the configured options, which is only created if it is not cached yet."""
+
+        key = tuple(str(self.options[name]) for name in CONTEXT_OPTIONS)
+        mtimes = get_ca_mtimes(self.options['ssl.ca'])
+
+        with _context_cache_lock:
+            cached_mtimes, context = _context_cache.get(key, (None, None))
+
+        if context is not None and cached_mtimes == mtimes:
+            self.log.info("Using cached SSL context")
+            self.results['ssl.context.cached'] = True
+            return context
+
+        context = self._create_context()
+        with _context_cache_lock:
+            _context_cache[key] = (mtimes, context)
+
+        self.results['ssl.context.cached'] = False
+        return context
+
+    def _create_context(self) -> ssl.SSLContext:
 
         if self.options['ssl.use_default_context'] is True:
             self.log.info("Using system default SSL context")
@@ -119,37 +432,299 @@ class SslCheck(TcpCheck):
 
         return context
 
+    def _get_enumeration_probes(self) -> typing.List[typing.Tuple[str, ssl.SSLContext]]:
+        """Returns label and context of every probe of the enumeration.
+
+        There is one probe per protocol version and one per cipher of TLS 1.2 and below.
+        TLS 1.3 cipher suites cannot be selected by the ssl library, the one negotiated
+        by the TLSv1.3 probe is reported.
+        """
+
+        ciphers = str(self.options['ssl.enumerate.ciphers'])
+        probes = []
+        versions = []
+        for name in str(self.options['ssl.enumerate.protocols']).split(','):
+            name = name.strip()
+            version = get_tls_version(name)
+            if version is None:
+                self.log.warning("Protocol %s is not supported by the ssl library, it is not enumerated", name)
+                continue
+
+            versions.append(version)
+            try:
+                probes.append((name, get_enumeration_context(version, version, ciphers + ENUMERATE_SECLEVEL)))
+            except ssl.SSLError as e:
+                self.log.warning("Cannot enumerate protocol %s: %s", name, e)
+
+        legacy = [version for version in versions if version <= ssl.TLSVersion.TLSv1_2]
+        if not legacy:
+            return probes
+
+        minimum, maximum = min(legacy), max(legacy)
+        try:
+            available = get_enumeration_context(minimum, maximum, ciphers + ENUMERATE_SECLEVEL).get_ciphers()
+        except ssl.SSLError as e:
+            self.log.warning("Cannot enumerate ciphers %s: %s", ciphers, e)
+            return probes
+
+        for cipher in available:
+            if cipher['protocol'] == 'TLSv1.3':
+                continue
+            try:
+                probes.append((cipher['name'], get_enumeration_context(minimum, maximum, cipher['name'] + ENUMERATE_SECLEVEL)))
+            except ssl.SSLError:
+                self.log.debug("Cipher %s cannot be used on its own", cipher['name'])
+
+        return probes
+
+    def _get_enumeration_concurrency(self) -> int:
+        return max(1, int(self.options['ssl.enumerate.concurrency']))
+
+    def enumerate(self):
+        """Probes the protocol versions and ciphers accepted by the server, see the ssl.enumerate options."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        probes = self._get_enumeration_probes()
+        timer = start_timer()
+        with ThreadPoolExecutor(max_workers=self._get_enumeration_concurrency()) as executor:
+            outcomes = list(executor.map(lambda probe: self._probe(*probe), probes))
+        self._update_enumeration_results(probes, outcomes, stop_timer(*timer))
+
+    async def enumerate_async(self):
+        """Asynchronous counterpart of enumerate()."""
+
+        probes = self._get_enumeration_probes()
+        semaphore = asyncio.Semaphore(self._get_enumeration_concurrency())
+
+        async def probe(label, context):
+            async with semaphore:
+                return await self._probe_async(label, context)
+
+        timer = start_timer()
+        outcomes = await asyncio.gather(*(probe(label, context) for label, context in probes))
+        self._update_enumeration_results(probes, outcomes, stop_timer(*timer))
+
+    def _probe(self, label: str, context: ssl.SSLContext) -> typing.Optional[typing.Tuple[str, str, float]]:
+        """Returns the negotiated protocol, cipher and the handshake time, None if the handshake failed."""
+
+        family, address = self._peer
+        try:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+        except OSError as e:
+            self.log.debug("Probe %s failed: %s", label, e)
+            return None
+
+        try:
+            sock.settimeout(self.get_timeout())
+            sock.connect(address)
+            ssock = context.wrap_socket(sock, server_hostname=self.host, do_handshake_on_connect=False)
+            timer = start_timer()
+            ssock.do_handshake()
+            perf, _ = stop_timer(*timer)
+            result = ssock.version(), (ssock.cipher() or (None, ))[0], perf
+            ssock.close()
+            return result
+
+        except (ssl.SSLError, OSError) as e:
+            self.log.debug("Probe %s rejected: %s", label, e)
+            return None
+        finally:
+            sock.close()
+
+    async def _probe_async(self, label: str, context: ssl.SSLContext) -> typing.Optional[typing.Tuple[str, str, float]]:
+        """Asynchronous counterpart of _probe()."""
+
+        loop = asyncio.get_running_loop()
+        family, address = self._peer
+        try:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.setblocking(False)
+        except OSError as e:
+            self.log.debug("Probe %s failed: %s", label, e)
+            return None
+
+        try:
+            timeout = self.get_timeout()
+            await asyncio.wait_for(loop.sock_connect(sock, address), timeout)
+            timer = start_timer()
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(
+                sock=sock,
+                ssl=context,
+                server_hostname=self.host,
+                ssl_handshake_timeout=timeout,
+            ), timeout)
+            perf, _ = stop_timer(*timer)
+
+        except (ssl.SSLError, OSError, asyncio.TimeoutError) as e:
+            sock.close()
+            self.log.debug("Probe %s rejected: %s", label, e)
+            return None
+
+        ssl_object = writer.get_extra_info('ssl_object')
+        result = ssl_object.version(), (ssl_object.cipher() or (None, ))[0], perf
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+        return result
+
+    def _update_enumeration_results(self, probes: typing.List[typing.Tuple[str, ssl.SSLContext]],
+                                    outcomes: typing.List[typing.Optional[typing.Tuple[str, str, float]]],
+                                    time: typing.Tuple[float, float]):
+        protocols = []
+        ciphers = []
+        times = {}  # "protocol cipher" -> seconds of the handshake
+        for (label, _), outcome in zip(probes, outcomes):
+            if outcome is None:
+                continue
+
+            protocol, cipher, perf = outcome
+            if label == protocol and protocol not in protocols:
+                protocols.append(protocol)
+            if cipher and cipher not in ciphers:
+                ciphers.append(cipher)
+            times.setdefault(f"{protocol} {cipher}", perf)
+
+        self.log.info("Server accepts %d protocols and %d ciphers of %d probes", len(protocols), len(ciphers), len(probes))
+        self.results['ssl.enum.probes'] = len(probes)
+        self.results['ssl.enum.accepted_protocols'] = protocols
+        self.results['ssl.enum.accepted_ciphers'] = ciphers
+        self.results['ssl.enum.times'] = times
+        self.results['ssl.enum.time.perf'], self.results['ssl.enum.time.process'] = time
+
+    def store_session(self, ssock: typing.Union[ssl.SSLSocket, ssl.SSLObject, None], read_pending: bool = False):
+        """Stores the session of the connection, to offer it on the next connection to the same server.
+
+        TLS 1.3 servers send their session tickets after the handshake. With `read_pending`
+        already received but not yet processed tickets are read without blocking, which
+        is only possible for an SSLSocket.
+        """
+
+        if not self.options['ssl.resume_session'] or ssock is None or ssock.context is None:
+            return
+
+        if read_pending and ssock.version() == 'TLSv1.3' and not (ssock.session and ssock.session.has_ticket):
+            timeout = ssock.gettimeout()
+            try:
+                ssock.setblocking(False)
+                ssock.recv(1)
+            except (ssl.SSLWantReadError, ssl.SSLError, OSError):
+                pass
+            finally:
+                ssock.settimeout(timeout)
+
+        session = ssock.session
+        if session is None or (ssock.version() == 'TLSv1.3' and not session.has_ticket):
+            return
+
+        with _session_cache_lock:
+            _session_cache[(self.host, self.port, ssock.context)] = session
+        self.log.debug("Stored SSL session")
+
+    def _get_session(self, context: ssl.SSLContext) -> typing.Optional[ssl.SSLSession]:
+        if not self.options['ssl.resume_session']:
+            return None
+
+        with _session_cache_lock:
+            return _session_cache.get((self.host, self.port, context))
+
+    def _update_handshake_time(self, handshake_time: typing.Tuple[float, float], resumed: bool):
+        self.results['ssl.handshake.time.perf'], self.results['ssl.handshake.time.process'] = handshake_time
+
+        kind = 'resumed' if resumed else 'full'
+        self.results[f'ssl.handshake.{kind}.time.perf'], self.results[f'ssl.handshake.{kind}.time.process'] = handshake_time
+
     def _wrap_socket(self, sock: socket.socket, context: ssl.SSLContext) -> ssl.SSLSocket:
-        ssock = context.wrap_socket(sock, server_side=False, do_handshake_on_connect=False, server_hostname=self.host)
+        session = self._get_session(context)
+        self.results['ssl.con.session_offered'] = session is not None
+        ssock = context.wrap_socket(sock, server_side=False, do_handshake_on_connect=False, server_hostname=self.host, session=session)
 
         try:
             self.log.info("Start SSL handshake")
+            ssock.settimeout(self.get_timeout())
             timer = start_timer()
 
-            ssock.do_handshake()
+            with self.phase('tls'):
+                ssock.do_handshake()
 
-            self.results['ssl.handshake.time.perf'], self.results['ssl.handshake.time.process'] = stop_timer(*timer)
+            self._update_handshake_time(stop_timer(*timer), ssock.session_reused)
             self._update_results(context, ssock, True)
+            self.store_session(ssock)
 
             self.log.info("SSL handshake successfull")
 
             return ssock
 
-        except ssl.SSLError as e:
+        except (ssl.SSLError, OSError) as e:
             self._update_results(context, ssock, False)
-            self.log.error(f"SSL handshake failed: {e.reason}", exc_info=False)
+            self.log.error("SSL handshake failed: %s", getattr(e, 'reason', None) or e.strerror or repr(e), exc_info=False)
+            self.trace_error(e)
+            return None
+
+    async def _wrap_socket_async(self, sock: socket.socket, context: ssl.SSLContext):
+        session = self._get_session(context)
+        self.results['ssl.con.session_offered'] = session is not None
+
+        try:
+            timeout = self.get_timeout()
+            self.log.info("Start SSL handshake")
+            timer = start_timer()
+
+            with self.phase('tls'):
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(
+                    sock=sock,
+                    ssl=_ResumingContext(context, session) if session is not None else context,
+                    server_hostname=self.host,
+                    ssl_handshake_timeout=timeout,
+                ), timeout)
+
+            ssl_object = writer.get_extra_info('ssl_object')
+            self._update_handshake_time(stop_timer(*timer), ssl_object.session_reused)
+            self._update_results(context, ssl_object, True)
+            self.store_session(ssl_object)
+
+            self.log.info("SSL handshake successfull")
+
+            return reader, writer
+
+        except (ssl.SSLError, OSError, asyncio.TimeoutError) as e:
+            sock.close()
+            self._update_results(context, None, False)
+            self.log.error("SSL handshake failed: %s", getattr(e, 'reason', None) or repr(e), exc_info=False)
+            self.trace_error(e)
             return None
 
-    def _update_results(self, context: ssl.SSLContext, ssock: ssl.SSLSocket, success: bool):
+    def _update_results(self, context: ssl.SSLContext, ssock: typing.Union[ssl.SSLSocket, ssl.SSLObject, None], success: bool):
 
         self.results['ssl.success'] = success
 
-        cert = ssock.getpeercert() if success else None
-        self.results['ssl.con.cert'] = cert
+        if ssock is None:
+            # the asynchronous handshake provides no SSL object when it failed
+            for key in ('ssl.con.cipher', 'ssl.con.protocol', 'ssl.con.secret_bits', 'ssl.con.compression',
+                        'ssl.con.alpn_protocol', 'ssl.con.npn_protocol', 'ssl.con.ssl_version'):
+                self.results[key] = None
+            self.results['ssl.con.session_reused'] = False
+            self.results['ssl.con.server_hostname'] = self.host
+            self.results['ssl.con.cert.matches_hostname'] = False
+            self._update_cert_results(None, False, None)
+            return
+
+        info, cached = get_certificate_info(ssock) if success else (None, False)
+        self._update_cert_results(info, cached, get_chain_depth(ssock) if success else None)
         self.results['ssl.con.cipher'], self.results['ssl.con.protocol'], self.results['ssl.con.secret_bits'] = ssock.cipher() or (None, None, None)
         self.results['ssl.con.compression'] = ssock.compression() or None
         self.results['ssl.con.alpn_protocol'] = ssock.selected_alpn_protocol() or None
         self.results['ssl.con.npn_protocol'] = ssock.selected_npn_protocol() or None
         self.results['ssl.con.ssl_version'] = ssock.version() or None
+        self.results['ssl.con.session_reused'] = ssock.session_reused if success else False
         self.results['ssl.con.server_hostname'] = ssock.server_hostname or None
-        self.results['ssl.con.cert.matches_hostname'] = True if cert is not None and ssl.match_hostname(cert, self.host) else False
+        self.results.defer('ssl.con.cert.matches_hostname', lambda: info.matches_hostname(self.host) if info else False)
+
+    def _update_cert_results(self, info: typing.Optional[CertificateInfo], cached: bool, chain_depth: typing.Optional[int]):
+        self.results['ssl.con.cert'] = info.cert if info and self.wants('ssl.con.cert') else None
+        self.results['ssl.con.cert.cached'] = cached
+        self.results['ssl.con.cert.fingerprint'] = info.fingerprint if info else None
+        self.results['ssl.con.cert.not_after'] = info.not_after if info else None
+        self.results['ssl.con.cert.days_left'] = info.get_days_left() if info else None
+        self.results['ssl.con.cert.chain_depth'] = chain_depth
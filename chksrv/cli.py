@@ -21,21 +21,48 @@ Usage:
     chksrv (-h | --help)
     chksrv --version
     chksrv tcp [options] [-p PARAM=VALUE]... [-e EXPR]... HOST PORT
+    chksrv udp [options] [-p PARAM=VALUE]... [-e EXPR]... HOST PORT
     chksrv ssl [options] [-p PARAM=VALUE]... [-e EXPR]... HOST PORT
     chksrv http [options] [-p PARAM=VALUE]... [-e EXPR]... URL
     chksrv ping [options] [-p PARAM=VALUE]... [-e EXPR]... HOST
     chksrv dns [options] [-p PARAM=VALUE]... [-e EXPR]... DOMAIN
+    chksrv batch [options] [-p PARAM=VALUE]... [-e EXPR]... INVENTORY
+    chksrv daemon [options] [-p PARAM=VALUE]... [-e EXPR]... INVENTORY
 
 Options:
     -h --help                     Show this screen.
     --version                     Show version.
     -v --verbose                  Increases verbosity.
+    -q --quiet                    Does not print the results, which are then only computed as far as the expects need them.
     -l --log-level LEVEL          Defines the log verbosity [default: WARN].
     --log-file FILE               Stores all log output in a file.
     -p --parameter PARAM=VALUE    Defines a parameter.
     -e --expects EXPR             Defines an expection expression.
-    -r --retry RETRY              Defines the amount of retries [default: 3].
-    --timeout TIMEOUT             Defines a timeout for one try in seconds [default: 10].
+    -r --retry RETRY              Defines the amount of retries of a failed check [default: 3].
+    --timeout TIMEOUT             Defines the time budget of a check including all retries in seconds [default: 10].
+    -c --concurrency N            Defines the maximum of concurrently running checks in batch and daemon mode [default: 32].
+    -w --workers N                Runs the checks of batch and daemon mode in N worker processes [default: 1].
+    --samples N                   Runs a check N times and aggregates its numeric results [default: 1].
+    --interval S                  Defines the seconds between the start of two samples [default: 0].
+    --metrics [HOST:]PORT         Serves the results in OpenMetrics format in daemon mode.
+    --history DIR                 Records the numeric results of every check in a history file in DIR.
+    -o --output FORMAT            Defines the output format, either pprint, jsonl or msgpack [default: pprint].
+    --drop-bulky                  Drops bulky results like the HTTP response body or the peer certificate from the output.
+    --trace FILE                  Writes the phases, attempts and errors of all checks as Chrome trace to FILE.
+    --expiry-index N              Lists the N certificates expiring soonest at the end of the batch mode.
+
+Inventory:
+    The INVENTORY file of the batch and daemon mode lists one check per line, using the
+    same syntax as the command line, e.g. `tcp -p timeout=2 example.com 22`.
+    Empty lines and lines starting with # are ignored. Parameters and expects passed
+    to the batch or daemon command apply to every check of the inventory. The same
+    holds for the options --retry, --timeout, --samples, --interval and --history,
+    which cannot be set per check.
+    With --workers the checks are run in several processes, each running up to its
+    share of --concurrency checks at a time. The daemon assigns every check to one
+    worker for its whole lifetime.
+    In daemon mode the parameters schedule.interval, schedule.jitter and schedule.missed
+    define when a check is run.
 """
 
 import typing
@@ -43,35 +70,42 @@ import sys
 import os
 import logging
 import re
+import shlex
 
-from docopt import docopt
+from docopt import docopt, DocoptExit
 
 from chksrv import exceptions
 from chksrv.config import parse_option_value
 from chksrv import checks
 from chksrv.runner import Runner
+from chksrv.output import ResultWriter, get_writer
 
 
 log = logging.getLogger('CLI')
 
 
 def get_version():
-    from pkg_resources import get_distribution, DistributionNotFound
+    try:
+        from importlib import metadata
+    except ImportError:
+        # Python < 3.8
+        import importlib_metadata as metadata
 
     try:
-        dist = get_distribution('chksrv')
-        dist_loc = os.path.normcase(dist.location)
-        here = os.path.normcase(__file__)
-        if not here.startswith(os.path.join(dist_loc, 'chksrv')):
-            # not installed, but another version of chksrv is
-            raise DistributionNotFound
-    except DistributionNotFound:
+        dist = metadata.distribution('chksrv')
+    except metadata.PackageNotFoundError:
+        return "n/a"
+
+    dist_loc = os.path.normcase(os.path.abspath(dist.locate_file('chksrv')))
+    here = os.path.normcase(os.path.abspath(__file__))
+    if not here.startswith(dist_loc + os.sep):
+        # not installed, but another version of chksrv is
         return "n/a"
-    else:
-        return dist.version
 
+    return dist.version
 
-def setup_logging(level=logging.WARN, logfile=None) -> None:
+
+def setup_logging(level=logging.WARN, logfile=None, stream=None) -> None:
     log_root = logging.getLogger()
     log_root.setLevel(level)
     log_format = logging.Formatter('%(asctime)s %(name)-12s %(levelname)-8s %(message)s')
@@ -82,14 +116,14 @@ def setup_logging(level=logging.WARN, logfile=None) -> None:
         log_file_handler.setFormatter(log_format)
         log_root.addHandler(log_file_handler)
 
-    # setting up logging to stdout
-    log_stream_handler = logging.StreamHandler(sys.stdout)
+    # setting up logging to stdout, unless it is used for machine readable output
+    log_stream_handler = logging.StreamHandler(stream or sys.stdout)
     log_stream_handler.setFormatter(log_format)
     log_root.addHandler(log_stream_handler)
 
 
 def parse_type(args: typing.Dict[str, typing.Any]) -> str:
-    types = ('tcp', 'ssl', 'http', 'ping', 'dns')
+    types = tuple(checks.REGISTRY)
     result = None
 
     for t in types:
@@ -127,6 +161,28 @@ def parse_options(param_list: typing.List[str]) -> typing.Dict[str, typing.Any]:
 
     return params
 
+def parse_runner_args(args: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+    """Returns the keyword arguments of the Runner: retries, time budget and sampling."""
+
+    try:
+        kwargs = {
+            'retries': int(args['--retry']),
+            'timeout': float(args['--timeout']),
+            'samples': int(args['--samples']),
+            'interval': float(args['--interval']),
+            'lazy': bool(args['--quiet']),
+        }
+    except (TypeError, ValueError):
+        raise exceptions.ChksrvConfigException("--retry, --timeout, --samples and --interval must be numbers")
+
+    if kwargs['retries'] < 0 or kwargs['timeout'] <= 0:
+        raise exceptions.ChksrvConfigException("--retry must not be negative and --timeout must be positive")
+    if kwargs['samples'] < 1 or kwargs['interval'] < 0:
+        raise exceptions.ChksrvConfigException("--samples must be positive and --interval must not be negative")
+
+    return kwargs
+
+
 def parse_loglevel(args):
     level_map = {
         'CRITICAL': 50,
@@ -153,6 +209,281 @@ def parse_loglevel(args):
     return max(0, level)
 
 
+def parse_address(address: str, default_host: str = '127.0.0.1') -> typing.Tuple[str, int]:
+    """Parses `[HOST:]PORT`, IPv6 addresses are enclosed in brackets."""
+
+    host, _, port = address.rpartition(':')
+    host = host.strip('[]') or default_host
+    try:
+        port = int(port)
+    except ValueError:
+        raise exceptions.ChksrvConfigException(f"Invalid port in address '{address}'")
+    if not 0 < port < 65536:
+        raise exceptions.ChksrvConfigException(f"Invalid port in address '{address}'")
+
+    return host, port
+
+
+def parse_port(value: str) -> int:
+    try:
+        port = int(value)
+    except ValueError:
+        port = -1
+
+    if not 0 <= port <= 65535:
+        raise exceptions.ChksrvConfigException(f"Invalid port '{value}'")
+    return port
+
+
+def build_check(chk_type: str, args: typing.Dict[str, typing.Any], options: typing.Dict[str, typing.Any]) -> checks.BaseCheck:
+    if chk_type == 'tcp':
+        return checks.TcpCheck(args['HOST'], parse_port(args['PORT']), options=options)
+    elif chk_type == 'udp':
+        return checks.UdpCheck(args['HOST'], parse_port(args['PORT']), options=options)
+    elif chk_type == 'ssl':
+        return checks.SslCheck(args['HOST'], parse_port(args['PORT']), options=options)
+    elif chk_type == 'http':
+        return checks.HttpCheck(args['URL'], options=options)
+    elif chk_type == 'dns':
+        return checks.DnsCheck(args['DOMAIN'], options=options)
+    elif chk_type == 'ping':
+        return checks.IcmpPingCheck(args['HOST'], options=options)
+    else:
+        raise exceptions.ChksrvConfigException(f"Not implemented check type {chk_type}")
+
+
+def get_check_name(chk_type: str, args: typing.Dict[str, typing.Any]) -> str:
+    target = ' '.join(str(args[key]) for key in ('HOST', 'PORT', 'URL', 'DOMAIN') if args.get(key))
+    return f"{chk_type} {target}"
+
+
+def build_history_path(history_dir: typing.Optional[str], name: str) -> typing.Optional[str]:
+    if not history_dir:
+        return None
+
+    from chksrv.history import get_history_path
+
+    os.makedirs(history_dir, exist_ok=True)
+    return get_history_path(history_dir, name)
+
+
+def read_inventory(path: str) -> typing.List[typing.Tuple[int, typing.List[str]]]:
+    """Returns the line number and the arguments of every check listed in an inventory file."""
+
+    lines = []
+    with open(path, 'r') as fh:
+        for lineno, line in enumerate(fh, start=1):
+            argv = shlex.split(line, comments=True)
+            if argv:
+                lines.append((lineno, argv))
+
+    return lines
+
+
+def build_inventory_runner(path: str, lineno: int, argv: typing.List[str], options: typing.Dict[str, typing.Any],
+                           expects: typing.List[str], history_dir: typing.Optional[str] = None,
+                           **runner_kwargs) -> typing.Tuple[str, Runner]:
+    """Builds the name and the runner of the check in line `lineno` of an inventory file."""
+
+    try:
+        line_args = docopt(__doc__, argv=argv, help=False)
+    except DocoptExit:
+        raise exceptions.ChksrvConfigException(f"Cannot parse check in line {lineno} of {path}")
+
+    if line_args['batch'] or line_args['daemon']:
+        raise exceptions.ChksrvConfigException(f"Nested batch or daemon in line {lineno} of {path}")
+
+    chk_type = parse_type(line_args)
+    line_options = {**options, **parse_options(line_args.get('--parameter', []))}
+    try:
+        chk = build_check(chk_type, line_args, line_options)
+    except (ValueError, exceptions.ChksrvConfigException) as e:
+        raise exceptions.ChksrvConfigException(f"Invalid check in line {lineno} of {path}: {e}")
+    name = get_check_name(chk_type, line_args)
+    log.debug(f"Loaded check '{name}' from line {lineno}")
+
+    history_path = build_history_path(history_dir, name)
+    runner = Runner(chk, expects + line_args['--expects'], line_options, history_path=history_path, **runner_kwargs)
+    return name, runner
+
+
+def load_inventory(path: str, options: typing.Dict[str, typing.Any], expects: typing.List[str],
+                   history_dir: typing.Optional[str] = None, **runner_kwargs) -> typing.List[typing.Tuple[str, Runner]]:
+    """Reads an inventory file and builds a runner for every check listed in it.
+
+    `runner_kwargs` are passed to every Runner. With `history_dir` every check records
+    its results in a history file within this directory.
+    """
+
+    return [
+        build_inventory_runner(path, lineno, argv, options, expects, history_dir, **runner_kwargs)
+        for lineno, argv in read_inventory(path)
+    ]
+
+
+def parse_workers(args: typing.Dict[str, typing.Any]) -> int:
+    try:
+        workers = int(args['--workers'])
+    except ValueError:
+        workers = 0
+
+    if workers < 1:
+        raise exceptions.ChksrvConfigException(f"Invalid number of workers '{args['--workers']}'")
+    return workers
+
+
+def build_worker_pool(args: typing.Dict[str, typing.Any], runners: typing.List[typing.Tuple[str, Runner]],
+                      options: typing.Dict[str, typing.Any], workers: int):
+    """Builds a pool of worker processes, which build their own runners of the inventory."""
+
+    import functools
+    from chksrv.workers import WorkerPool
+
+    factory = functools.partial(
+        build_inventory_runner, args['INVENTORY'], options=options, expects=args['--expects'],
+        history_dir=args['--history'], **parse_runner_args(args),
+    )
+    return WorkerPool(runners, read_inventory(args['INVENTORY']), factory, workers,
+                      concurrency=int(args['--concurrency']), drop_bulky=args['--drop-bulky'], trace_path=args['--trace'])
+
+
+def start_tracing(path: typing.Optional[str], runners: typing.List[typing.Tuple[str, Runner]]):
+    """Starts collecting a Chrome trace of all checks, if a trace file is given."""
+
+    if not path:
+        return None
+
+    from chksrv.tracing import ChromeTraceCollector
+
+    collector = ChromeTraceCollector(path)
+    for name, runner in runners:
+        collector.set_name(runner.check, name)
+    collector.start()
+    return collector
+
+
+def stop_tracing(collector) -> None:
+    if collector is None:
+        return
+
+    try:
+        collector.close()
+    except OSError as e:
+        log.error("Cannot write trace: %s", e)
+
+
+def build_writer(args: typing.Dict[str, typing.Any], status: bool = False) -> ResultWriter:
+    try:
+        return get_writer(args['--output'], drop_bulky=args['--drop-bulky'], status=status)
+    except exceptions.ChksrvConfigException as e:
+        log.error(str(e))
+        sys.exit(2)
+
+
+def run_batch(args: typing.Dict[str, typing.Any]) -> None:
+    from chksrv.batch import BatchRunner
+
+    writer = build_writer(args, status=True)
+    options = parse_options(args.get('--parameter', []))
+    try:
+        expiry_count = int(args['--expiry-index']) if args['--expiry-index'] is not None else None
+    except ValueError:
+        log.error(f"Invalid number of certificates '{args['--expiry-index']}'")
+        sys.exit(2)
+
+    try:
+        workers = parse_workers(args)
+        runners = load_inventory(args['INVENTORY'], options, args['--expects'], args['--history'], **parse_runner_args(args))
+    except (OSError, exceptions.ChksrvConfigException) as e:
+        log.error(f"Cannot load inventory: {e}")
+        sys.exit(2)
+
+    callback = writer.write_result
+    if expiry_count is not None:
+        from chksrv.expiry import ExpiryIndex
+
+        index = ExpiryIndex()
+
+        def index_certificates(name: str, runner: Runner) -> None:
+            index.add(name, runner.results)
+            writer.write_result(name, runner)
+
+        callback = index_certificates
+
+    if workers > 1:
+        # the runners of the parent only validate the inventory, the workers build their own
+        batch = build_worker_pool(args, runners, options, workers)
+        batch.run_batch(callback=callback, sample_callback=writer.write_sample)
+        results = batch.runs
+    else:
+        for name, runner in runners:
+            runner.sample_callback = writer.sample_callback(name)
+
+        trace = start_tracing(args['--trace'], runners)
+        batch = BatchRunner(runners, concurrency=int(args['--concurrency']))
+        batch.run(callback=callback)
+        stop_tracing(trace)
+        results = [runner for _, runner in runners]
+
+    if expiry_count is not None:
+        writer.write_expiry_index(index.soonest(expiry_count))
+    writer.close()
+
+    failed = sum(1 for result in results if result.success is not True)
+    log.info(f"{len(runners) - failed} checks succeeded, {failed} checks failed")
+
+    sys.exit(0 if batch.success is True else 1)
+
+
+def run_daemon(args: typing.Dict[str, typing.Any]) -> None:
+    from chksrv.scheduler import Scheduler, ScheduledCheck
+
+    writer = build_writer(args, status=True)
+    options = parse_options(args.get('--parameter', []))
+    try:
+        workers = parse_workers(args)
+        runners = load_inventory(args['INVENTORY'], options, args['--expects'], args['--history'], **parse_runner_args(args))
+        entries = [ScheduledCheck(name, runner, runner.options) for name, runner in runners]
+    except (OSError, exceptions.ChksrvConfigException) as e:
+        log.error(f"Cannot load inventory: {e}")
+        sys.exit(2)
+
+    if workers <= 1:
+        for name, runner in runners:
+            runner.sample_callback = writer.sample_callback(name)
+
+    callback = writer.write_result
+    services = []
+    if args['--metrics']:
+        from chksrv.metrics import MetricsRegistry, MetricsServer
+
+        try:
+            host, port = parse_address(args['--metrics'])
+        except exceptions.ChksrvConfigException as e:
+            log.error(str(e))
+            sys.exit(2)
+
+        registry = MetricsRegistry()
+        services.append(MetricsServer(registry, host, port))
+
+        def update_metrics(name: str, runner: Runner) -> None:
+            registry.update(name, runner)
+            writer.write_result(name, runner)
+
+        callback = update_metrics
+
+    if workers > 1:
+        pool = build_worker_pool(args, runners, options, workers)
+        pool.run_daemon(callback=callback, sample_callback=writer.write_sample, services=services)
+    else:
+        trace = start_tracing(args['--trace'], runners)
+        scheduler = Scheduler(entries, concurrency=int(args['--concurrency']))
+        scheduler.run(callback=callback, services=services)
+        stop_tracing(trace)
+    writer.close()
+    log.info("Daemon stopped")
+
+
 def run():
     args = docopt(__doc__)
 
@@ -160,29 +491,50 @@ def run():
         print(f"chksrv version {get_version()}")
         return
 
-    setup_logging(parse_loglevel(args), args.get('--log-file', None))
+    # machine readable output is written to stdout, so the log has to go elsewhere
+    log_stream = sys.stderr if args['--output'].lower() != 'pprint' else None
+    setup_logging(parse_loglevel(args), args.get('--log-file', None), log_stream)
     log.info("Start chksrv")
 
+    if args['batch']:
+        run_batch(args)
+        return
+    elif args['daemon']:
+        run_daemon(args)
+        return
+
     chk_type = parse_type(args)
     log.info(f"Check type {chk_type}")
     options = parse_options(args.get('--parameter', []))
 
-    if chk_type == 'tcp':
-        chk = checks.TcpCheck(args['HOST'], int(args['PORT']), options=options)
-    elif chk_type == 'ssl':
-        chk = checks.SslCheck(args['HOST'], int(args['PORT']), options=options)
-    elif chk_type == 'http':
-        chk = checks.HttpCheck(args['URL'], options=options)
-    else:
-        log.error(f"Not implemented check type {chk_type}")
+    try:
+        chk = build_check(chk_type, args, options)
+    except exceptions.ChksrvConfigException as e:
+        log.error(str(e))
+        sys.exit(2)
+
+    try:
+        runner_kwargs = parse_runner_args(args)
+    except exceptions.ChksrvConfigException as e:
+        log.error(str(e))
+        sys.exit(2)
+
+    writer = build_writer(args)
+    name = get_check_name(chk_type, args)
+    try:
+        history_path = build_history_path(args['--history'], name)
+    except OSError as e:
+        log.error(f"Cannot create history directory: {e}")
         sys.exit(2)
 
-    runner = Runner(chk, args['--expects'], options)
+    runner = Runner(chk, args['--expects'], options, sample_callback=writer.sample_callback(name),
+                    history_path=history_path, **runner_kwargs)
+    trace = start_tracing(args['--trace'], [(name, runner)])
     runner.run()
+    stop_tracing(trace)
 
-    if runner and runner.results:
-        from pprint import pprint
-        pprint(runner.results)
+    writer.write_result(name, runner)
+    writer.close()
 
     if runner.success:
         log.info("Check succeded")
@@ -0,0 +1,71 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - index of the certificates seen by the checks of a run, ordered by expiry.
+"""
+
+import typing
+
+import heapq
+from datetime import datetime, timezone
+
+
+FINGERPRINT_KEY = 'ssl.con.cert.fingerprint'
+NOT_AFTER_KEY = 'ssl.con.cert.not_after'
+
+# results the index is built from, passed on by worker processes even in quiet mode
+INDEX_KEYS = (FINGERPRINT_KEY, NOT_AFTER_KEY)
+
+
+class ExpiryIndex(object):
+    """Collects the certificates of completed checks by fingerprint.
+
+    The index is built from the result keys the SSL module already computed, so no
+    certificate is parsed again, no matter how many checks saw it.
+    """
+
+    def __init__(self):
+        self._certs = {}  # fingerprint -> (not after, names of the checks)
+
+    def __len__(self):
+        return len(self._certs)
+
+    def add(self, name: str, results: typing.Dict[str, typing.Any]):
+        # only the keys already computed, lazy results are not forced
+        fingerprint = dict.get(results, FINGERPRINT_KEY)
+        not_after = dict.get(results, NOT_AFTER_KEY)
+        if fingerprint is None or not_after is None:
+            return
+
+        self._certs.setdefault(fingerprint, (not_after, set()))[1].add(name)
+
+    def soonest(self, count: typing.Optional[int] = None) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Returns the `count` certificates expiring soonest, or all if `count` is None."""
+
+        items = self._certs.items()
+        key = lambda item: item[1][0]  # noqa: E731
+        items = sorted(items, key=key) if count is None else heapq.nsmallest(count, items, key=key)
+
+        now = datetime.now(timezone.utc)
+        return [
+            {
+                'fingerprint': fingerprint,
+                'not_after': not_after,
+                'days_left': (not_after - now).total_seconds() / 86400,
+                'checks': sorted(names),
+            }
+            for fingerprint, (not_after, names) in items
+        ]
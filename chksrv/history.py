@@ -0,0 +1,253 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - memory mapped ring buffer files storing the numeric results of past runs.
+"""
+
+import typing
+import logging
+
+import os
+import re
+import math
+import mmap
+import fcntl
+import struct
+import hashlib
+import fnmatch
+
+from chksrv import exceptions
+from chksrv import stats
+
+
+MAGIC = b'CHKH'
+VERSION = 1
+
+# magic, version, slots, capacity, number of records ever written
+HEADER = struct.Struct('<4sHHIQ')
+KEY_SIZE = 64
+DOUBLE = struct.Struct('<d')
+
+
+def get_history_path(directory: str, name: str) -> str:
+    """Returns the path of the history file of the check `name` within `directory`."""
+
+    # the digest keeps names apart which only differ in characters not allowed in file names
+    readable = re.sub(r'[^A-Za-z0-9._-]+', '_', name).strip('._')[:100]
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(directory, f"{readable}-{digest}.hist")
+
+
+class HistoryFile(object):
+    """Append only ring buffer of fixed width records, memory mapped from a file.
+
+    Every record holds the time of a run and one double per key slot, NaN if the result
+    was missing. The keys are assigned to slots in the order they are first appended,
+    once all slots are taken further keys are not recorded. When the file is full the
+    oldest record is overwritten, so its size is bounded by `capacity`.
+    """
+
+    log = logging.getLogger('HISTORY')
+
+    def __init__(self, path: str, capacity: int = 4096, slots: int = 64):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size == 0:
+                    self._create(fd, int(capacity), int(slots))
+                self._mmap = mmap.mmap(fd, 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        except (Exception, exceptions.ChksrvBaseException):
+            os.close(fd)
+            raise
+        self._fd = fd
+
+        magic, version, self.slots, self.capacity, _ = HEADER.unpack_from(self._mmap) if len(self._mmap) >= HEADER.size else (None,) * 5
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise exceptions.ChksrvConfigException(f"{path} is not a chksrv history file")
+
+        self._record = struct.Struct(f'<{self.slots + 1}d')
+        self._data_offset = self._get_data_offset(self.slots)
+        if len(self._mmap) < self._data_offset + self.capacity * self._record.size:
+            self.close()
+            raise exceptions.ChksrvConfigException(f"History file {path} is truncated")
+
+        self._keys = {}  # key -> slot
+        self._read_keys()
+        self._ignored = set()
+
+    @staticmethod
+    def _get_data_offset(slots: int) -> int:
+        # records are aligned to 8 bytes
+        return (HEADER.size + slots * KEY_SIZE + 7) // 8 * 8
+
+    @classmethod
+    def _create(cls, fd: int, capacity: int, slots: int):
+        if capacity < 1 or not 0 < slots < 65536:
+            raise exceptions.ChksrvConfigException("History capacity and slots must be positive")
+
+        os.ftruncate(fd, cls._get_data_offset(slots) + capacity * (slots + 1) * 8)
+        os.pwrite(fd, HEADER.pack(MAGIC, VERSION, slots, capacity, 0), 0)
+
+    def _read_keys(self):
+        for slot in range(self.slots):
+            offset = HEADER.size + slot * KEY_SIZE
+            key = self._mmap[offset:offset + KEY_SIZE].rstrip(b'\0')
+            if key:
+                self._keys[key.decode('utf-8')] = slot
+
+    def _get_slot(self, key: str) -> typing.Optional[int]:
+        slot = self._keys.get(key)
+        if slot is not None or key in self._ignored:
+            return slot
+
+        # another process may have assigned slots since the file was opened
+        self._read_keys()
+        if key in self._keys:
+            return self._keys[key]
+
+        encoded = key.encode('utf-8')
+        if len(self._keys) >= self.slots or len(encoded) > KEY_SIZE:
+            self.log.warning(f"Result {key} is not recorded in {self.path}, no free slot")
+            self._ignored.add(key)
+            return None
+
+        slot = len(self._keys)
+        offset = HEADER.size + slot * KEY_SIZE
+        self._mmap[offset:offset + KEY_SIZE] = encoded.ljust(KEY_SIZE, b'\0')
+        self._keys[key] = slot
+        return slot
+
+    @property
+    def written(self) -> int:
+        """Number of records ever appended, including the overwritten ones."""
+        return HEADER.unpack_from(self._mmap)[4]
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def append(self, timestamp: float, values: typing.Dict[str, float]):
+        """Appends a record, the values of keys not matching a slot are dropped."""
+
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            record = [math.nan] * (self.slots + 1)
+            record[0] = float(timestamp)
+            for key, value in values.items():
+                slot = self._get_slot(key)
+                if slot is not None:
+                    record[slot + 1] = float(value)
+
+            written = self.written
+            self._record.pack_into(self._mmap, self._data_offset + (written % self.capacity) * self._record.size, *record)
+            # the counter is updated last, so readers never see a partially written record
+            struct.pack_into('<Q', self._mmap, HEADER.size - 8, written + 1)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def tail(self, key: str, count: typing.Optional[int] = None) -> typing.List[float]:
+        """Returns the values of `key` of the last `count` records, oldest first, skipping missing values."""
+
+        slot = self._keys.get(key)
+        if slot is None:
+            self._read_keys()
+            slot = self._keys.get(key)
+            if slot is None:
+                return []
+
+        written = self.written
+        count = len(self) if count is None else max(0, min(int(count), len(self)))
+        values = []
+        for index in range(written - count, written):
+            offset = self._data_offset + (index % self.capacity) * self._record.size + (slot + 1) * 8
+            value = DOUBLE.unpack_from(self._mmap, offset)[0]
+            if not math.isnan(value):
+                values.append(value)
+        return values
+
+    def timestamps(self, count: typing.Optional[int] = None) -> typing.List[float]:
+        """Returns the times of the last `count` records, oldest first."""
+
+        written = self.written
+        count = len(self) if count is None else max(0, min(int(count), len(self)))
+        return [
+            DOUBLE.unpack_from(self._mmap, self._data_offset + (index % self.capacity) * self._record.size)[0]
+            for index in range(written - count, written)
+        ]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if getattr(self, '_fd', None) is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class History(object):
+    """History of one check as seen by the expects, opening its file on first use."""
+
+    log = logging.getLogger('HISTORY')
+
+    def __init__(self, path: str, capacity: int = 4096, slots: int = 64, keys: typing.Sequence[str] = ('*',)):
+        self.path = path
+        self.capacity = capacity
+        self.slots = slots
+        self.keys = keys  # fnmatch patterns of the recorded result keys
+        self._file = None
+
+    def get_file(self) -> HistoryFile:
+        if self._file is None:
+            self._file = HistoryFile(self.path, self.capacity, self.slots)
+        return self._file
+
+    def record(self, timestamp: float, results: typing.Dict[str, typing.Any]):
+        """Appends the numeric results and success flags matching the key patterns."""
+
+        values = {
+            key: float(value) for key, value in dict.items(results)
+            if (stats.is_numeric(value) or isinstance(value, bool))
+            and any(fnmatch.fnmatchcase(key, pattern) for pattern in self.keys)
+        }
+        self.get_file().append(timestamp, values)
+
+    def history(self, key: str, count: typing.Optional[int] = None) -> typing.List[float]:
+        """Returns the last `count` recorded values of `key`, oldest first."""
+        return self.get_file().tail(key, count)
+
+    def baseline_ratio(self, key: str, value: typing.Optional[float], count: int = 20) -> float:
+        """Returns the ratio of `value` to the median of the last `count` recorded values.
+
+        The ratio is 1.0 if there is no history of `key` yet.
+        """
+
+        values = self.history(key, count)
+        if value is None or not values:
+            return 1.0
+
+        baseline = stats.p50(values)
+        if baseline == 0:
+            return 1.0 if value == 0 else math.inf
+        return value / baseline
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
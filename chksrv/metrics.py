@@ -0,0 +1,245 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - OpenMetrics exposition of the results of resident checks.
+"""
+
+import typing
+import logging
+
+import asyncio
+import bisect
+import math
+import time
+
+from chksrv.runner import Runner
+from chksrv import stats
+
+
+CONTENT_TYPE_OPENMETRICS = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+CONTENT_TYPE_TEXT = 'text/plain; version=0.0.4; charset=utf-8'
+
+# name, type and help of every metric family, in the order they are exposed
+FAMILIES = (
+    ('chksrv_check_success', 'gauge', "Whether the last run of the check succeeded."),
+    ('chksrv_check_runs', 'counter', "Number of completed runs of the check."),
+    ('chksrv_check_last_run_timestamp_seconds', 'gauge', "Unix time the last run of the check completed."),
+    ('chksrv_expect_success', 'gauge', "Whether the expect succeeded in the last run of the check."),
+    ('chksrv_time_seconds', 'gauge', "Result of the last run of the check, for every *.time.perf result key."),
+    ('chksrv_time_histogram_seconds', 'histogram', "Distribution of every *.time.perf result key over all runs of the check."),
+)
+
+# suffix of the result keys exposed as latency metrics
+TIME_SUFFIX = '.time.perf'
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels: typing.Dict[str, str]) -> str:
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels.items()) + '}'
+
+
+def format_value(value: float) -> str:
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class Histogram(object):
+    """Cumulative histogram of the observations of one result key."""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets: typing.Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def render(self, name: str, labels: typing.Dict[str, str]) -> typing.List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{format_labels({**labels, 'le': format_value(float(bound))})} {cumulative}")
+        lines.append(f"{name}_bucket{format_labels({**labels, 'le': '+Inf'})} {self.count}")
+        lines.append(f"{name}_count{format_labels(labels)} {self.count}")
+        lines.append(f"{name}_sum{format_labels(labels)} {format_value(self.sum)}")
+        return lines
+
+
+class MetricsRegistry(object):
+    """Keeps the metrics of all checks as pre-rendered text fragments.
+
+    Every completed run re-renders only the fragments of its check, a scrape joins the
+    fragments and caches the body until the next run completes.
+    """
+
+    log = logging.getLogger('METRICS')
+
+    def __init__(self, buckets: typing.Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._fragments = {name: {} for name, _, _ in FAMILIES}  # family -> check name -> rendered lines
+        self._histograms = {}  # check name -> result key -> Histogram
+        self._runs = {}  # check name -> number of runs
+        self._bodies = {}  # OpenMetrics format or not -> rendered body
+
+    def update(self, name: str, runner: Runner):
+        """Records the results of a completed run of the check `name`."""
+
+        labels = {'check': name}
+        runs = self._runs[name] = self._runs.get(name, 0) + 1
+        histograms = self._histograms.setdefault(name, {})
+
+        # only the keys already computed, lazy results are not forced
+        times = sorted(
+            (key, value) for key, value in dict.items(runner.results)
+            if key.endswith(TIME_SUFFIX) and stats.is_numeric(value)
+        )
+        for key, value in times:
+            if key not in histograms:
+                histograms[key] = Histogram(self.buckets)
+            histograms[key].observe(value)
+
+        fragments = {
+            'chksrv_check_success': [f"chksrv_check_success{format_labels(labels)} {int(runner.success is True)}"],
+            'chksrv_check_runs': [f"chksrv_check_runs_total{format_labels(labels)} {runs}"],
+            'chksrv_check_last_run_timestamp_seconds': [
+                f"chksrv_check_last_run_timestamp_seconds{format_labels(labels)} {format_value(time.time())}"
+            ],
+            'chksrv_expect_success': [
+                f"chksrv_expect_success{format_labels({**labels, 'expect': expect})} {int(bool(result))}"
+                for expect, result in zip(runner.expects, runner.expect_results or [])
+            ],
+            'chksrv_time_seconds': [
+                f"chksrv_time_seconds{format_labels({**labels, 'key': key})} {format_value(value)}"
+                for key, value in times
+            ],
+            'chksrv_time_histogram_seconds': [
+                line
+                for key, histogram in sorted(histograms.items())
+                for line in histogram.render('chksrv_time_histogram_seconds', {**labels, 'key': key})
+            ],
+        }
+
+        for family, lines in fragments.items():
+            self._fragments[family][name] = ''.join(line + '\n' for line in lines)
+        self._bodies = {}
+
+    def render(self, openmetrics: bool = True) -> str:
+        """Returns the exposition of all metrics in the OpenMetrics or the Prometheus text format.
+
+        In the Prometheus text format (version 0.0.4) the TYPE and HELP lines of a counter name
+        its sample, including the _total suffix, and there is no EOF marker.
+        """
+
+        body = self._bodies.get(openmetrics)
+        if body is None:
+            parts = []
+            for family, type_, help_ in FAMILIES:
+                name = family if openmetrics or type_ != 'counter' else f'{family}_total'
+                parts.append(f"# TYPE {name} {type_}\n# HELP {name} {help_}\n")
+                parts.extend(self._fragments[family].values())
+            if openmetrics:
+                parts.append('# EOF\n')
+            body = self._bodies[openmetrics] = ''.join(parts)
+            self.log.debug(f"Rendered {len(body)} bytes of metrics")
+
+        return body
+
+
+class MetricsServer(object):
+    """Minimal HTTP server exposing a MetricsRegistry on GET /metrics."""
+
+    log = logging.getLogger('METRICS')
+
+    def __init__(self, registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9120):
+        self.registry = registry
+        self.host = host
+        self.port = int(port)
+        self._server = None
+
+    async def start_async(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.log.info(f"Serving metrics on {self.host}:{self.port}")
+
+    async def close_async(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(self._read_request(reader), 10)
+            if request is None:
+                return
+
+            method, path, headers = request
+            if method not in ('GET', 'HEAD'):
+                status, content_type, body = '405 Method Not Allowed', 'text/plain; charset=utf-8', "Method not allowed\n"
+            elif path.split('?', 1)[0] not in ('/', '/metrics'):
+                status, content_type, body = '404 Not Found', 'text/plain; charset=utf-8', "Not found\n"
+            elif 'application/openmetrics-text' in headers.get('accept', ''):
+                status, content_type, body = '200 OK', CONTENT_TYPE_OPENMETRICS, self.registry.render()
+            else:
+                status, content_type, body = '200 OK', CONTENT_TYPE_TEXT, self.registry.render(openmetrics=False)
+
+            data = body.encode('utf-8')
+            writer.write((
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: close\r\n\r\n"
+            ).encode('ascii'))
+            if method != 'HEAD':
+                writer.write(data)
+            await writer.drain()
+
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+            self.log.debug(f"Error while serving metrics: {e}")
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> typing.Optional[typing.Tuple[str, str, typing.Dict[str, str]]]:
+        line = await reader.readline()
+        if not line:
+            return None
+
+        method, path, _ = line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        return method.upper(), path, headers
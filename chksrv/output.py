@@ -0,0 +1,230 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - writers streaming the results of checks in different output formats.
+"""
+
+import typing
+import logging
+
+import sys
+import base64
+import fnmatch
+from datetime import date, time, datetime, timedelta, timezone
+
+from chksrv.runner import Runner
+from chksrv import exceptions
+from chksrv import stats
+
+
+# result keys dropped by --drop-bulky, as fnmatch patterns
+BULKY_KEYS = (
+    'http.resp.body',
+    'ssl.con.cert',
+    'ssl.enum.times',
+    'udp.resp.data',
+    'ping.hosts',
+    'dns.*.records',
+    '*.rtts',
+)
+
+
+def is_bulky(key: str) -> bool:
+    return any(fnmatch.fnmatchcase(key, pattern) for pattern in BULKY_KEYS)
+
+
+def encode_cert(cert: typing.Dict[str, typing.Any], binary: bool = False) -> typing.Dict[str, typing.Any]:
+    """Encodes a certificate as returned by SSLSocket.getpeercert().
+
+    The relative distinguished names of subject and issuer are flattened to a list of
+    [name, value] pairs, all other fields are encoded like any other value.
+    """
+
+    encoded = {}
+    for field, value in cert.items():
+        if field in ('subject', 'issuer'):
+            encoded[field] = [[name, value] for rdn in value for name, value in rdn]
+        else:
+            encoded[field] = encode_value(value, binary=binary)
+    return encoded
+
+
+def encode_value(value: typing.Any, key: typing.Optional[str] = None, binary: bool = False) -> typing.Any:
+    """Converts a result value into the types supported by JSON and MessagePack.
+
+    bytes are kept if `binary` is set and encoded as base64 string otherwise, dates and
+    times are encoded as ISO 8601 strings and durations as fractions of seconds.
+    """
+
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value) if binary else base64.b64encode(value).decode('ascii')
+    elif isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    elif isinstance(value, timedelta):
+        return value.total_seconds()
+    elif isinstance(value, dict):
+        if key is not None and key.endswith('.cert'):
+            return encode_cert(value, binary=binary)
+        return {str(k): encode_value(v, binary=binary) for k, v in value.items()}
+    elif isinstance(value, (list, tuple, set, frozenset, stats.Series)):
+        return [encode_value(v, binary=binary) for v in value]
+    else:
+        return str(value)
+
+
+class ResultWriter(object):
+    """Writes one record per completed check, and per sample if checks are sampled."""
+
+    log = logging.getLogger('OUTPUT')
+    binary = False
+
+    def __init__(self, stream: typing.Optional[typing.IO] = None, drop_bulky: bool = False, status: bool = False):
+        self.stream = stream or sys.stdout
+        self.drop_bulky = drop_bulky
+        self.status = status
+
+    def write_result(self, name: str, runner: Runner):
+        self.write(self.build_record('result', name, runner))
+
+    def write_sample(self, name: str, runner: Runner, sample: int, success: bool):
+        self.write(self.build_record('sample', name, runner, sample, success))
+
+    def write_expiry_index(self, certificates: typing.List[typing.Dict[str, typing.Any]]):
+        """Writes the certificates expiring soonest, as returned by ExpiryIndex.soonest()."""
+        self.write({
+            'type': 'expiry',
+            'time': datetime.now(timezone.utc).isoformat(),
+            'certificates': [encode_value(certificate, binary=self.binary) for certificate in certificates],
+        })
+
+    def sample_callback(self, name: str) -> typing.Callable[[Runner, int, bool], None]:
+        """Returns a callback for Runner, writing the samples of the check `name`."""
+        return lambda runner, sample, success: self.write_sample(name, runner, sample, success)
+
+    def write(self, record: typing.Dict[str, typing.Any]):
+        raise NotImplementedError()
+
+    def close(self):
+        self.stream.flush()
+
+    def get_results(self, runner: Runner) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        # lazy runners did not compute the results not needed by the expects
+        if runner.lazy or not runner.results:
+            return None
+
+        return {
+            key: encode_value(value, key, binary=self.binary)
+            for key, value in runner.results.materialize().items()
+            if not (self.drop_bulky and is_bulky(key))
+        }
+
+    def build_record(self, kind: str, name: str, runner: Runner, sample: typing.Optional[int] = None,
+                     success: typing.Optional[bool] = None) -> typing.Dict[str, typing.Any]:
+        record = {
+            'type': kind,
+            'check': name,
+            'time': datetime.now(timezone.utc).isoformat(),
+        }
+
+        if kind == 'sample':
+            record['sample'] = sample
+            record['success'] = success
+        else:
+            record['success'] = runner.success is True
+            record['expects'] = [
+                {'expect': expect, 'success': bool(result)}
+                for expect, result in zip(runner.expects, runner.expect_results or [])
+            ]
+
+        record['results'] = self.get_results(runner)
+        return record
+
+
+class PprintWriter(ResultWriter):
+    """Human readable output, only the results of the completed checks are printed."""
+
+    def write_result(self, name: str, runner: Runner):
+        if self.status:
+            print(f"{name}: {'OK' if runner.success is True else 'FAILED'}", file=self.stream)
+
+        if not runner.lazy and runner.results:
+            from pprint import pprint
+
+            results = runner.results.materialize()
+            if self.drop_bulky:
+                results = {key: value for key, value in results.items() if not is_bulky(key)}
+            pprint(results, stream=self.stream)
+
+    def write_sample(self, name: str, runner: Runner, sample: int, success: bool):
+        pass
+
+    def write_expiry_index(self, certificates: typing.List[typing.Dict[str, typing.Any]]):
+        print("Certificates expiring soonest:", file=self.stream)
+        for certificate in certificates:
+            print(f"  {certificate['not_after']:%Y-%m-%d %H:%M} UTC  {certificate['days_left']:7.1f} days  "
+                  f"{certificate['fingerprint'][:16]}  {', '.join(certificate['checks'])}", file=self.stream)
+
+
+class JsonLinesWriter(ResultWriter):
+    """One JSON object per line, flushed as soon as it is written."""
+
+    def __init__(self, *args, **kwargs):
+        import json
+
+        super().__init__(*args, **kwargs)
+        self._encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def write(self, record: typing.Dict[str, typing.Any]):
+        self.stream.write(self._encoder.encode(record) + '\n')
+        self.stream.flush()
+
+
+class MsgpackWriter(ResultWriter):
+    """Stream of MessagePack maps, requires the msgpack package."""
+
+    binary = True
+
+    def __init__(self, *args, **kwargs):
+        try:
+            import msgpack
+        except ImportError:
+            raise exceptions.ChksrvConfigException("The msgpack output requires the msgpack package") from None
+
+        super().__init__(*args, **kwargs)
+        self.stream = getattr(self.stream, 'buffer', self.stream)
+        self._packer = msgpack.Packer(use_bin_type=True)
+
+    def write(self, record: typing.Dict[str, typing.Any]):
+        self.stream.write(self._packer.pack(record))
+        self.stream.flush()
+
+
+WRITERS = {
+    'pprint': PprintWriter,
+    'jsonl': JsonLinesWriter,
+    'msgpack': MsgpackWriter,
+}
+
+
+def get_writer(output: str, **kwargs) -> ResultWriter:
+    try:
+        writer_class = WRITERS[output.lower()]
+    except KeyError:
+        raise exceptions.ChksrvConfigException(f"Unknown output format '{output}', possible values: {', '.join(WRITERS)}")
+
+    return writer_class(**kwargs)
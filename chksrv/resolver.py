@@ -0,0 +1,156 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - caching name resolver shared by all socket based checks.
+"""
+
+import typing
+import logging
+
+import time
+import errno
+import socket
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+
+class Resolver(object):
+    """Thread-safe getaddrinfo() cache with TTL and LRU eviction.
+
+    Concurrent lookups of the same name are merged into one call of getaddrinfo().
+    Failed lookups are cached as well, but only for `negative_ttl` seconds.
+    """
+
+    log = logging.getLogger('RESOLVER')
+
+    def __init__(self, max_size: int = 1024, negative_ttl: float = 5):
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self._cache = OrderedDict()  # key -> (expires, addrinfo list or exception)
+        self._pending = {}  # key -> Future of a running lookup
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int, family: int = socket.AF_UNSPEC, type: int = socket.SOCK_STREAM,
+                ttl: float = 60, use_cache: bool = True,
+                timeout: typing.Optional[float] = None) -> typing.Tuple[typing.List[tuple], bool]:
+        """Resolves the host, returns the getaddrinfo() result and whether it came from the cache.
+
+        With `timeout` getaddrinfo() runs in a separate thread and TimeoutError is raised if it
+        takes longer. The lookup still completes in the background and fills the cache.
+        """
+
+        if not use_cache and timeout is None:
+            return socket.getaddrinfo(host, port, family, type), False
+
+        key = (host, port, family, type)
+        if use_cache:
+            cached = self._lookup(key)
+            if cached is not None:
+                return cached, True
+
+        with self._lock:
+            future = self._pending.get(key) if use_cache else None
+            owner = future is None
+            if owner:
+                future = Future()
+                if use_cache:
+                    self._pending[key] = future
+
+        if not owner:
+            self.log.debug(f"Wait for running lookup of {host}")
+            return self._wait(future, host, timeout), True
+
+        if timeout is None:
+            self._getaddrinfo(key, future, ttl, use_cache)
+        else:
+            threading.Thread(target=self._getaddrinfo, args=(key, future, ttl, use_cache), daemon=True).start()
+        return self._wait(future, host, timeout), False
+
+    async def resolve_async(self, host: str, port: int, family: int = socket.AF_UNSPEC, type: int = socket.SOCK_STREAM,
+                            ttl: float = 60, use_cache: bool = True) -> typing.Tuple[typing.List[tuple], bool]:
+        """Asynchronous counterpart of resolve(), cache misses are resolved in the default executor."""
+
+        if use_cache:
+            cached = self._lookup((host, port, family, type))
+            if cached is not None:
+                return cached, True
+
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.resolve(host, port, family, type, ttl=ttl, use_cache=use_cache))
+
+    def _getaddrinfo(self, key, future: Future, ttl: float, use_cache: bool):
+        try:
+            self.log.debug(f"Lookup {key[0]}")
+            infos = socket.getaddrinfo(*key)
+        except OSError as e:
+            if use_cache:
+                self._store(key, e, self.negative_ttl)
+            future.set_exception(e)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            if use_cache:
+                self._store(key, infos, ttl)
+            future.set_result(infos)
+        finally:
+            if use_cache:
+                with self._lock:
+                    del self._pending[key]
+
+    @staticmethod
+    def _wait(future: Future, host: str, timeout: typing.Optional[float]) -> typing.List[tuple]:
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(errno.ETIMEDOUT, f"Timeout while resolving {host}") from None
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _lookup(self, key) -> typing.Optional[typing.List[tuple]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._cache[key]
+                return None
+
+            self._cache.move_to_end(key)
+
+        if isinstance(value, Exception):
+            # a fresh exception, raising the cached one would grow its traceback on every hit
+            raise type(value)(*value.args)
+        return value
+
+    def _store(self, key, value, ttl: float):
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._cache[key] = (time.monotonic() + ttl, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+
+default_resolver = Resolver()
@@ -0,0 +1,94 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - result mapping with lazily computed entries.
+"""
+
+import typing
+
+
+class LazyResults(dict):
+    """dict of check results, whose expensive entries are computed on first access.
+
+    Deferred entries are not visible when iterating the dict, call materialize()
+    before all results are output.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._deferred = {}  # key -> callable returning the value
+        self._deferred_prefixes = {}  # prefix -> callable returning a dict of keys starting with prefix
+
+    def defer(self, key: str, fct: typing.Callable[[], typing.Any]):
+        """Registers `fct` to compute the value of `key` when it is accessed."""
+        super().pop(key, None)
+        self._deferred[key] = fct
+
+    def defer_prefix(self, prefix: str, fct: typing.Callable[[], typing.Dict[str, typing.Any]]):
+        """Registers `fct` to compute all entries starting with `prefix` when one of them is accessed."""
+        self._deferred_prefixes[prefix] = fct
+
+    def __missing__(self, key):
+        if self._materialize_key(key):
+            return super().__getitem__(key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return super().__contains__(key) or self._materialize_key(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, other=(), **kwargs):
+        super().update(other, **kwargs)
+        if isinstance(other, LazyResults):
+            # keep the entries other did not compute yet deferred
+            for key, fct in other._deferred.items():
+                self.defer(key, fct)
+            self._deferred_prefixes.update(other._deferred_prefixes)
+
+    def materialize(self) -> 'LazyResults':
+        """Computes all deferred entries."""
+        for key in list(self._deferred):
+            self._materialize_key(key)
+        for prefix in list(self._deferred_prefixes):
+            self._materialize_prefix(prefix)
+        return self
+
+    def _materialize_key(self, key) -> bool:
+        if not isinstance(key, str):
+            return False
+
+        fct = self._deferred.pop(key, None)
+        if fct is not None:
+            self[key] = fct()
+            return True
+
+        for prefix in self._deferred_prefixes:
+            if key.startswith(prefix):
+                self._materialize_prefix(prefix)
+                return super().__contains__(key)
+
+        return False
+
+    def _materialize_prefix(self, prefix: str):
+        fct = self._deferred_prefixes.pop(prefix)
+        for key, value in fct().items():
+            if not super().__contains__(key):
+                self[key] = value
@@ -20,25 +20,133 @@ chksrv - runner and expect evaluator.
 import typing
 import logging
 
+import ast
+import time
+import random
 from datetime import datetime, timedelta
 
 from chksrv.checks import BaseCheck
+from chksrv.config import OptionDict
 from chksrv import exceptions
+from chksrv import stats
 
 
 EVAL_GLOBALS = {
     'now': datetime.now,
     'timedelta': timedelta,
+    'mean': stats.mean,
+    'percentile': stats.percentile,
+    'p50': stats.p50,
+    'p90': stats.p90,
+    'p99': stats.p99,
 }
 
+# names of the expect locals providing results
+RESULT_NAMES = ('res', 'series', 'chk')
+# expect functions taking a result key as first argument
+KEY_FUNCTIONS = ('history', 'baseline_ratio')
+
+
+def _get_str_constant(node: ast.AST) -> typing.Optional[str]:
+    if isinstance(node, getattr(ast, 'Index', ())):
+        # Python < 3.9 wraps subscripts
+        node = node.value
+
+    value = getattr(node, 'value', getattr(node, 's', None))
+    return value if isinstance(node, (ast.Constant, getattr(ast, 'Str', ast.Constant))) and isinstance(value, str) else None
+
+
+def get_referenced_keys(expression: str) -> typing.Optional[typing.Set[str]]:
+    """Returns the result keys an expect accesses, e.g. `res['tcp.success']` or `res.get('tcp.success')`.
+
+    Returns None if the expect accesses the results in any other way, e.g. by a variable key.
+    """
+
+    tree = ast.parse(expression, mode='eval')
+    keys = set()
+    covered = set()  # ids of the result names used with a constant key
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Subscript):
+            target, key = node.value, _get_str_constant(node.slice)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'get' and node.args:
+            target, key = node.func.value, _get_str_constant(node.args[0])
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in KEY_FUNCTIONS:
+            key = _get_str_constant(node.args[0]) if node.args else None
+            if key is None:
+                return None
+            keys.add(key)
+            continue
+        else:
+            continue
+
+        if isinstance(target, ast.Name) and target.id in ('res', 'series') and key is not None:
+            keys.add(key)
+            covered.add(id(target))
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in RESULT_NAMES and id(node) not in covered:
+            return None
+
+    return keys
+
 
 class Runner(object):
+    """Runs a check, retries it if it failed and evaluates the expects.
+
+    `retries` is the number of additional attempts after a failed one. `timeout` is the
+    overall budget in seconds for all attempts including the backoff between them.
+
+    With `samples` greater than one, the check is run repeatedly, starting a sample every
+    `interval` seconds. Numeric results of all samples are collected in `series`.
+
+    If `lazy` is set, the results are not output as a whole. The check then skips work for
+    results the expects do not reference, and expensive results are only computed on access.
+
+    With `history_path` the numeric results of every run are appended to a history file,
+    which the expects can access using `history()` and `baseline_ratio()`.
+    """
 
     log = logging.getLogger('RUNNER')
+    default_options = {
+        'retry.backoff': 0.5,
+        'retry.factor': 2,
+        'retry.max_backoff': 10,
+        'retry.jitter': 0.1,
+        'history.size': 4096,
+        'history.slots': 64,
+        'history.keys': '*',
+    }
 
-    def __init__(self, check: BaseCheck, expects: typing.List[str], options: typing.Dict[str, typing.Any]):
+    # time the check itself gets to handle its deadline, before an asynchronous run is cancelled
+    DEADLINE_GRACE = 0.5
+
+    def __init__(self, check: BaseCheck, expects: typing.List[str], options: typing.Dict[str, typing.Any],
+                 retries: int = 0, timeout: typing.Optional[float] = None, samples: int = 1, interval: float = 0,
+                 lazy: bool = False, sample_callback: typing.Optional[typing.Callable[['Runner', int, bool], None]] = None,
+                 history_path: typing.Optional[str] = None):
         self.check = check
         self.expects = expects
+        self.options = OptionDict(defaults=self.default_options)
+        self.options.update(options)
+        self.retries = max(0, int(retries))
+        self.timeout = float(timeout) if timeout else None
+        self.samples = max(1, int(samples))
+        self.interval = max(0.0, float(interval))
+        self.series = {}  # result key -> stats.Series of all samples
+        self.lazy = lazy
+        self.sample_callback = sample_callback  # called with runner, sample index and success after every sample
+        self.history = None
+        if history_path:
+            from chksrv.history import History
+
+            self.history = History(
+                history_path,
+                capacity=int(self.options['history.size']),
+                slots=int(self.options['history.slots']),
+                keys=[pattern.strip() for pattern in str(self.options['history.keys']).split(',') if pattern.strip()],
+            )
+        self.wanted_keys = None  # result keys referenced by the expects, None if unknown or not lazy
         self._compiled_expects = None
         self.expect_results = None
         self.expect_success = False
@@ -50,32 +158,231 @@ class Runner(object):
 
     def run(self):
         self.compile()
-        self.run_check()
+        self.series = {}
+        failed = 0
+
+        for sample in range(self.samples):
+            start = time.monotonic()
+            self.run_check()
+            failed += self._add_sample()
+            self._report_sample(sample)
+
+            if sample + 1 < self.samples:
+                time.sleep(max(0.0, start + self.interval - time.monotonic()))
+
+        self._update_sample_results(failed)
+        self.evaluate_expects()
+        self._record_history()
+
+        return self._update_success()
+
+    async def run_async(self):
+        """Asynchronous counterpart of run(), driving the check on the running event loop."""
+        import asyncio
+
+        self.compile()
+        self.series = {}
+        failed = 0
+
+        for sample in range(self.samples):
+            start = time.monotonic()
+            await self.run_check_async()
+            failed += self._add_sample()
+            self._report_sample(sample)
+
+            if sample + 1 < self.samples:
+                await asyncio.sleep(max(0.0, start + self.interval - time.monotonic()))
+
+        self._update_sample_results(failed)
         self.evaluate_expects()
+        self._record_history()
+
+        return self._update_success()
+
+    def _add_sample(self) -> int:
+        """Appends the numeric results of the last run to the series, returns 1 if the run failed."""
+
+        for key, value in self.results.items():
+            if stats.is_numeric(value):
+                self.series.setdefault(key, stats.Series()).append(value)
+
+        return 0 if self._check_succeeded() else 1
+
+    def _report_sample(self, sample: int):
+        if self.sample_callback and self.samples > 1:
+            self.sample_callback(self, sample, self._check_succeeded())
+
+    def _update_sample_results(self, failed: int):
+        if self.samples == 1:
+            return
 
-        check_success = all(filter(lambda item: item[0].endswith('.success'), self.results))
-        self.success = check_success is True and self.expect_success is True
+        # the results of the last sample are kept, extended by the aggregates of all samples
+        for key, series in self.series.items():
+            for name, value in stats.aggregate(series).items():
+                self.results[f'{key}.{name}'] = value
+
+        self.results['samples.count'] = self.samples
+        self.results['samples.failed'] = failed
+        self.results['samples.success'] = failed == 0
+
+    def _check_succeeded(self) -> bool:
+        return all(value is True for key, value in self.results.items() if key.endswith('.success'))
+
+    def _update_success(self):
+        self.success = self._check_succeeded() and self.expect_success is True
         return self.success
 
+    def get_backoff(self, attempt: int) -> float:
+        """Returns the seconds to wait after the given failed attempt (counting from 0)."""
+
+        backoff = float(self.options['retry.backoff']) * float(self.options['retry.factor']) ** attempt
+        backoff = min(backoff, float(self.options['retry.max_backoff']))
+        jitter = float(self.options['retry.jitter'])
+        return max(0.0, backoff * random.uniform(1 - jitter, 1 + jitter))
+
+    def _get_retry_delay(self, attempt: int, deadline: typing.Optional[float], last_time: float) -> typing.Optional[float]:
+        """Returns the backoff before the next attempt or None, if no attempt is left."""
+
+        if self._check_succeeded() or attempt >= self.retries:
+            return None
+
+        delay = self.get_backoff(attempt)
+        if deadline is not None and time.monotonic() + delay + last_time > deadline:
+            # assume the next attempt takes as long as the previous one
+            self.log.info("Remaining time budget does not fit another attempt")
+            return None
+
+        self.log.info("Attempt %d failed, retry in %.3fs", attempt + 1, delay)
+        return delay
+
+    def _finish_attempt(self, attempt: int, start: int, attempt_times: typing.List[float]):
+        end = time.perf_counter_ns()
+        attempt_times.append((end - start) / 1e9)
+        if self.check.hooks:
+            self.check.emit('attempt', attempt, start, end, bool(self.results) and self._check_succeeded())
+
+    def _update_retry_results(self, attempt_times: typing.List[float]):
+        self.results['retry.attempts'] = len(attempt_times)
+        self.results['retry.attempt_times'] = attempt_times
+
+    def _record_history(self):
+        # recorded after the expects are evaluated, so they only see the previous runs
+        if self.history is None:
+            return
+
+        try:
+            self.history.record(time.time(), self.results)
+        except (OSError, exceptions.ChksrvConfigException) as e:
+            self.log.error(f"Cannot record history in {self.history.path}: {e}")
+            self.history = None
+
+    def get_history(self, key: str, count: typing.Optional[int] = None) -> typing.List[float]:
+        """Returns the last `count` recorded values of a result key, oldest first."""
+
+        if self.history is None:
+            return []
+
+        try:
+            return self.history.history(key, count)
+        except (OSError, exceptions.ChksrvConfigException) as e:
+            self.log.error(f"Cannot read history from {self.history.path}: {e}")
+            self.history = None
+            return []
+
+    def get_baseline_ratio(self, key: str, count: int = 20) -> float:
+        """Returns the ratio of the current value of a result key to its median over the last `count` runs."""
+
+        if self.history is None:
+            return 1.0
+
+        try:
+            return self.history.baseline_ratio(key, self.results.get(key), count)
+        except (OSError, exceptions.ChksrvConfigException) as e:
+            self.log.error(f"Cannot read history from {self.history.path}: {e}")
+            self.history = None
+            return 1.0
+
     def compile(self):
-        """compiles the expect handlers."""
+        """compiles the expect handlers and determines the results they need."""
 
-        if self._compiled_expects or not self.expects:
-            # expects already compiled or no expects available
+        if self._compiled_expects is not None:
+            # expects already compiled
             return
 
+        # (source, code) of every expect, code is None if the expect does not compile
         self._compiled_expects = []
-        for src in self.expects:
+        wanted_keys = set()
+        for src in self.expects or []:
             try:
                 self.log.debug(f"Compile expect: {src}")
-                ast = compile(src, '<string>', 'eval', dont_inherit=True, optimize=2)
-                self._compiled_expects.append(ast)
+                code = compile(src, '<string>', 'eval', dont_inherit=True, optimize=2)
+                self._compiled_expects.append((src, code))
 
             except (SyntaxError, ValueError):
                 self.log.exception(f"Cannot compile expect code: {src}")
+                self._compiled_expects.append((src, None))
+                continue
+
+            keys = get_referenced_keys(src)
+            if keys is None:
+                self.log.debug(f"Expect needs all results: {src}")
+                wanted_keys = None
+            elif wanted_keys is not None:
+                wanted_keys.update(keys)
+
+        self.wanted_keys = wanted_keys if self.lazy else None
+        self.check.wanted_keys = self.wanted_keys
+        self.log.debug(f"Results needed by the expects: {self.wanted_keys}")
 
     def run_check(self):
-        self.check.run()
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        attempt_times = []
+
+        for attempt in range(self.retries + 1):
+            self.check.reset()
+            self.check.deadline = deadline
+
+            start = time.perf_counter_ns()
+            try:
+                self.check.run()
+            finally:
+                self._finish_attempt(attempt, start, attempt_times)
+
+            delay = self._get_retry_delay(attempt, deadline, attempt_times[-1])
+            if delay is None:
+                break
+            time.sleep(delay)
+
+        self._update_retry_results(attempt_times)
+
+    async def run_check_async(self):
+        import asyncio
+
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        attempt_times = []
+
+        for attempt in range(self.retries + 1):
+            self.check.reset()
+            self.check.deadline = deadline
+
+            start = time.perf_counter_ns()
+            try:
+                if deadline is None:
+                    await self.check.run_async()
+                else:
+                    await asyncio.wait_for(self.check.run_async(), deadline - time.monotonic() + self.DEADLINE_GRACE)
+            except asyncio.TimeoutError:
+                self.log.error("Check did not finish within its deadline")
+                self.results['success'] = False
+            finally:
+                self._finish_attempt(attempt, start, attempt_times)
+
+            delay = self._get_retry_delay(attempt, deadline, attempt_times[-1])
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+
+        self._update_retry_results(attempt_times)
 
     def evaluate_expects(self):
 
@@ -89,18 +396,25 @@ class Runner(object):
         eval_locals = {
             'res': self.results,
             'chk': self.check,
+            'series': self.series,
+            'history': self.get_history,
+            'baseline_ratio': self.get_baseline_ratio,
         }
 
+        # one result for every expect, an expect which does not compile fails
         self.expect_results = []
-        for expect in self._compiled_expects:
+        for idx, (src, code) in enumerate(self._compiled_expects or []):
+            if code is None:
+                self.expect_results.append(False)
+                continue
+
             try:
-                res = eval(expect, EVAL_GLOBALS, eval_locals)
+                res = eval(code, EVAL_GLOBALS, eval_locals)
                 self.expect_results.append(res)
                 self.log.debug(f"Expect eval result: {res}")
 
                 if not bool(res):
-                    idx = self._compiled_expects.index(expect)
-                    self.log.warn(f"Expect {idx} failed")
+                    self.log.warning(f"Expect {idx} failed: {src}")
 
             except:
                 self.expect_results.append(False)
@@ -0,0 +1,216 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - scheduler running resident checks periodically.
+"""
+
+import typing
+import logging
+
+import asyncio
+import heapq
+import random
+import signal
+
+from chksrv.config import OptionDict
+from chksrv.runner import Runner
+from chksrv import exceptions
+
+
+MISSED_POLICIES = ('skip', 'catchup', 'delay')
+
+
+class ScheduledCheck(object):
+    """A runner together with its schedule.
+
+    The missed deadline policy decides what happens if a run could not start in time,
+    because the previous run of the same check was still in progress:
+
+    - :code:`skip` drops the missed runs and continues with the next slot of the interval
+    - :code:`catchup` starts the missed runs back to back until the schedule is met again
+    - :code:`delay` schedules the next run one interval after the previous run finished
+    """
+
+    default_options = {
+        'schedule.interval': 60,
+        'schedule.jitter': 0,
+        'schedule.missed': 'skip',
+    }
+
+    def __init__(self, name: str, runner: Runner, options: typing.Dict[str, typing.Any] = {}):
+        self.name = name
+        self.runner = runner
+
+        self.options = OptionDict(defaults=self.default_options)
+        self.options.update(options)
+
+        self.interval = float(self.options['schedule.interval'])
+        self.jitter = float(self.options['schedule.jitter'])
+        self.missed_policy = str(self.options['schedule.missed']).lower()
+
+        if self.interval <= 0:
+            raise exceptions.ChksrvConfigException(f"Interval of check {name} must be positive")
+        if self.jitter < 0:
+            raise exceptions.ChksrvConfigException(f"Jitter of check {name} must not be negative")
+        if self.missed_policy not in MISSED_POLICIES:
+            raise exceptions.ChksrvConfigException(f"Unknown missed deadline policy '{self.missed_policy}' of check {name}")
+
+        self.slot = None  # start of the current interval slot, the deadline is the slot plus jitter
+        self.running = False
+        self.runs = 0
+        self.missed_runs = 0
+        self.backlog = 0  # missed runs still to be started by the catchup policy
+
+    def get_deadline(self) -> float:
+        return self.slot + random.uniform(0, self.jitter)
+
+
+class Scheduler(object):
+
+    log = logging.getLogger('SCHEDULER')
+
+    def __init__(self, entries: typing.List[ScheduledCheck], concurrency: int = 32):
+        self.entries = entries
+        self.concurrency = max(1, int(concurrency))
+        self._heap = []
+        self._counter = 0
+        self._wakeup = None
+
+    def run(self, callback: typing.Callable[[str, Runner], None] = None, services: typing.Sequence[typing.Any] = ()):
+        """Runs the checks on their schedule until SIGINT or SIGTERM is received.
+
+        `callback(name, runner)` is called every time a check run completed.
+        `services` are started on the event loop before the first check runs, using their
+        `start_async()` coroutine, and stopped using `close_async()`, e.g. a MetricsServer.
+        """
+
+        async def main():
+            stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(sig, stop.set)
+                except (NotImplementedError, RuntimeError):
+                    pass
+
+            for service in services:
+                await service.start_async()
+            try:
+                await self.run_async(callback, stop)
+            finally:
+                for service in services:
+                    await service.close_async()
+
+        asyncio.run(main())
+
+    async def run_async(self, callback: typing.Callable[[str, Runner], None] = None, stop: asyncio.Event = None):
+        """Runs the checks on the running event loop until `stop` is set."""
+
+        loop = asyncio.get_running_loop()
+        stop = stop or asyncio.Event()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+
+        # wakes up the scheduler if it was stopped or an earlier deadline was pushed
+        self._wakeup = asyncio.Event()
+        stop_watcher = loop.create_task(stop.wait())
+        stop_watcher.add_done_callback(lambda _: self._wakeup.set())
+
+        now = loop.time()
+        for entry in self.entries:
+            entry.slot = now
+            self._push(entry)
+
+        self.log.info(f"Scheduled {len(self.entries)} checks")
+
+        while not stop.is_set():
+            delay = self._heap[0][0] - loop.time() if self._heap else None
+            if delay is None or delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, entry, catchup = heapq.heappop(self._heap)
+
+            if entry.running:
+                if entry.missed_policy == 'catchup':
+                    entry.backlog += 1
+                if not catchup:
+                    entry.missed_runs += 1
+                    self.log.warning(f"Check {entry.name} missed its deadline, previous run still in progress")
+                    if entry.missed_policy != 'delay':
+                        self._advance(entry, loop.time())
+                continue
+
+            entry.running = True
+            task = loop.create_task(self._run_one(semaphore, entry, callback))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+            # runs catching up do not move the schedule, the regular slot is still queued
+            if entry.missed_policy != 'delay' and not catchup:
+                self._advance(entry, loop.time())
+
+        stop_watcher.cancel()
+        if tasks:
+            self.log.info(f"Wait for {len(tasks)} running checks")
+            await asyncio.gather(*tasks)
+
+    def _push(self, entry: ScheduledCheck, catchup: bool = False):
+        """Queues the next run of `entry`, immediately if `catchup` is set."""
+
+        self._counter += 1
+        deadline = asyncio.get_running_loop().time() if catchup else entry.get_deadline()
+        heapq.heappush(self._heap, (deadline, self._counter, entry, catchup))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _advance(self, entry: ScheduledCheck, now: float):
+        entry.slot += entry.interval
+
+        if entry.missed_policy == 'skip' and entry.slot < now:
+            skipped = int((now - entry.slot) // entry.interval) + 1
+            entry.slot += skipped * entry.interval
+            entry.missed_runs += skipped
+            self.log.warning(f"Check {entry.name} skipped {skipped} runs")
+
+        self._push(entry)
+
+    async def _run_one(self, semaphore: asyncio.Semaphore, entry: ScheduledCheck, callback):
+        try:
+            async with semaphore:
+                try:
+                    await entry.runner.run_async()
+                except (Exception, exceptions.ChksrvBaseException):
+                    entry.runner.success = False
+                    self.log.exception(f"Error while running check {entry.name}")
+
+            entry.runs += 1
+            if callback:
+                callback(entry.name, entry.runner)
+
+        finally:
+            entry.running = False
+            if entry.missed_policy == 'delay':
+                entry.slot = asyncio.get_running_loop().time() + entry.interval
+                self._push(entry)
+            elif entry.backlog > 0:
+                entry.backlog -= 1
+                self.log.info(f"Check {entry.name} catches up a missed run, {entry.backlog} more missed")
+                self._push(entry, catchup=True)
@@ -0,0 +1,103 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - series of numeric samples and their aggregates.
+"""
+
+import typing
+
+import math
+from array import array
+
+
+class Series(object):
+    """Numeric samples of one result key, stored as compact array of doubles."""
+
+    __slots__ = ('values', '_sorted')
+
+    def __init__(self, values: typing.Iterable[float] = ()):
+        self.values = array('d', values)
+        self._sorted = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __repr__(self):
+        return f"Series({self.values.tolist()!r})"
+
+    def append(self, value: float):
+        self.values.append(value)
+        self._sorted = None
+
+    def sorted(self) -> typing.List[float]:
+        if self._sorted is None:
+            self._sorted = sorted(self.values)
+        return self._sorted
+
+
+def _sorted_values(values: typing.Iterable[float]) -> typing.List[float]:
+    values = values.sorted() if isinstance(values, Series) else sorted(values)
+    if not values:
+        raise ValueError("Cannot aggregate an empty series")
+    return values
+
+
+def percentile(values: typing.Iterable[float], p: float) -> float:
+    """Returns the p-th percentile, interpolating linearly between the closest ranks."""
+
+    values = _sorted_values(values)
+    rank = (len(values) - 1) * min(max(p, 0), 100) / 100
+    lower, upper = math.floor(rank), math.ceil(rank)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def mean(values: typing.Iterable[float]) -> float:
+    values = _sorted_values(values)
+    return math.fsum(values) / len(values)
+
+
+def p50(values: typing.Iterable[float]) -> float:
+    return percentile(values, 50)
+
+
+def p90(values: typing.Iterable[float]) -> float:
+    return percentile(values, 90)
+
+
+def p99(values: typing.Iterable[float]) -> float:
+    return percentile(values, 99)
+
+
+AGGREGATES = {
+    'min': lambda values: _sorted_values(values)[0],
+    'mean': mean,
+    'p50': p50,
+    'p90': p90,
+    'p99': p99,
+    'max': lambda values: _sorted_values(values)[-1],
+}
+
+
+def aggregate(series: Series) -> typing.Dict[str, float]:
+    """Returns all aggregates of AGGREGATES for a non-empty series."""
+    return {name: fct(series) for name, fct in AGGREGATES.items()}
+
+
+def is_numeric(value: typing.Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
@@ -0,0 +1,112 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - collector writing the events of checks in the Chrome trace event format.
+"""
+
+import typing
+import logging
+
+import os
+import json
+import time
+import weakref
+import threading
+
+from chksrv.checks.base import BaseCheck, CheckHook
+
+
+class ChromeTraceCollector(CheckHook):
+    """Collects phases, attempts and errors of all checks and writes them as Chrome trace.
+
+    Every check gets its own row, named after the check, so concurrently running checks
+    and the gaps between their runs can be seen side by side. The trace is kept in
+    memory until close(), at most `max_events` events are collected.
+    """
+
+    log = logging.getLogger('TRACING')
+
+    def __init__(self, path: str, max_events: int = 1000000):
+        self.path = path
+        self.max_events = max_events
+        # keyed by the check itself, ids of finished checks are reused by later ones
+        self.names = weakref.WeakKeyDictionary()  # check -> name
+        self._events = []
+        self._rows = weakref.WeakKeyDictionary()  # check -> row (tid)
+        self._row_count = 0
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+        self._pid = os.getpid()
+        self._dropped = 0
+
+    def set_name(self, check: BaseCheck, name: str):
+        self.names[check] = name
+
+    def start(self):
+        BaseCheck.add_hook(self)
+
+    def close(self):
+        """Unregisters the collector and writes the trace."""
+
+        BaseCheck.remove_hook(self)
+        if self._dropped:
+            self.log.warning("Dropped %d trace events exceeding the maximum of %d", self._dropped, self.max_events)
+
+        with self._lock:
+            events = list(self._events)
+        with open(self.path, 'w') as fh:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fh, separators=(',', ':'))
+        self.log.info("Wrote %d trace events to %s", len(events), self.path)
+
+    def _get_row(self, check: BaseCheck) -> int:
+        row = self._rows.get(check)
+        if row is None:
+            self._row_count += 1
+            row = self._rows[check] = self._row_count
+            name = self.names.get(check) or f"{type(check).__name__} {row}"
+            self._events.append({'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': row, 'args': {'name': name}})
+        return row
+
+    def _add(self, check: BaseCheck, event: typing.Dict[str, typing.Any]):
+        # the events of the connection of a check are shown in the row of the check
+        while check.parent is not None:
+            check = check.parent
+
+        with self._lock:
+            if len(self._events) >= self.max_events:
+                self._dropped += 1
+                return
+
+            event['pid'] = self._pid
+            event['tid'] = self._get_row(check)
+            self._events.append(event)
+
+    def _ts(self, timestamp: int) -> float:
+        # microseconds since the collector was created
+        return (timestamp - self._origin) / 1000
+
+    def phase_end(self, check: BaseCheck, phase: str, start: int, end: int):
+        self._add(check, {'name': phase, 'cat': 'phase', 'ph': 'X', 'ts': self._ts(start), 'dur': (end - start) / 1000})
+
+    def attempt(self, check: BaseCheck, attempt: int, start: int, end: int, success: bool):
+        self._add(check, {
+            'name': f"attempt {attempt + 1}", 'cat': 'attempt', 'ph': 'X',
+            'ts': self._ts(start), 'dur': (end - start) / 1000, 'args': {'success': success},
+        })
+
+    def error(self, check: BaseCheck, error: typing.Union[BaseException, str], timestamp: int):
+        message = error if isinstance(error, str) else repr(error)
+        self._add(check, {'name': 'error', 'cat': 'error', 'ph': 'i', 's': 't', 'ts': self._ts(timestamp), 'args': {'error': message}})
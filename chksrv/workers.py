@@ -0,0 +1,354 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - pool of worker processes running the checks of an inventory.
+"""
+
+import typing
+import logging
+
+import os
+import asyncio
+import math
+import pickle
+import queue
+import signal
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from chksrv.runner import Runner
+from chksrv.results import LazyResults
+from chksrv.output import is_bulky, encode_value
+from chksrv.expiry import INDEX_KEYS
+from chksrv.metrics import TIME_SUFFIX
+from chksrv import exceptions
+
+
+log = logging.getLogger('WORKERS')
+
+# builds name and runner of a check from its inventory line number and arguments
+RunnerFactory = typing.Callable[[int, typing.List[str]], typing.Tuple[str, Runner]]
+ResultCallback = typing.Callable[[str, 'RunResult'], None]
+SampleCallback = typing.Callable[[str, 'RunResult', int, bool], None]
+
+
+class RunResult(object):
+    """Outcome of a check run in a worker process, standing in for its Runner in the parent.
+
+    Provides the attributes of Runner used by the result writers and the metrics.
+    """
+
+    def __init__(self, runner: Runner):
+        self.expects = runner.expects
+        self.lazy = runner.lazy
+        self.success = False
+        self.expect_results = None
+        self.results = LazyResults()
+
+    def update(self, results: typing.Optional[bytes], success: typing.Optional[bool] = None,
+               expect_results: typing.Optional[typing.List[bool]] = None):
+        self.results = LazyResults(pickle.loads(results) if results is not None else {})
+        if success is not None:
+            self.success = success
+            self.expect_results = expect_results
+
+
+def pack_results(runner: Runner, drop_bulky: bool = False) -> typing.Optional[bytes]:
+    """Pickles the results the parent outputs or indexes, None if there are none."""
+
+    if not runner.results:
+        return None
+    if runner.lazy:
+        # lazy runners do not output their results, only the expiry index and the latency
+        # metrics need some of them, of which only the ones already computed are sent
+        needed = {key: value for key, value in dict.items(runner.results) if key in INDEX_KEYS or key.endswith(TIME_SUFFIX)}
+        return pickle.dumps(needed, pickle.HIGHEST_PROTOCOL) if needed else None
+
+    results = {key: value for key, value in runner.results.materialize().items() if not (drop_bulky and is_bulky(key))}
+    try:
+        return pickle.dumps(results, pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        # e.g. results holding objects of the check
+        return pickle.dumps({key: encode_value(value, key, binary=True) for key, value in results.items()}, pickle.HIGHEST_PROTOCOL)
+
+
+def _report(results: multiprocessing.Queue, index: int, runner: Runner, drop_bulky: bool):
+    expect_results = [bool(result) for result in runner.expect_results or []]
+    results.put(('result', index, runner.success is True, expect_results, pack_results(runner, drop_bulky)))
+
+
+def _set_sample_callback(runner: Runner, index: int, results: multiprocessing.Queue, drop_bulky: bool):
+    runner.sample_callback = lambda r, sample, success: results.put(('sample', index, sample, success, pack_results(r, drop_bulky)))
+
+
+def _start_trace(trace_path: typing.Optional[str], worker: int):
+    """Starts a trace of the checks run by the worker, written to its own file next to `trace_path`."""
+
+    if trace_path is None:
+        return None
+
+    from chksrv.tracing import ChromeTraceCollector
+
+    root, ext = os.path.splitext(trace_path)
+    collector = ChromeTraceCollector(f"{root}.{worker}{ext or '.json'}")
+    collector.start()
+    return collector
+
+
+async def _run_item(factory: RunnerFactory, item: tuple, results: multiprocessing.Queue, drop_bulky: bool, trace):
+    index, lineno, argv = item
+    try:
+        name, runner = factory(lineno, argv)
+    except (Exception, exceptions.ChksrvBaseException):
+        log.exception(f"Cannot build check in line {lineno}")
+        results.put(('result', index, False, [], None))
+        return
+
+    if trace:
+        trace.set_name(runner.check, name)
+    _set_sample_callback(runner, index, results, drop_bulky)
+    try:
+        await runner.run_async()
+    except (Exception, exceptions.ChksrvBaseException):
+        runner.success = False
+        log.exception(f"Error while running check {name}")
+
+    _report(results, index, runner, drop_bulky)
+
+
+async def _run_batch_worker(factory: RunnerFactory, tasks: multiprocessing.Queue, results: multiprocessing.Queue,
+                            concurrency: int, drop_bulky: bool, trace):
+    loop = asyncio.get_running_loop()
+    # one more thread than checks, which waits for the next task
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency + 1))
+    semaphore = asyncio.Semaphore(concurrency)
+    running = set()
+
+    def done(task):
+        running.discard(task)
+        semaphore.release()
+
+    while True:
+        # only take a task from the queue with a free slot, so idle workers get the remaining ones
+        await semaphore.acquire()
+        item = await loop.run_in_executor(None, tasks.get)
+        if item is None:
+            break
+
+        task = loop.create_task(_run_item(factory, item, results, drop_bulky, trace))
+        running.add(task)
+        task.add_done_callback(done)
+
+    if running:
+        await asyncio.gather(*running)
+
+
+def batch_worker(worker: int, factory: RunnerFactory, tasks: multiprocessing.Queue, results: multiprocessing.Queue,
+                 concurrency: int, drop_bulky: bool, trace_path: typing.Optional[str] = None):
+    # the parent handles ^C and terminates its workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    trace = _start_trace(trace_path, worker)
+    try:
+        asyncio.run(_run_batch_worker(factory, tasks, results, concurrency, drop_bulky, trace))
+    finally:
+        if trace:
+            trace.close()
+
+
+def daemon_worker(worker: int, factory: RunnerFactory, shard: typing.List[tuple], results: multiprocessing.Queue,
+                  concurrency: int, drop_bulky: bool, trace_path: typing.Optional[str] = None):
+    from chksrv.scheduler import Scheduler, ScheduledCheck
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    trace = _start_trace(trace_path, worker)
+    entries = []
+    indices = {}  # id of the runner -> index of the check in the inventory
+    for index, lineno, argv in shard:
+        name, runner = factory(lineno, argv)
+        _set_sample_callback(runner, index, results, drop_bulky)
+        if trace:
+            trace.set_name(runner.check, name)
+        indices[id(runner)] = index
+        entries.append(ScheduledCheck(name, runner, runner.options))
+
+    scheduler = Scheduler(entries, concurrency=concurrency)
+    try:
+        scheduler.run(callback=lambda name, runner: _report(results, indices[id(runner)], runner, drop_bulky))
+    finally:
+        if trace:
+            trace.close()
+
+
+class WorkerPool(object):
+    """Runs the checks of an inventory in worker processes, each with its own event loop.
+
+    `runners` are the checks as built by the parent, which are not run themselves but
+    provide name, expects and options. `inventory` holds line number and arguments of
+    every check, from which `factory` builds the runners within the workers. With
+    `trace_path` every worker writes a Chrome trace to a file named after it and the
+    number of the worker.
+    """
+
+    log = logging.getLogger('WORKERS')
+
+    def __init__(self, runners: typing.List[typing.Tuple[str, Runner]], inventory: typing.List[typing.Tuple[int, typing.List[str]]],
+                 factory: RunnerFactory, workers: int, concurrency: int = 32, drop_bulky: bool = False,
+                 trace_path: typing.Optional[str] = None):
+        self.names = [name for name, _ in runners]
+        self.runs = [RunResult(runner) for _, runner in runners]
+        self.items = [(index, lineno, argv) for index, (lineno, argv) in enumerate(inventory)]
+        self.factory = factory
+        self.workers = max(1, min(int(workers), len(self.items)))
+        # the concurrency applies to all workers together
+        self.concurrency = max(1, math.ceil(int(concurrency) / self.workers))
+        self.drop_bulky = drop_bulky
+        self.trace_path = trace_path
+        self.success = False
+
+        self._context = multiprocessing.get_context()
+        self._results = self._context.Queue()
+        self._processes = []
+
+    def _handle(self, message: tuple, callback: typing.Optional[ResultCallback], sample_callback: typing.Optional[SampleCallback]) -> bool:
+        """Passes a message of a worker to the callbacks, returns True if a check completed."""
+
+        kind, index = message[0], message[1]
+        run = self.runs[index]
+
+        if kind == 'sample':
+            _, _, sample, success, results = message
+            if sample_callback:
+                run.update(results)
+                sample_callback(self.names[index], run, sample, success)
+            return False
+
+        _, _, success, expect_results, results = message
+        run.update(results, success, expect_results)
+        if callback:
+            callback(self.names[index], run)
+        return True
+
+    def _start(self, target, args_list: typing.List[tuple]):
+        for args in args_list:
+            process = self._context.Process(target=target, args=args, daemon=True)
+            process.start()
+            self._processes.append(process)
+        self.log.info(f"Started {len(self._processes)} workers with concurrency {self.concurrency} each")
+
+    def _stop(self, timeout: float = 10):
+        for process in self._processes:
+            process.join(timeout)
+        for process in self._processes:
+            if process.is_alive():
+                self.log.warning(f"Terminate worker {process.pid}")
+                process.terminate()
+                process.join()
+
+    def run_batch(self, callback: typing.Optional[ResultCallback] = None, sample_callback: typing.Optional[SampleCallback] = None) -> bool:
+        """Runs all checks once.
+
+        `callback(name, result)` is called in the parent as soon as a check completed and
+        `sample_callback(name, result, sample, success)` after every sample of a sampled check.
+        """
+
+        tasks = self._context.Queue()
+        for item in self.items:
+            tasks.put(item)
+        for _ in range(self.workers):
+            tasks.put(None)
+
+        self._start(batch_worker, [
+            (worker, self.factory, tasks, self._results, self.concurrency, self.drop_bulky, self.trace_path)
+            for worker in range(self.workers)
+        ])
+
+        pending = len(self.items)
+        try:
+            while pending:
+                try:
+                    message = self._results.get(timeout=1)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in self._processes):
+                        self.log.error(f"All workers exited with {pending} checks not completed")
+                        break
+                    continue
+
+                if self._handle(message, callback, sample_callback):
+                    pending -= 1
+        finally:
+            self._stop()
+
+        self.success = pending == 0 and all(run.success is True for run in self.runs)
+        self.log.info(f"Batch {'succeeded' if self.success else 'failed'}")
+        return self.success
+
+    def run_daemon(self, callback: typing.Optional[ResultCallback] = None, sample_callback: typing.Optional[SampleCallback] = None,
+                   services: typing.Sequence[typing.Any] = ()):
+        """Runs the checks on their schedule, sharded across the workers, until SIGINT or SIGTERM is received.
+
+        The callbacks are called like in run_batch(), `services` are started on the event
+        loop of the parent, see Scheduler.run().
+        """
+
+        shards = [self.items[worker::self.workers] for worker in range(self.workers)]
+        self._start(daemon_worker, [
+            (worker, self.factory, shard, self._results, self.concurrency, self.drop_bulky, self.trace_path)
+            for worker, shard in enumerate(shards)
+        ])
+
+        async def main():
+            stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(sig, stop.set)
+                except (NotImplementedError, RuntimeError):
+                    pass
+
+            for service in services:
+                await service.start_async()
+            try:
+                while not stop.is_set():
+                    message = await loop.run_in_executor(None, self._get_message, 0.5)
+                    if message is not None:
+                        self._handle(message, callback, sample_callback)
+                    elif not any(process.is_alive() for process in self._processes):
+                        self.log.error("All workers exited")
+                        break
+            finally:
+                # the workers stop their schedulers on SIGTERM and finish the running checks
+                for process in self._processes:
+                    if process.is_alive():
+                        process.terminate()
+                await loop.run_in_executor(None, self._stop)
+                while True:
+                    message = self._get_message(0)
+                    if message is None:
+                        break
+                    self._handle(message, callback, sample_callback)
+
+                for service in services:
+                    await service.close_async()
+
+        asyncio.run(main())
+
+    def _get_message(self, timeout: float) -> typing.Optional[tuple]:
+        try:
+            return self._results.get(timeout=timeout) if timeout else self._results.get_nowait()
+        except queue.Empty:
+            return None
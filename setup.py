@@ -19,8 +19,12 @@ setup(
         'chksrv.checks'
     ],
     install_requires=[
-        'docopt~=0.6'
+        'docopt~=0.6',
+        'importlib-metadata; python_version < "3.8"',
     ],
+    extras_require={
+        'msgpack': ['msgpack>=0.6'],
+    },
     entry_points='''
         [console_scripts]
         chksrv=chksrv.cli:run
@@ -0,0 +1,107 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - fixtures shared by the tests, a TLS server with a generated certificate.
+"""
+
+import os
+import ssl
+import socket
+import threading
+import subprocess
+
+import pytest
+
+
+class StubTlsServer(object):
+    """Completes the TLS handshake on a loopback port and reads until the client closes.
+
+    `handshakes` lists the protocol version and cipher of every completed handshake.
+    """
+
+    def __init__(self, context: ssl.SSLContext):
+        self.context = context
+        self.handshakes = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(64)
+        self.sock.settimeout(0.05)
+        self.port = self.sock.getsockname()[1]
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join(5)
+        self.sock.close()
+
+    def _serve(self):
+        while not self._stop.is_set():
+            try:
+                con, _ = self.sock.accept()
+            except socket.timeout:
+                continue
+            threading.Thread(target=self._handle, args=(con, ), daemon=True).start()
+
+    def _handle(self, con: socket.socket):
+        con.settimeout(5)
+        try:
+            with self.context.wrap_socket(con, server_side=True) as tls:
+                self.handshakes.append((tls.version(), tls.cipher()[0]))
+                while tls.recv(4096):
+                    pass
+        except (OSError, ssl.SSLError):
+            pass
+        finally:
+            con.close()
+
+
+@pytest.fixture(scope='session')
+def tls_files(tmp_path_factory):
+    """Self-signed certificate for localhost and 127.0.0.1, valid for 30 days."""
+
+    directory = tmp_path_factory.mktemp('tls')
+    paths = {'cert': str(directory / 'cert.pem'), 'key': str(directory / 'key.pem')}
+    try:
+        subprocess.run([
+            'openssl', 'req', '-x509', '-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:prime256v1', '-nodes',
+            '-keyout', paths['key'], '-out', paths['cert'], '-days', '30', '-subj', '/CN=localhost',
+            '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1',
+        ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip("The TLS tests require the openssl command line tool")
+
+    assert os.path.exists(paths['cert'])
+    return paths
+
+
+@pytest.fixture
+def tls_context(tls_files):
+    """Server context of tls_server, overridden by tests needing other protocols or ciphers."""
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(tls_files['cert'], tls_files['key'])
+    return context
+
+
+@pytest.fixture
+def tls_server(tls_context):
+    with StubTlsServer(tls_context) as server:
+        yield server
@@ -0,0 +1,253 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - tests of the DNS check against a stub DNS server on the loopback interface.
+"""
+
+import typing
+
+import socket
+import struct
+import asyncio
+import threading
+import selectors
+
+import pytest
+
+from chksrv.checks.dns import (
+    DnsCheck, DnsFormatError, HEADER, FLAG_QR, FLAG_AA, FLAG_TC, FLAG_RD, RECORD_TYPES,
+    decode_name, decode_response, encode_name, encode_query,
+)
+
+
+DOMAIN = 'example.test'
+LONG_TEXT = 'x' * 200
+
+
+def encode_rdata(rtype: str, value) -> bytes:
+    if rtype == 'A':
+        return socket.inet_pton(socket.AF_INET, value)
+    elif rtype == 'AAAA':
+        return socket.inet_pton(socket.AF_INET6, value)
+    elif rtype == 'MX':
+        preference, name = value
+        return struct.pack('!H', preference) + encode_name(name)
+    elif rtype == 'TXT':
+        data = value.encode('ascii')
+        return b''.join(bytes((len(data[i:i + 255]),)) + data[i:i + 255] for i in range(0, len(data), 255))
+    else:
+        return encode_name(value)
+
+
+# (name, type) -> records of (type, ttl, value), the TXT answer exceeds the UDP limit of the stub
+ZONE = {
+    (DOMAIN + '.', 'A'): [('A', 300, '192.0.2.1'), ('A', 300, '192.0.2.2')],
+    (DOMAIN + '.', 'AAAA'): [('AAAA', 60, '2001:db8::1')],
+    (DOMAIN + '.', 'MX'): [('MX', 3600, (10, 'mail.example.test'))],
+    (DOMAIN + '.', 'TXT'): [('TXT', 120, LONG_TEXT)] * 3,
+    ('www.' + DOMAIN + '.', 'A'): [('CNAME', 30, DOMAIN), ('A', 300, '192.0.2.1')],
+}
+
+
+class StubDnsServer(object):
+    """Answers queries from ZONE using UDP and TCP on the same loopback port.
+
+    UDP responses larger than `udp_limit` bytes are truncated to the question with the TC flag.
+    """
+
+    def __init__(self, udp_limit: int = 512):
+        self.udp_limit = udp_limit
+        self.queries = []  # (protocol, type) of all received queries
+        self.udp, self.tcp = self._bind()
+        self.port = self.udp.getsockname()[1]
+        self.tcp.listen(8)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join(5)
+        self.udp.close()
+        self.tcp.close()
+
+    @staticmethod
+    def _bind(attempts: int = 20) -> typing.Tuple[socket.socket, socket.socket]:
+        """Returns UDP and TCP socket bound to the same port, which may be taken for TCP already."""
+
+        for attempt in range(attempts):
+            udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            udp.bind(('127.0.0.1', 0))
+            tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                tcp.bind(('127.0.0.1', udp.getsockname()[1]))
+                return udp, tcp
+            except OSError:
+                udp.close()
+                tcp.close()
+                if attempt + 1 == attempts:
+                    raise
+
+    def answer(self, query: bytes, protocol: str) -> bytes:
+        query_id, flags, qdcount, _, _, _ = HEADER.unpack_from(query)
+        name, offset = decode_name(query, HEADER.size)
+        qtype, = struct.unpack_from('!H', query, offset)
+        question = query[HEADER.size:offset + 4]
+        rtype_name = {value: key for key, value in RECORD_TYPES.items()}[qtype]
+        self.queries.append((protocol, rtype_name))
+
+        answers = b''
+        records = ZONE.get((name, rtype_name), [])
+        for rtype, ttl, value in records:
+            rdata = encode_rdata(rtype, value)
+            # the owner is compressed to a pointer to the question name
+            answers += struct.pack('!HHHIH', 0xC00C, RECORD_TYPES[rtype], 1, ttl, len(rdata)) + rdata
+
+        flags = FLAG_QR | FLAG_AA | (flags & FLAG_RD) | (0 if records else 3)
+        response = HEADER.pack(query_id, flags, 1, len(records), 0, 0) + question + answers
+        if protocol == 'udp' and len(response) > self.udp_limit:
+            response = HEADER.pack(query_id, flags | FLAG_TC, 1, 0, 0, 0) + question
+        return response
+
+    def _serve(self):
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.udp, selectors.EVENT_READ)
+            selector.register(self.tcp, selectors.EVENT_READ)
+            while not self._stop.is_set():
+                for key, _ in selector.select(0.05):
+                    if key.fileobj is self.udp:
+                        query, address = self.udp.recvfrom(65535)
+                        self.udp.sendto(self.answer(query, 'udp'), address)
+                    else:
+                        con, _ = self.tcp.accept()
+                        with con:
+                            con.settimeout(5)
+                            length, = struct.unpack('!H', con.recv(2))
+                            query = b''
+                            while len(query) < length:
+                                query += con.recv(length - len(query))
+                            response = self.answer(query, 'tcp')
+                            con.sendall(struct.pack('!H', len(response)) + response)
+
+
+@pytest.fixture
+def server():
+    with StubDnsServer() as server:
+        yield server
+
+
+def run_check(server: StubDnsServer, domain: str = DOMAIN, **options) -> DnsCheck:
+    options = {'dns.server': '127.0.0.1', 'dns.port': server.port, 'timeout': 5, **options}
+    check = DnsCheck(domain, options=options)
+    check.run()
+    return check
+
+
+def test_udp_query(server):
+    check = run_check(server)
+
+    assert check.results['success'] is True
+    assert check.results['dns.server'] == f'127.0.0.1:{server.port}'
+    assert check.results['dns.rcode'] == 'NOERROR'
+    assert check.results['dns.answers'] == ['192.0.2.1', '192.0.2.2']
+    assert check.results['dns.ttls'] == [300, 300]
+    assert check.results['dns.a.authoritative'] is True
+    assert check.results['dns.a.tcp'] is False
+    assert server.queries == [('udp', 'A')]
+
+
+def test_multiple_types_share_one_socket(server):
+    check = run_check(server, **{'dns.type': 'a,aaaa,mx'})
+
+    assert check.results['success'] is True
+    assert check.results['dns.answers'] == ['192.0.2.1', '192.0.2.2']
+    assert check.results['dns.aaaa.answers'] == ['2001:db8::1']
+    assert check.results['dns.mx.answers'] == ['10 mail.example.test.']
+    assert check.results['dns.mx.ttls'] == [3600]
+    assert sorted(server.queries) == [('udp', 'A'), ('udp', 'AAAA'), ('udp', 'MX')]
+
+
+def test_tcp_fallback_on_truncation(server):
+    check = run_check(server, **{'dns.type': 'TXT'})
+
+    assert check.results['success'] is True
+    assert check.results['dns.txt.tcp'] is True
+    assert check.results['dns.txt.truncated'] is False
+    assert check.results['dns.answers'] == [LONG_TEXT] * 3
+    assert server.queries == [('udp', 'TXT'), ('tcp', 'TXT')]
+
+
+def test_tcp_only(server):
+    check = run_check(server, **{'dns.tcp': True})
+
+    assert check.results['success'] is True
+    assert check.results['dns.a.tcp'] is True
+    assert server.queries == [('tcp', 'A')]
+
+
+def test_cname_chain_and_nxdomain(server):
+    check = run_check(server, 'www.' + DOMAIN)
+    assert check.results['dns.answers'] == ['192.0.2.1']
+    assert [record['type'] for record in check.results['dns.a.records']] == ['CNAME', 'A']
+    assert check.results['dns.a.records'][0]['data'] == DOMAIN + '.'
+
+    check = run_check(server, 'missing.' + DOMAIN)
+    assert check.results['dns.rcode'] == 'NXDOMAIN'
+    assert check.results['dns.answers'] == []
+    # the server answered, the rcode is left to the expects
+    assert check.results['dns.success'] is True
+
+
+def test_unknown_type_is_config_error(server):
+    check = run_check(server, **{'dns.type': 'A,BOGUS'})
+
+    assert check.results['dns.success'] is False
+    assert check.results['success'] is False
+    assert server.queries == []
+
+    check = DnsCheck(DOMAIN, options={'dns.server': '127.0.0.1', 'dns.port': server.port, 'dns.type': 'BOGUS'})
+    asyncio.run(check.run_async())
+    assert check.results['success'] is False
+
+
+def test_timeout_without_server():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as silent:
+        silent.bind(('127.0.0.1', 0))
+        check = DnsCheck(DOMAIN, options={'dns.server': '127.0.0.1', 'dns.port': silent.getsockname()[1], 'timeout': 0.2})
+        check.run()
+
+    assert check.results['dns.success'] is False
+    assert check.results['dns.answers'] == []
+
+
+def test_decode_response(server):
+    query = encode_query(0x1234, DOMAIN, RECORD_TYPES['A'], edns_payload=1232)
+    response = decode_response(server.answer(query, 'tcp'))
+
+    assert response['id'] == 0x1234
+    assert response['response'] is True
+    assert response['questions'] == [(DOMAIN + '.', RECORD_TYPES['A'])]
+    assert [record['data'] for record in response['answers']] == ['192.0.2.1', '192.0.2.2']
+
+
+def test_decode_name_rejects_pointer_loop():
+    message = HEADER.pack(0, 0, 0, 0, 0, 0) + b'\xc0\x0c'
+    with pytest.raises(DnsFormatError):
+        decode_name(message, HEADER.size)
@@ -0,0 +1,134 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - tests of the index of the certificates ordered by expiry.
+"""
+
+import io
+import os
+import sys
+import json
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from chksrv.expiry import FINGERPRINT_KEY, NOT_AFTER_KEY, ExpiryIndex
+from chksrv.output import JsonLinesWriter, PprintWriter
+from chksrv.results import LazyResults
+
+
+NOW = datetime.now(timezone.utc)
+
+
+def cert_results(fingerprint: str, days: float) -> dict:
+    return {FINGERPRINT_KEY: fingerprint, NOT_AFTER_KEY: NOW + timedelta(days=days), 'ssl.success': True}
+
+
+@pytest.fixture
+def index():
+    index = ExpiryIndex()
+    index.add('web-1', cert_results('aa' * 32, 30))
+    index.add('web-2', cert_results('aa' * 32, 30))
+    index.add('mail', cert_results('bb' * 32, 5))
+    index.add('api', cert_results('cc' * 32, 90))
+    return index
+
+
+def test_soonest(index):
+    assert len(index) == 3
+
+    soonest = index.soonest(2)
+    assert [cert['fingerprint'] for cert in soonest] == ['bb' * 32, 'aa' * 32]
+    assert soonest[1]['checks'] == ['web-1', 'web-2']
+    assert soonest[0]['days_left'] == pytest.approx(5, abs=0.01)
+    assert [cert['checks'] for cert in index.soonest()] == [['mail'], ['web-1', 'web-2'], ['api']]
+    assert index.soonest(0) == []
+
+
+def test_checks_without_certificate():
+    index = ExpiryIndex()
+    index.add('tcp', {'tcp.success': True})
+    index.add('ssl failed', {'ssl.success': False, FINGERPRINT_KEY: None})
+
+    # deferred results are not computed for the index
+    results = LazyResults({FINGERPRINT_KEY: 'dd' * 32})
+    results.defer(NOT_AFTER_KEY, lambda: pytest.fail("The expiry was computed"))
+    index.add('lazy', results)
+
+    assert len(index) == 0
+
+
+def test_write_jsonl(index):
+    stream = io.StringIO()
+    JsonLinesWriter(stream).write_expiry_index(index.soonest(1))
+
+    record = json.loads(stream.getvalue())
+    assert record['type'] == 'expiry'
+    assert record['certificates'] == [{
+        'fingerprint': 'bb' * 32,
+        'not_after': (NOW + timedelta(days=5)).isoformat(),
+        'days_left': pytest.approx(5, abs=0.01),
+        'checks': ['mail'],
+    }]
+
+
+def test_write_pprint(index):
+    stream = io.StringIO()
+    PprintWriter(stream).write_expiry_index(index.soonest())
+
+    lines = stream.getvalue().splitlines()
+    assert lines[0] == "Certificates expiring soonest:"
+    assert len(lines) == 4
+    assert lines[1].endswith(f"{'bb' * 8}  mail")
+    assert lines[2].endswith(f"{'aa' * 8}  web-1, web-2")
+
+
+def run_batch(tmp_path, lines, *args) -> subprocess.CompletedProcess:
+    inventory = tmp_path / 'inventory.txt'
+    inventory.write_text(''.join(line + '\n' for line in lines))
+    return subprocess.run(
+        [sys.executable, '-m', 'chksrv', 'batch', '-o', 'jsonl', '-q', '-r', '0', *args, str(inventory)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=60,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+
+
+def test_batch_expiry_index(tmp_path, tls_server, tls_files):
+    ssl_args = f"-p ssl.ca={tls_files['cert']} -p ipv6=false"
+    process = run_batch(tmp_path, [
+        f"ssl {ssl_args} 127.0.0.1 {tls_server.port}",
+        f"ssl {ssl_args} localhost {tls_server.port}",
+        f"tcp -p ipv6=false 127.0.0.1 {tls_server.port}",
+    ], '--expiry-index', '5')
+    assert process.returncode == 0, process.stderr
+
+    records = [json.loads(line) for line in process.stdout.splitlines()]
+    assert [record['type'] for record in records] == ['result'] * 3 + ['expiry']
+    certificate, = records[-1]['certificates']
+    # both SSL checks saw the same certificate, the results arrive in the order the checks finished
+    assert certificate['checks'] == sorted(record['check'] for record in records[:3] if record['check'].startswith('ssl'))
+    assert len(certificate['checks']) == 2
+    assert 29 < certificate['days_left'] <= 30
+    assert len(certificate['fingerprint']) == 64
+
+
+def test_batch_invalid_expiry_index(tmp_path):
+    process = run_batch(tmp_path, ["tcp 127.0.0.1 1"], '--expiry-index', 'many')
+
+    assert process.returncode == 2
+    assert "Invalid number of certificates 'many'" in process.stderr
+    assert process.stdout == ''
@@ -0,0 +1,124 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - tests of the history files and the history functions of the expects.
+"""
+
+import os
+import math
+
+import pytest
+
+from chksrv import exceptions
+from chksrv.checks import BaseCheck
+from chksrv.history import History, HistoryFile, get_history_path
+from chksrv.runner import Runner
+
+
+class SequenceCheck(BaseCheck):
+    """Reports the next results of `runs` on every run."""
+
+    def __init__(self, runs, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.runs = iter(runs)
+
+    def run(self):
+        self.results.update(next(self.runs))
+
+
+def test_history_path(tmp_path):
+    path = get_history_path(str(tmp_path), 'https://example.test/a b')
+    assert os.path.dirname(path) == str(tmp_path)
+    assert os.path.basename(path).startswith('https_example.test_a_b-')
+    # names only differing in replaced characters get different files
+    assert path != get_history_path(str(tmp_path), 'https://example.test/a_b')
+
+
+def test_ring_buffer(tmp_path):
+    path = str(tmp_path / 'check.hist')
+    history = HistoryFile(path, capacity=3, slots=2)
+    for index in range(5):
+        history.append(1000 + index, {'a': index, 'b': -index} if index != 3 else {'a': index})
+
+    assert history.written == 5
+    assert len(history) == 3
+    assert history.timestamps() == [1002, 1003, 1004]
+    assert history.tail('a') == [2, 3, 4]
+    # missing values are skipped
+    assert history.tail('b') == [-2, -4]
+    assert history.tail('a', 2) == [3, 4]
+    assert history.tail('unknown') == []
+    size = os.path.getsize(path)
+    history.close()
+
+    # the file keeps its size and is shared by the next process
+    history = HistoryFile(path, capacity=100, slots=10)
+    assert (history.capacity, history.slots) == (3, 2)
+    assert history.tail('a') == [2, 3, 4]
+    history.append(1005, {'c': 1.0})
+    assert history.tail('c') == []
+    history.close()
+    assert os.path.getsize(path) == size
+
+
+def test_invalid_file(tmp_path):
+    path = tmp_path / 'invalid.hist'
+    path.write_bytes(b'no history')
+
+    with pytest.raises(exceptions.ChksrvConfigException):
+        HistoryFile(str(path))
+
+
+def test_record_and_baseline(tmp_path):
+    history = History(str(tmp_path / 'check.hist'), keys=['*.time.perf', '*.success'])
+    for value in (1.0, 2.0, 3.0):
+        history.record(1000, {'tcp.con.time.perf': value, 'tcp.success': True, 'tcp.address': '::1', 'tcp.port': 80})
+
+    assert history.history('tcp.con.time.perf') == [1.0, 2.0, 3.0]
+    assert history.history('tcp.success') == [1.0, 1.0, 1.0]
+    assert history.history('tcp.port') == []
+    assert history.baseline_ratio('tcp.con.time.perf', 4.0) == 2.0
+    assert history.baseline_ratio('tcp.con.time.perf', None) == 1.0
+    assert history.baseline_ratio('unknown', 4.0) == 1.0
+    history.close()
+
+
+def test_zero_baseline(tmp_path):
+    history = History(str(tmp_path / 'check.hist'))
+    history.record(1000, {'udp.loss': 0.0})
+
+    assert history.baseline_ratio('udp.loss', 0.0) == 1.0
+    assert math.isinf(history.baseline_ratio('udp.loss', 0.5))
+    history.close()
+
+
+def test_runner_expects_see_previous_runs(tmp_path):
+    path = str(tmp_path / 'check.hist')
+    expects = ["len(history('tcp.con.time.perf')) < 2", "baseline_ratio('tcp.con.time.perf') < 3"]
+    runs = [{'tcp.success': True, 'tcp.con.time.perf': value} for value in (0.1, 0.1, 0.5)]
+    check = SequenceCheck(runs)
+
+    outcomes = []
+    for _ in runs:
+        runner = Runner(check, expects, {}, history_path=path)
+        runner.run()
+        outcomes.append(runner.expect_results)
+        runner.history.close()
+
+    assert outcomes == [[True, True], [True, True], [False, False]]
+    history = HistoryFile(path)
+    assert history.tail('tcp.con.time.perf') == [0.1, 0.1, 0.5]
+    history.close()
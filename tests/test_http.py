@@ -0,0 +1,248 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - tests of the HTTP check against a keep-alive HTTP server on the loopback interface.
+"""
+
+import socket
+import asyncio
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from chksrv.checks.http import BodyProcessor, HttpCheck
+from chksrv.runner import Runner
+
+
+BODY = b'hello world\n' * 100
+
+
+class StubHttpServer(ThreadingHTTPServer):
+    """Answers every GET with BODY, keeping the connections alive.
+
+    `connections` lists the accepted connections, which `close_connections()` shuts down
+    to simulate a server closing idle connections.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        self.connections = []
+        super().__init__(('127.0.0.1', 0), StubHttpHandler)
+        self.port = self.server_address[1]
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.05, ), daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.close_connections()
+        self.server_close()
+        self._thread.join(5)
+
+    def close_connections(self):
+        for con in self.connections:
+            try:
+                con.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def get_url(self) -> str:
+        return f'http://127.0.0.1:{self.port}/'
+
+
+class StubHttpHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections.append(self.connection)
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    with StubHttpServer() as server:
+        yield server
+
+
+def make_check(server: StubHttpServer, **options) -> HttpCheck:
+    return HttpCheck(server.get_url(), options={'ipv6': False, 'timeout': 5, 'http.keep_alive': True, **options})
+
+
+def run_check(server: StubHttpServer, **options) -> HttpCheck:
+    check = make_check(server, **options)
+    check.run()
+    return check
+
+
+def test_pooled_connection_is_reused(server):
+    first = run_check(server)
+    second = run_check(server)
+
+    assert first.results['success'] is True
+    assert first.results['http.con.reused'] is False
+    assert second.results['success'] is True
+    assert second.results['http.con.reused'] is True
+    assert second.results['http.resp.status'] == 200
+    assert len(server.connections) == 1
+
+    # the connection results are the ones of the check which established the connection
+    assert second.results['tcp.con.time.perf'] == first.results['tcp.con.time.perf']
+    assert second.results['tcp.resolve.time.perf'] == first.results['tcp.resolve.time.perf']
+    assert not any(key.startswith('timing.tcp') for key in second.results)
+
+
+def test_pooled_connection_is_reused_async(server):
+    async def run_checks():
+        results = []
+        for _ in range(2):
+            check = make_check(server)
+            await check.run_async()
+            results.append(check.results)
+        return results
+
+    first, second = asyncio.run(run_checks())
+
+    assert first['http.con.reused'] is False
+    assert second['success'] is True
+    assert second['http.con.reused'] is True
+    assert second['tcp.con.time.perf'] == first['tcp.con.time.perf']
+    assert len(server.connections) == 1
+
+
+def test_stale_connection_is_replaced(server):
+    run_check(server)
+    server.close_connections()
+    check = run_check(server)
+
+    assert check.results['success'] is True
+    assert check.results['http.con.reused'] is False
+    assert len(server.connections) == 2
+
+
+def test_idle_timeout(server):
+    run_check(server)
+    check = run_check(server, **{'http.pool.idle_timeout': 0})
+
+    assert check.results['http.con.reused'] is False
+    assert len(server.connections) == 2
+
+
+def test_without_keep_alive(server):
+    run_check(server, **{'http.keep_alive': False})
+    check = run_check(server, **{'http.keep_alive': False})
+
+    assert check.results['http.con.reused'] is False
+    assert len(server.connections) == 2
+
+
+def test_samples_with_connection_expect(server):
+    runner = Runner(make_check(server), ["res['tcp.con.time.perf'] > 0", "res['http.con.reused']"], {}, samples=3)
+
+    assert runner.run() is True
+    assert runner.expect_results == [True, True]
+    assert runner.results['samples.failed'] == 0
+    assert len(runner.series['tcp.con.time.perf']) == 3
+    assert len(server.connections) == 1
+
+
+def feed(processor: BodyProcessor, data: bytes, blocksize: int) -> BodyProcessor:
+    """Feeds data the way the check does, in chunks of at most the requested size."""
+
+    offset = 0
+    while True:
+        size = processor.get_read_size(blocksize)
+        if not size:
+            return processor
+        processor.feed(data[offset:offset + size])
+        offset += size
+
+
+def test_body_processor_complete():
+    processor = feed(BodyProcessor(), BODY, 64)
+
+    assert processor.complete is True
+    assert processor.exceeded is False
+    assert processor.length == len(BODY)
+    assert bytes(processor.body) == BODY
+    assert processor.digest.hexdigest() == hashlib.sha256(BODY).hexdigest()
+    assert processor.matches is None
+
+
+@pytest.mark.parametrize('max_bytes, exceeded', [(len(BODY) - 1, True), (len(BODY), False)])
+def test_body_processor_max_bytes(max_bytes, exceeded):
+    processor = feed(BodyProcessor(max_bytes=max_bytes, store=False, digest=False), BODY, 64)
+
+    assert processor.exceeded is exceeded
+    assert processor.complete is not exceeded
+    assert processor.length == max_bytes
+    assert processor.body == b''
+    assert processor.digest is None
+
+
+def test_body_processor_matches_across_chunks():
+    data = b'x' * 100 + b'needle' + b'y' * 100
+    # the chunk boundary falls into the middle of the patterns
+    processor = feed(BodyProcessor(contains='needle', regex=r'ne+dle'), data, 103)
+
+    assert processor.matches is True
+    # reading stopped as soon as all patterns were found
+    assert processor.complete is False
+    assert processor.length == 206
+
+
+def test_body_processor_regex_window():
+    data = b'start' + b'x' * 50 + b'end'
+    # the window of previous data is too small for the match spanning the chunks
+    processor = feed(BodyProcessor(regex=r'start.*end', window=8), data, 10)
+    assert processor.matches is False
+    assert processor.complete is True
+
+    processor = feed(BodyProcessor(regex=r'start.*end', window=64), data, 10)
+    assert processor.matches is True
+
+
+def test_body_options(server):
+    check = run_check(server, **{'http.body.max_bytes': 100, 'http.body.contains': 'world', 'http.body.regex': 'hel+o'})
+
+    assert check.results['success'] is True
+    assert check.results['http.resp.body_matches'] is True
+    assert check.results['http.resp.body_exceeded'] is True
+    assert check.results['http.resp.body_complete'] is False
+    assert check.results['http.resp.body'] == BODY[:100]
+    assert check.results['http.resp.body_length'] == 100
+
+
+def test_invalid_body_regex(server):
+    check = run_check(server, **{'http.body.regex': '('})
+
+    assert check.results['http.success'] is False
+    assert check.results['success'] is False
+    assert server.connections == []
@@ -0,0 +1,248 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - tests of the UDP and ICMP checks against the loopback interface.
+"""
+
+import errno
+import socket
+import threading
+
+import pytest
+
+from chksrv.checks import ip
+from chksrv.checks.ip import IcmpPingCheck, UdpCheck
+
+
+class StubUdpServer(object):
+    """Echoes datagrams on a loopback port, `respond(index, data)` decides the response.
+
+    The response is sent unless `respond` returns None, `index` counts the received datagrams.
+    """
+
+    def __init__(self, respond=lambda index, data: data):
+        self.respond = respond
+        self.received = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.05)
+        self.port = self.sock.getsockname()[1]
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join(5)
+        self.sock.close()
+
+    def _serve(self):
+        while not self._stop.is_set():
+            try:
+                data, address = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+
+            response = self.respond(len(self.received), data)
+            self.received.append(data)
+            if response is not None:
+                self.sock.sendto(response, address)
+
+
+def run_udp(port: int, **options) -> UdpCheck:
+    check = UdpCheck('127.0.0.1', port, options={'ipv6': False, 'timeout': 5, 'udp.timeout': 0.2, **options})
+    check.run()
+    return check
+
+
+def test_udp_echo():
+    with StubUdpServer() as server:
+        check = run_udp(server.port, **{'udp.payload': 'ping', 'udp.count': 5})
+
+    assert check.results['success'] is True
+    assert check.results['udp.address'] == '127.0.0.1'
+    assert check.results['udp.sent'] == 5
+    assert check.results['udp.received'] == 5
+    assert check.results['udp.retransmits'] == 0
+    assert check.results['udp.loss'] == 0
+    assert check.results['udp.resp.data'] == b'ping'
+    assert len(check.results['udp.rtts']) == 5
+    assert 0 < check.results['udp.rtt.min'] <= check.results['udp.rtt.avg'] <= check.results['udp.rtt.max']
+    assert server.received == [b'ping'] * 5
+
+
+def test_udp_hex_payload():
+    with StubUdpServer() as server:
+        check = run_udp(server.port, **{'udp.payload_hex': '00ff10'})
+
+    assert check.results['success'] is True
+    assert server.received == [b'\x00\xff\x10']
+
+
+def test_udp_loss():
+    # every other datagram is dropped
+    with StubUdpServer(lambda index, data: data if index % 2 == 0 else None) as server:
+        check = run_udp(server.port, **{'udp.count': 4, 'udp.retransmits': 0})
+
+    assert check.results['udp.sent'] == 4
+    assert check.results['udp.received'] == 2
+    assert check.results['udp.loss'] == 0.5
+    assert len(check.results['udp.rtts']) == 2
+    # a response to any probe is enough for the check to succeed
+    assert check.results['success'] is True
+
+
+@pytest.mark.parametrize('max_loss, success', [(0, False), (0.25, False), (0.5, True), (1, True)])
+def test_udp_loss_threshold(max_loss, success):
+    with StubUdpServer(lambda index, data: data if index % 2 == 0 else None) as server:
+        check = run_udp(server.port, **{'udp.count': 4, 'udp.retransmits': 0, 'udp.loss.max': max_loss})
+
+    assert check.results['udp.loss'] == 0.5
+    assert check.results['success'] is success
+
+
+def test_udp_retransmit():
+    # the first datagram is dropped, its retransmission answered
+    with StubUdpServer(lambda index, data: data if index > 0 else None) as server:
+        check = run_udp(server.port, **{'udp.retransmits': 2})
+
+    assert check.results['success'] is True
+    assert check.results['udp.sent'] == 2
+    assert check.results['udp.retransmits'] == 1
+    assert check.results['udp.received'] == 1
+    assert check.results['udp.loss'] == 0
+    assert len(server.received) == 2
+
+
+def test_udp_no_response():
+    with StubUdpServer(lambda index, data: None) as server:
+        check = run_udp(server.port, **{'udp.count': 2, 'udp.retransmits': 1})
+
+    assert check.results['success'] is False
+    assert check.results['udp.sent'] == 4
+    assert check.results['udp.retransmits'] == 2
+    assert check.results['udp.received'] == 0
+    assert check.results['udp.loss'] == 1
+    assert check.results['udp.rtt.avg'] is None
+
+
+def test_udp_response_not_waited_for():
+    with StubUdpServer(lambda index, data: None) as server:
+        check = run_udp(server.port, **{'udp.count': 3, 'udp.response': False})
+
+    assert check.results['success'] is True
+    assert check.results['udp.sent'] == 3
+    assert check.results['udp.loss'] is None
+
+
+def test_udp_response_regex():
+    with StubUdpServer(lambda index, data: b'nope' if index == 0 else b'pong') as server:
+        check = run_udp(server.port, **{'udp.count': 2, 'udp.retransmits': 0, 'udp.response.regex': '^pong$'})
+
+    assert check.results['udp.received'] == 2
+    assert check.results['udp.resp.unmatched'] == 1
+    assert check.results['udp.resp.data'] == b'pong'
+    assert check.results['udp.loss'] == 0.5
+
+
+def test_udp_closed_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    # the ICMP port unreachable error is reported to the connected socket
+    check = run_udp(port)
+
+    assert check.results['success'] is False
+    assert check.results['udp.error'] is not None
+
+
+@pytest.mark.parametrize('option, value', [
+    ('udp.payload_hex', '0g'), ('udp.response.regex', '('), ('udp.loss.max', 'x'), ('udp.loss.max', 2),
+])
+def test_udp_invalid_parameter(option, value):
+    with StubUdpServer() as server:
+        check = run_udp(server.port, **{option: value})
+
+    assert check.results['success'] is False
+    assert check.results['udp.error'].startswith(option)
+    assert server.received == []
+
+
+@pytest.mark.parametrize('raw', [False, True], ids=['datagram', 'raw'])
+def test_ping_loopback(raw):
+    check = IcmpPingCheck('127.0.0.1', options={
+        'ipv6': False, 'ping.count': 3, 'ping.interval': 0.01, 'ping.timeout': 0.5, 'ping.raw': raw,
+    })
+    check.run()
+    if check.results['ping.raw'] is None:
+        pytest.skip("ICMP sockets are not permitted")
+
+    assert check.results['ping.raw'] is raw
+    assert check.results['success'] is True
+    assert check.results['ping.sent'] == 3
+    assert check.results['ping.received'] == 3
+    assert check.results['ping.loss'] == 0
+    assert check.results['ping.hosts']['127.0.0.1']['received'] == 3
+    assert 0 < check.results['ping.rtt.min'] <= check.results['ping.rtt.max']
+
+
+def test_ping_loss_accounting():
+    # the accounting of the replies, a host not answering on the loopback interface cannot be relied on
+    check = IcmpPingCheck('127.0.0.1,192.0.2.1')
+    check._update_results([
+        {'host': '127.0.0.1', 'family': socket.AF_INET, 'address': '127.0.0.1', 'sent': 4,
+         'rtts': {3: 0.004, 0: 0.001, 1: 0.002}, 'error': None},
+        {'host': '192.0.2.1', 'family': socket.AF_INET, 'address': '192.0.2.1', 'sent': 4, 'rtts': {}, 'error': None},
+    ])
+
+    hosts = check.results['ping.hosts']
+    assert hosts['127.0.0.1']['received'] == 3
+    assert hosts['127.0.0.1']['loss'] == 0.25
+    assert hosts['127.0.0.1']['rtts'] == [0.001, 0.002, 0.004]
+    assert hosts['192.0.2.1']['loss'] == 1
+    assert hosts['192.0.2.1']['rtt_avg'] is None
+    assert check.results['ping.sent'] == 8
+    assert check.results['ping.received'] == 3
+    assert check.results['ping.loss'] == 1 - 3 / 8
+    assert check.results['ping.rtt.min'] == 0.001
+    assert check.results['ping.rtt.max'] == 0.004
+    assert check.results['ping.success'] is False
+
+
+def resolve_timeout(*args, timeout=None, **kwargs):
+    raise TimeoutError(errno.ETIMEDOUT, f"Resolving took longer than {timeout}s")
+
+
+def test_udp_resolve_timeout(monkeypatch):
+    monkeypatch.setattr(ip.default_resolver, 'resolve', resolve_timeout)
+    check = UdpCheck('unresolvable.test', 53, options={'timeout': 0.5})
+    check.run()
+
+    assert check.results['success'] is False
+    assert check.results['udp.error'] == "Resolving took longer than 0.5s"
+
+
+def test_ping_resolve_timeout(monkeypatch):
+    monkeypatch.setattr(ip.default_resolver, 'resolve', resolve_timeout)
+    check = IcmpPingCheck('unresolvable.test', options={'timeout': 0.5})
+    check.run()
+
+    assert check.results['success'] is False
+    assert check.results['ping.hosts']['unresolvable.test']['error'] == "Resolving took longer than 0.5s"
@@ -0,0 +1,145 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - tests of the exposition of the check results as metrics.
+"""
+
+import asyncio
+
+import pytest
+
+from chksrv.checks import BaseCheck
+from chksrv.metrics import CONTENT_TYPE_OPENMETRICS, CONTENT_TYPE_TEXT, Histogram, MetricsRegistry, MetricsServer
+from chksrv.runner import Runner
+
+
+class StaticCheck(BaseCheck):
+
+    def __init__(self, results, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.static_results = results
+
+    def run(self):
+        self.results.update(self.static_results)
+
+
+def run_runner(results, expects=()) -> Runner:
+    runner = Runner(StaticCheck(results), list(expects), {})
+    runner.run()
+    return runner
+
+
+def get_lines(body: str, prefix: str):
+    return [line for line in body.splitlines() if line.startswith(prefix)]
+
+
+@pytest.fixture
+def registry():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    results = {'tcp.success': True, 'tcp.con.time.perf': 0.05, 'tcp.con.time.process': 0.01, 'tcp.address': '::1'}
+    registry.update('local "tcp"', run_runner(results, ["res['tcp.success']"]))
+    registry.update('local "tcp"', run_runner({**results, 'tcp.con.time.perf': 0.5}, ["res['tcp.success']"]))
+    return registry
+
+
+def test_histogram():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+
+    assert histogram.render('h', {'check': 'c'}) == [
+        'h_bucket{check="c",le="0.1"} 2',
+        'h_bucket{check="c",le="1.0"} 3',
+        'h_bucket{check="c",le="+Inf"} 4',
+        'h_count{check="c"} 4',
+        'h_sum{check="c"} 2.65',
+    ]
+
+
+def test_render_openmetrics(registry):
+    body = registry.render()
+    labels = '{check="local \\"tcp\\""}'
+
+    assert body.endswith('# EOF\n')
+    assert '# TYPE chksrv_check_runs counter\n' in body
+    assert get_lines(body, 'chksrv_check_runs') == [f'chksrv_check_runs_total{labels} 2']
+    assert get_lines(body, 'chksrv_check_success') == [f'chksrv_check_success{labels} 1']
+    assert get_lines(body, 'chksrv_expect_success') == [
+        'chksrv_expect_success{check="local \\"tcp\\"",expect="res[\'tcp.success\']"} 1',
+    ]
+    # only the *.time.perf keys of the last run
+    assert get_lines(body, 'chksrv_time_seconds') == [
+        'chksrv_time_seconds{check="local \\"tcp\\"",key="tcp.con.time.perf"} 0.5',
+    ]
+    assert get_lines(body, 'chksrv_time_histogram_seconds_bucket') == [
+        'chksrv_time_histogram_seconds_bucket{check="local \\"tcp\\"",key="tcp.con.time.perf",le="0.1"} 1',
+        'chksrv_time_histogram_seconds_bucket{check="local \\"tcp\\"",key="tcp.con.time.perf",le="1.0"} 2',
+        'chksrv_time_histogram_seconds_bucket{check="local \\"tcp\\"",key="tcp.con.time.perf",le="+Inf"} 2',
+    ]
+
+
+def test_render_text(registry):
+    body = registry.render(openmetrics=False)
+
+    assert '# EOF' not in body
+    # the counter is named by its sample in the text format
+    assert '# TYPE chksrv_check_runs_total counter\n' in body
+    assert '# HELP chksrv_check_runs_total ' in body
+    assert '# TYPE chksrv_time_histogram_seconds histogram\n' in body
+
+
+def test_render_cache(registry):
+    body = registry.render()
+    assert registry.render() is body
+
+    registry.update('other', run_runner({'tcp.success': False}))
+    body = registry.render()
+    assert 'chksrv_check_success{check="other"} 0\n' in body
+    assert 'chksrv_time_seconds{check="other"' not in body
+
+
+def test_server(registry):
+    async def request(accept: str) -> bytes:
+        server = MetricsServer(registry, port=0)
+        await server.start_async()
+        port = server._server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f"GET /metrics HTTP/1.1\r\nHost: localhost\r\nAccept: {accept}\r\n\r\n".encode('ascii'))
+            response = await reader.read()
+            writer.close()
+            return response
+        finally:
+            await server.close_async()
+
+    response = asyncio.run(request('application/openmetrics-text; version=1.0.0'))
+    assert response.startswith(b'HTTP/1.1 200 OK\r\n')
+    assert f'Content-Type: {CONTENT_TYPE_OPENMETRICS}\r\n'.encode('ascii') in response
+    assert response.endswith(registry.render().encode('utf-8'))
+
+    response = asyncio.run(request('text/plain'))
+    assert f'Content-Type: {CONTENT_TYPE_TEXT}\r\n'.encode('ascii') in response
+    assert response.endswith(registry.render(openmetrics=False).encode('utf-8'))
+
+
+def test_expects_keep_their_label():
+    registry = MetricsRegistry()
+    registry.update('local', run_runner({'tcp.success': True}, ["res[", "res['tcp.success']"]))
+
+    assert get_lines(registry.render(), 'chksrv_expect_success') == [
+        'chksrv_expect_success{check="local",expect="res["} 0',
+        'chksrv_expect_success{check="local",expect="res[\'tcp.success\']"} 1',
+    ]
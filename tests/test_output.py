@@ -0,0 +1,128 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - tests of the result writers and the encoding of the result values.
+"""
+
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from chksrv import exceptions
+from chksrv.checks import BaseCheck
+from chksrv.output import JsonLinesWriter, encode_value, get_writer, is_bulky
+from chksrv.runner import Runner
+
+
+class StaticCheck(BaseCheck):
+
+    def __init__(self, results, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.static_results = results
+
+    def run(self):
+        self.results.update(self.static_results)
+
+
+RESULTS = {
+    'tcp.success': True,
+    'tcp.con.time.perf': 0.25,
+    'http.resp.body': b'\x00body',
+    'ssl.con.cert': {'subject': ((('commonName', 'example.test'),),), 'serialNumber': '01'},
+    'ssl.con.cert.not_after': datetime(2030, 1, 2, 3, 4, 5),
+    'ssl.con.cert.days_left': timedelta(days=1, hours=12),
+}
+
+
+def read_records(stream: io.StringIO):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_encode_value():
+    assert encode_value(b'\x00\xff') == 'AP8='
+    assert encode_value(b'\x00\xff', binary=True) == b'\x00\xff'
+    assert encode_value(timedelta(seconds=1.5)) == 1.5
+    assert encode_value(datetime(2030, 1, 2)) == '2030-01-02T00:00:00'
+    assert encode_value({1: (2, {3})}) == {'1': [2, [3]]}
+    assert encode_value(RESULTS['ssl.con.cert'], 'ssl.con.cert') == {
+        'subject': [['commonName', 'example.test']], 'serialNumber': '01',
+    }
+
+
+def test_is_bulky():
+    assert is_bulky('http.resp.body')
+    assert is_bulky('dns.mx.records')
+    assert is_bulky('udp.rtts')
+    assert not is_bulky('http.resp.body_length')
+
+
+def test_jsonl_result_record():
+    stream = io.StringIO()
+    runner = Runner(StaticCheck(RESULTS), ["res['tcp.success']", "res['tcp.con.time.perf'] >", "res['tcp.con.time.perf'] > 1"], {})
+    runner.run()
+    JsonLinesWriter(stream).write_result('local', runner)
+
+    record, = read_records(stream)
+    assert list(record) == ['type', 'check', 'time', 'success', 'expects', 'results']
+    assert record['type'] == 'result'
+    assert record['check'] == 'local'
+    assert datetime.fromisoformat(record['time']).tzinfo is not None
+    assert record['success'] is False
+    # the expect which does not compile keeps its place
+    assert record['expects'] == [
+        {'expect': "res['tcp.success']", 'success': True},
+        {'expect': "res['tcp.con.time.perf'] >", 'success': False},
+        {'expect': "res['tcp.con.time.perf'] > 1", 'success': False},
+    ]
+    assert record['results']['http.resp.body'] == 'AGJvZHk='
+    assert record['results']['ssl.con.cert.not_after'] == '2030-01-02T03:04:05'
+    assert record['results']['ssl.con.cert.days_left'] == 129600.0
+    assert record['results']['retry.attempts'] == 1
+
+
+def test_jsonl_sample_records():
+    stream = io.StringIO()
+    writer = JsonLinesWriter(stream, drop_bulky=True)
+    runner = Runner(StaticCheck(RESULTS), [], {}, samples=2, sample_callback=writer.sample_callback('local'))
+    runner.run()
+    writer.write_result('local', runner)
+
+    records = read_records(stream)
+    assert [(record['type'], record.get('sample')) for record in records] == [('sample', 0), ('sample', 1), ('result', None)]
+    assert list(records[0]) == ['type', 'check', 'time', 'sample', 'success', 'results']
+    assert records[0]['success'] is True
+    assert 'http.resp.body' not in records[0]['results']
+    assert 'ssl.con.cert' not in records[-1]['results']
+    assert records[-1]['results']['samples.count'] == 2
+
+
+def test_lazy_runner_without_results():
+    stream = io.StringIO()
+    runner = Runner(StaticCheck(RESULTS), ["res['tcp.success']"], {}, lazy=True)
+    runner.run()
+    JsonLinesWriter(stream).write_result('local', runner)
+
+    record, = read_records(stream)
+    assert record['success'] is True
+    assert record['results'] is None
+
+
+def test_unknown_writer():
+    assert isinstance(get_writer('JSONL'), JsonLinesWriter)
+    with pytest.raises(exceptions.ChksrvConfigException):
+        get_writer('xml')
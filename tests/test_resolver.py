@@ -0,0 +1,83 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - tests of the caching name resolver.
+"""
+
+import socket
+import time
+
+import pytest
+
+from chksrv.resolver import Resolver
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Replaces getaddrinfo(), returns the list of looked up hosts."""
+
+    calls = []
+
+    def getaddrinfo(host, port, family=0, type=0):
+        calls.append(host)
+        if host == 'slow':
+            time.sleep(0.3)
+        if host.startswith('missing'):
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [(socket.AF_INET, type, 6, '', ('192.0.2.1', port))]
+
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo)
+    return calls
+
+
+def test_positive_cache(lookups):
+    resolver = Resolver()
+    assert resolver.resolve('host', 80)[1] is False
+    infos, cached = resolver.resolve('host', 80)
+
+    assert cached is True
+    assert infos[0][4] == ('192.0.2.1', 80)
+    assert lookups == ['host']
+
+
+def test_negative_cache_raises_fresh_errors(lookups):
+    resolver = Resolver(negative_ttl=60)
+    errors = []
+    for _ in range(3):
+        with pytest.raises(socket.gaierror) as info:
+            resolver.resolve('missing', 80)
+        errors.append(info.value)
+
+    assert lookups == ['missing']
+    assert errors[1] is not errors[2]
+    assert errors[2].errno == socket.EAI_NONAME
+    assert errors[2].strerror == "Name or service not known"
+    # the traceback of a cached error does not grow with every hit
+    depth = 0
+    traceback = errors[2].__traceback__
+    while traceback is not None:
+        depth, traceback = depth + 1, traceback.tb_next
+    assert depth <= 3
+
+
+def test_timeout_fills_cache_in_background(lookups):
+    resolver = Resolver()
+    with pytest.raises(TimeoutError):
+        resolver.resolve('slow', 80, timeout=0.05)
+
+    time.sleep(0.4)
+    assert resolver.resolve('slow', 80, timeout=0.05)[1] is True
+    assert lookups == ['slow']
@@ -0,0 +1,117 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - tests of the lazily computed results and the keys the expects need.
+"""
+
+import pytest
+
+from chksrv.checks import BaseCheck
+from chksrv.results import LazyResults
+from chksrv.runner import Runner, get_referenced_keys
+
+
+class Counter(object):
+    """Callable returning `value`, counting its calls."""
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+def test_deferred_key():
+    fct = Counter(42)
+    results = LazyResults({'a': 1})
+    results.defer('b', fct)
+
+    # deferred entries are hidden from iteration until they are computed
+    assert dict(results) == {'a': 1}
+    assert fct.calls == 0
+    assert results['b'] == 42
+    assert 'b' in results
+    assert results.get('b') == 42
+    assert fct.calls == 1
+    assert results.get('c', 'missing') == 'missing'
+    with pytest.raises(KeyError):
+        results['c']
+
+
+def test_deferred_prefix():
+    fct = Counter({'http.resp.header.server': 'stub', 'http.resp.header.date': 'today'})
+    results = LazyResults()
+    results['http.resp.header.date'] = 'overridden'
+    results.defer_prefix('http.resp.header.', fct)
+
+    assert 'http.resp.header.missing' not in results
+    assert fct.calls == 1
+    assert results['http.resp.header.server'] == 'stub'
+    # entries set directly take precedence over the deferred ones
+    assert results['http.resp.header.date'] == 'overridden'
+    assert fct.calls == 1
+
+
+def test_update_keeps_entries_deferred():
+    fct, prefix_fct = Counter('value'), Counter({'p.x': 1})
+    source = LazyResults({'a': 1})
+    source.defer('b', fct)
+    source.defer_prefix('p.', prefix_fct)
+
+    results = LazyResults()
+    results.update(source)
+    assert fct.calls == prefix_fct.calls == 0
+
+    assert results.materialize() == {'a': 1, 'b': 'value', 'p.x': 1}
+    assert fct.calls == prefix_fct.calls == 1
+
+
+@pytest.mark.parametrize('expression, keys', [
+    ("res['tcp.success'] and res.get('ssl.success')", {'tcp.success', 'ssl.success'}),
+    ("p90(series['tcp.con.time.perf']) < 0.1", {'tcp.con.time.perf'}),
+    ("baseline_ratio('http.resp.time.perf') < 2", {'http.resp.time.perf'}),
+    ("len(res) > 0", None),
+    ("res[key]", None),
+    ("chk.url", None),
+])
+def test_get_referenced_keys(expression, keys):
+    assert get_referenced_keys(expression) == keys
+
+
+class LazyCheck(BaseCheck):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.expensive = Counter('computed')
+        self.wanted = {}
+
+    def run(self):
+        self.wanted = {key: self.wants(key) for key in ('tcp.success', 'tcp.expensive', 'http.resp.body')}
+        self.results['tcp.success'] = True
+        self.results.defer('tcp.expensive', self.expensive)
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_runner_passes_wanted_keys(lazy):
+    check = LazyCheck()
+    runner = Runner(check, ["res['tcp.success']"], {}, lazy=lazy)
+
+    assert runner.run() is True
+    assert check.wanted == {'tcp.success': True, 'tcp.expensive': not lazy, 'http.resp.body': not lazy}
+    assert runner.wanted_keys == ({'tcp.success'} if lazy else None)
+    assert check.expensive.calls == 0
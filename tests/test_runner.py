@@ -0,0 +1,115 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - tests of the runner and the aggregates of sampled results.
+"""
+
+import asyncio
+
+import pytest
+
+from chksrv import stats
+from chksrv.checks import BaseCheck
+from chksrv.runner import Runner
+
+
+class SequenceCheck(BaseCheck):
+    """Reports the next results of `runs` on every run, the last ones are repeated."""
+
+    def __init__(self, runs, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.runs = runs
+        self.count = 0
+
+    def run(self):
+        self.results.update(self.runs[min(self.count, len(self.runs) - 1)])
+        self.count += 1
+
+    async def run_async(self):
+        self.run()
+
+
+def test_percentile_interpolates():
+    values = [4, 1, 3, 2, 5]
+
+    assert stats.percentile(values, 0) == 1
+    assert stats.percentile(values, 50) == 3
+    assert stats.percentile(values, 100) == 5
+    assert stats.percentile(values, 90) == pytest.approx(4.6)
+    assert stats.percentile([1, 2], 25) == pytest.approx(1.25)
+    # out of range percentiles are clamped
+    assert stats.percentile(values, 150) == 5
+    assert stats.p50([7]) == stats.p99([7]) == 7
+
+
+def test_aggregate():
+    series = stats.Series([0.3, 0.1, 0.2])
+
+    assert stats.aggregate(series) == pytest.approx({
+        'min': 0.1, 'mean': 0.2, 'p50': 0.2, 'p90': 0.28, 'p99': 0.298, 'max': 0.3,
+    })
+    # the sorted values are cached until the next value is appended
+    series.append(0.0)
+    assert stats.aggregate(series)['min'] == 0.0
+
+    with pytest.raises(ValueError):
+        stats.mean(stats.Series())
+
+
+def test_is_numeric():
+    assert stats.is_numeric(1) and stats.is_numeric(0.5)
+    assert not stats.is_numeric(True)
+    assert not stats.is_numeric('1')
+    assert not stats.is_numeric(None)
+
+
+def test_samples():
+    runs = [{'success': True, 'tcp.con.time.perf': value, 'tcp.address': '127.0.0.1'} for value in (0.3, 0.1, 0.2)]
+    reported = []
+    runner = Runner(SequenceCheck(runs), ["p90(series['tcp.con.time.perf']) < 0.3"], {}, samples=3,
+                    sample_callback=lambda runner, sample, success: reported.append((sample, success)))
+
+    assert runner.run() is True
+    assert runner.check.count == 3
+    assert reported == [(0, True), (1, True), (2, True)]
+    assert list(runner.series['tcp.con.time.perf']) == [0.3, 0.1, 0.2]
+    assert 'tcp.address' not in runner.series
+    # the results of the last sample are extended by the aggregates
+    assert runner.results['tcp.con.time.perf'] == 0.2
+    assert runner.results['tcp.con.time.perf.p50'] == 0.2
+    assert runner.results['tcp.con.time.perf.max'] == 0.3
+    assert runner.results['samples.count'] == 3
+    assert runner.results['samples.failed'] == 0
+    assert runner.results['samples.success'] is True
+
+
+def test_failed_samples_async():
+    runs = [{'tcp.success': True}, {'tcp.success': False}, {'tcp.success': True}]
+    runner = Runner(SequenceCheck(runs), [], {}, samples=3)
+
+    # a failed sample fails the run, even though the last one succeeded
+    assert asyncio.run(runner.run_async()) is False
+    assert runner.results['tcp.success'] is True
+    assert runner.results['samples.failed'] == 1
+    assert runner.results['samples.success'] is False
+
+
+def test_single_sample_without_aggregates():
+    runner = Runner(SequenceCheck([{'success': True, 'tcp.con.time.perf': 0.1}]), [], {})
+
+    assert runner.run() is True
+    assert 'samples.count' not in runner.results
+    assert 'tcp.con.time.perf.p50' not in runner.results
@@ -0,0 +1,96 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - tests of the SSL check and the enumeration of protocols and ciphers.
+"""
+
+import ssl
+import asyncio
+
+import pytest
+
+from chksrv.checks import SslCheck
+from chksrv.runner import Runner
+
+
+CIPHERS = ['ECDHE-ECDSA-AES128-GCM-SHA256', 'ECDHE-ECDSA-CHACHA20-POLY1305']
+
+
+@pytest.fixture
+def tls_context(tls_files):
+    # the server only accepts TLS 1.2 and 1.3, and two ciphers of TLS 1.2
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(tls_files['cert'], tls_files['key'])
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.maximum_version = ssl.TLSVersion.TLSv1_3
+    context.set_ciphers(':'.join(CIPHERS))
+    return context
+
+
+def make_check(server, tls_files, **options) -> SslCheck:
+    return SslCheck('127.0.0.1', server.port, options={
+        'ipv6': False, 'timeout': 5, 'ssl.ca': tls_files['cert'], 'ssl.verify_mode': 'CERT_REQUIRED', **options,
+    })
+
+
+def test_handshake(tls_server, tls_files):
+    check = make_check(tls_server, tls_files)
+    check.run()
+
+    assert check.results['success'] is True
+    assert check.results['ssl.con.cert.days_left'] == pytest.approx(30, abs=1)
+    assert len(check.results['ssl.con.cert.fingerprint']) == 64
+    assert 'ssl.enum.probes' not in check.results
+
+
+@pytest.mark.parametrize('run_async', [False, True], ids=['sync', 'async'])
+def test_enumerate(tls_server, tls_files, run_async):
+    check = make_check(tls_server, tls_files, **{'ssl.enumerate': True, 'ssl.enumerate.concurrency': 4})
+    if run_async:
+        asyncio.run(check.run_async())
+    else:
+        check.run()
+
+    assert check.results['success'] is True
+    assert check.results['ssl.enum.accepted_protocols'] == ['TLSv1.2', 'TLSv1.3']
+    ciphers = check.results['ssl.enum.accepted_ciphers']
+    assert sorted(cipher for cipher in ciphers if not cipher.startswith('TLS_')) == sorted(CIPHERS)
+    # the suite negotiated by the TLS 1.3 probe
+    assert any(cipher.startswith('TLS_') for cipher in ciphers)
+    assert check.results['ssl.enum.probes'] > len(ciphers)
+    # the handshake times per negotiated combination
+    assert {f'TLSv1.2 {cipher}' for cipher in CIPHERS} <= set(check.results['ssl.enum.times'])
+    assert all(key.startswith(('TLSv1.2 ', 'TLSv1.3 ')) for key in check.results['ssl.enum.times'])
+    assert check.results['ssl.enum.time.perf'] > 0
+
+
+def test_enumerate_selected_protocols(tls_server, tls_files):
+    check = make_check(tls_server, tls_files, **{
+        'ssl.enumerate': True, 'ssl.enumerate.protocols': 'TLSv1.3, TLSv9', 'ssl.enumerate.ciphers': CIPHERS[0],
+    })
+    check.run()
+
+    # no cipher probes without protocols of TLS 1.2 and below, unknown protocols are skipped
+    assert check.results['ssl.enum.probes'] == 1
+    assert check.results['ssl.enum.accepted_protocols'] == ['TLSv1.3']
+
+
+def test_enumerate_skipped_for_unreferenced_results(tls_server, tls_files):
+    check = make_check(tls_server, tls_files, **{'ssl.enumerate': True})
+    runner = Runner(check, ["res['ssl.success']"], {}, lazy=True)
+
+    assert runner.run() is True
+    assert 'ssl.enum.probes' not in runner.results
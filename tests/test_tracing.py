@@ -0,0 +1,109 @@
+# chksrv
+# Copyright (C) 2018  Martin Peters
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+chksrv - tests of the Chrome trace of the check events.
+"""
+
+import json
+import socket
+
+import pytest
+
+from chksrv.checks import BaseCheck, TcpCheck
+from chksrv.runner import Runner
+from chksrv.tracing import ChromeTraceCollector
+
+
+@pytest.fixture
+def listener():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(16)
+        yield sock.getsockname()[1]
+
+
+@pytest.fixture
+def closed_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def collector(tmp_path):
+    collector = ChromeTraceCollector(str(tmp_path / 'trace.json'))
+    collector.start()
+    yield collector
+    BaseCheck.remove_hook(collector)
+
+
+def read_trace(collector: ChromeTraceCollector):
+    collector.close()
+    with open(collector.path) as fh:
+        return json.load(fh)
+
+
+def run_tcp(collector: ChromeTraceCollector, name: str, port: int, **kwargs) -> Runner:
+    runner = Runner(TcpCheck('127.0.0.1', port, options={'ipv6': False, 'timeout': 2}), [],
+                    {'retry.backoff': 0.01}, **kwargs)
+    collector.set_name(runner.check, name)
+    runner.run()
+    return runner
+
+
+def test_rows_and_phases(collector, listener, closed_port):
+    run_tcp(collector, 'open', listener)
+    run_tcp(collector, 'closed', closed_port, retries=1)
+
+    trace = read_trace(collector)
+    assert trace['displayTimeUnit'] == 'ms'
+    events = trace['traceEvents']
+    rows = {event['args']['name']: event['tid'] for event in events if event['ph'] == 'M'}
+    assert set(rows) == {'open', 'closed'}
+    assert rows['open'] != rows['closed']
+
+    def get_events(row: str, category: str):
+        return [event for event in events if event['tid'] == rows[row] and event.get('cat') == category]
+
+    assert {'resolve', 'connect'} <= {event['name'] for event in get_events('open', 'phase')}
+    assert [(event['name'], event['args']['success']) for event in get_events('open', 'attempt')] == [('attempt 1', True)]
+    assert [(event['name'], event['args']['success']) for event in get_events('closed', 'attempt')] == [
+        ('attempt 1', False), ('attempt 2', False),
+    ]
+    assert get_events('closed', 'error')
+    assert all(event['dur'] >= 0 and event['ts'] >= 0 for event in events if event['ph'] == 'X')
+
+
+def test_unnamed_checks_and_limit(collector, listener):
+    collector.max_events = 2
+    run_tcp(collector, 'first', listener)
+    check = TcpCheck('127.0.0.1', listener, options={'ipv6': False})
+    check.record_phase('connect', 0, 1)
+
+    events = read_trace(collector)['traceEvents']
+    assert len(events) == 2
+    assert events[0] == {'name': 'thread_name', 'ph': 'M', 'pid': events[0]['pid'], 'tid': 1, 'args': {'name': 'first'}}
+    # the hook is removed by close()
+    assert collector not in BaseCheck.hooks
+
+
+def test_default_row_name(collector):
+    check = TcpCheck('127.0.0.1', 1)
+    check.emit('error', 'failed', 0)
+
+    events = read_trace(collector)['traceEvents']
+    assert events[0]['args']['name'] == 'TcpCheck 1'
+    assert events[1]['args']['error'] == 'failed'